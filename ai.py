@@ -1,48 +1,446 @@
 from __future__ import annotations
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from typing import Tuple, Optional
-from .game import Game, Player
+from .game import Game, MNKGame, Player
+from .bitboard import BitBoard, FULL, IS_WIN, CELLS, POPCOUNT
+from .book import get_book
 
-# Minimax with alpha-beta pruning. Returns (best_index, score)
+# Minimax (negamax form) with alpha-beta pruning over `BitBoard`, backed by a
+# transposition table that folds the 8 symmetries of the board.
+# best_move returns (best_index, score) with index 1..9 and score from
+# `as_player`'s point of view (+1 win, 0 draw/unknown, -1 loss).
 
-def best_move(game: Game, as_player: Player, depth_limit: Optional[int] = None) -> Tuple[int, int]:
-    assert as_player in ("X", "O")
+# ---- Symmetries ----
+def _sym_perms():
+    maps = (
+        lambda r, c: (r, c), lambda r, c: (c, 2 - r),          # identity, rot90
+        lambda r, c: (2 - r, 2 - c), lambda r, c: (2 - c, r),  # rot180, rot270
+        lambda r, c: (r, 2 - c), lambda r, c: (2 - r, c),      # mirror, flip
+        lambda r, c: (c, r), lambda r, c: (2 - c, 2 - r),      # transposes
+    )
+    perms = []
+    for f in maps:
+        cells = (f(i // 3, i % 3) for i in range(9))
+        perms.append(tuple(3 * r + c for r, c in cells))
+    return tuple(perms)
 
-    def minimax(g: Game, alpha: int, beta: int, depth: int) -> Tuple[Optional[int], int]:
-        if g.terminal() or (depth_limit is not None and depth >= depth_limit):
-            return None, g.score(as_player)
-        if g.turn == as_player:
-            # Maximizing
-            best_idx = None
-            best_val = -10
-            for i in g.moves():
-                idx=i+1
-                ng = g.clone(); ng.play(idx)
-                _, val = minimax(ng, alpha, beta, depth + 1)
-                if val > best_val:
-                    best_val, best_idx = val, idx
-                alpha = max(alpha, val)
-                if beta <= alpha:
-                    break
-            return best_idx, best_val
+SYM_CELL = _sym_perms()            # SYM_CELL[s][i] -> image of cell i under symmetry s
+SYM_CELL_INV = tuple(tuple(p.index(i) for i in range(9)) for p in SYM_CELL)
+SYM_MASK = tuple(
+    tuple(sum(1 << p[i] for i in range(9) if m >> i & 1) for m in range(1 << 9))
+    for p in SYM_CELL
+)
+
+def canonical(x: int, o: int) -> Tuple[int, int]:
+    """Return (key, s): the smallest 18-bit key over all 8 symmetries and the
+    symmetry index that produced it."""
+    best, best_s = -1, 0
+    for s in range(8):
+        t = SYM_MASK[s]
+        k = t[x] << 9 | t[o]
+        if best < 0 or k < best:
+            best, best_s = k, s
+    return best, best_s
+
+# ---- Transposition table ----
+EXACT, LOWER, UPPER = 0, 1, 2
+
+class TranspositionTable:
+    """Bounded position cache with oldest-first eviction.
+
+    Keys are (canonical key, effective depth, side to move); values are
+    (value, flag, best move in the canonical frame or -1).
+    """
+    def __init__(self, max_entries: int = 1 << 16):
+        self.max_entries = max_entries
+        self.data: "OrderedDict[int, Tuple[int, int, int]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: int):
+        e = self.data.get(key)
+        if e is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return e
+
+    def put(self, key: int, entry: Tuple[int, int, int]) -> None:
+        d = self.data
+        if key not in d and len(d) >= self.max_entries:
+            d.popitem(last=False)
+        d[key] = entry
+
+    def clear(self) -> None:
+        self.data.clear()
+        self.hits = self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+_TT = TranspositionTable()
+
+def configure_tt(max_entries: int) -> TranspositionTable:
+    """Replace the process-wide table with one of the given size."""
+    global _TT
+    _TT = TranspositionTable(max_entries)
+    return _TT
+
+def _negamax(bb: BitBoard, alpha: int, beta: int, remaining: int, tt: TranspositionTable) -> int:
+    x, o = bb.x, bb.o
+    if IS_WIN[x] or IS_WIN[o]:
+        return -1  # previous mover won
+    empty = FULL & ~(x | o)
+    if not empty or remaining <= 0:
+        return 0
+    # Searching deeper than the number of empty cells is the same search.
+    depth = min(remaining, POPCOUNT[empty])
+    canon, s = canonical(x, o)
+    # Stones alone don't fix the side to move for a BitBoard set up by hand.
+    key = (canon << 4 | depth) << 1 | bb.x_to_move
+    alpha0 = alpha
+    hint = -1
+    e = tt.get(key)
+    if e is not None:
+        val, flag, mv = e
+        if flag == EXACT:
+            return val
+        if flag == LOWER:
+            alpha = max(alpha, val)
         else:
-            # Minimizing
-            best_idx = None
-            best_val = 10
-            for i in g.moves():
-                idx=i+1
-                ng = g.clone(); ng.play(idx)
-                _, val = minimax(ng, alpha, beta, depth + 1)
-                if val < best_val:
-                    best_val, best_idx = val, idx
-                beta = min(beta, val)
-                if beta <= alpha:
+            beta = min(beta, val)
+        if alpha >= beta:
+            return val
+        if mv >= 0:
+            hint = SYM_CELL_INV[s][mv]
+
+    moves = CELLS[empty]
+    if hint >= 0:
+        moves = (hint,) + tuple(i for i in moves if i != hint)
+    best, best_i = -2, -1
+    for i in moves:
+        bb.make(i)
+        v = -_negamax(bb, -beta, -alpha, depth - 1, tt)
+        bb.unmake(i)
+        if v > best:
+            best, best_i = v, i
+            if v > alpha:
+                alpha = v
+                if alpha >= beta:
                     break
-            return best_idx, best_val
+    flag = UPPER if best <= alpha0 else LOWER if best >= beta else EXACT
+    tt.put(key, (best, flag, SYM_CELL[s][best_i]))
+    return best
+
+def best_move(game: Game, as_player: Player, depth_limit: Optional[int] = None,
+              tt: Optional[TranspositionTable] = None,
+              time_ms: Optional[float] = None,
+              workers: Optional[int] = None) -> Tuple[int, int]:
+    """Best move for the position. `time_ms` bounds the think time on
+    m,n,k boards (iterative deepening; BIG_BOARD_TIME_MS when neither it nor
+    `depth_limit` is given) and `workers` > 1 splits their root moves across
+    a process pool; 3x3 is always solved exactly in-process."""
+    assert as_player in ("X", "O")
+    if not isinstance(game, Game):
+        if depth_limit is None and time_ms is None:
+            time_ms = BIG_BOARD_TIME_MS  # an unbounded solve doesn't finish here
+        if workers and workers > 1:
+            return _search_mnk_parallel(game, as_player, depth_limit, time_ms, workers)
+        return _search_mnk(game, as_player, depth_limit, time_ms)
+    book = get_book()
+    if book is not None and (depth_limit is None or depth_limit > 0):
+        hit = book.lookup(game.bb.x, game.bb.o, game.bb.x_to_move, depth_limit)
+        if hit is not None:
+            cell, val = hit
+            return cell + 1, val if game.turn == as_player else -val
+    return _search(game, as_player, depth_limit, _TT if tt is None else tt)
+
+def _search(game: Game, as_player: Player, depth_limit: Optional[int],
+            tt: TranspositionTable) -> Tuple[int, int]:
+    bb = game.bb.copy()
+    remaining = 9 if depth_limit is None else depth_limit
+
+    idx, val = None, game.score(as_player)
+    if not bb.terminal() and remaining > 0:
+        # Root: index order, first strictly-better move wins ties (as before).
+        alpha, beta = -10, 10
+        best = -10
+        for i in bb.moves():
+            bb.make(i)
+            v = -_negamax(bb, -beta, -alpha, remaining - 1, tt)
+            bb.unmake(i)
+            if v > best:
+                best, idx = v, i + 1
+            alpha = max(alpha, v)
+        # Negamax scores are for the side to move; report them for as_player.
+        val = best if game.turn == as_player else -best
 
-    idx, val = minimax(game, -10, 10, 0)
     # If depth-limited search can't decide, pick first legal move
     if idx is None:
         legal = game.moves()
         idx = legal[0] if legal else -1
         idx+=1
     return idx, val
+
+# ---- Generic m,n,k boards ----
+# Iterative deepening under a wall-clock budget. Leaves are scored by counting
+# open lines (k-windows holding only one side's marks); move ordering reuses
+# the previous iteration's principal variation, then killer moves, then the
+# history heuristic.
+
+# Think time for big boards when the caller bounds neither time nor depth.
+BIG_BOARD_TIME_MS = 1000
+WIN_SCORE = 1_000_000
+
+class _Timeout(Exception):
+    pass
+
+_WINDOWS = {}
+
+def _windows(width: int, height: int, k: int):
+    """(windows, windows_by_cell) for a board size, cached per size."""
+    key = (width, height, k)
+    if key not in _WINDOWS:
+        wins = []
+        for r in range(height):
+            for c in range(width):
+                for dr, dc in ((0, 1), (1, 0), (1, 1), (1, -1)):
+                    er, ec = r + dr * (k - 1), c + dc * (k - 1)
+                    if 0 <= er < height and 0 <= ec < width:
+                        wins.append(tuple((r + dr * j) * width + c + dc * j for j in range(k)))
+        by_cell = [[] for _ in range(width * height)]
+        for w, cells in enumerate(wins):
+            for i in cells:
+                by_cell[i].append(w)
+        _WINDOWS[key] = (wins, tuple(tuple(b) for b in by_cell))
+    return _WINDOWS[key]
+
+class _Searcher:
+    """Alpha-beta over an `MNKGame` with incremental open-line evaluation."""
+    def __init__(self, game: MNKGame, deadline: Optional[float]):
+        self.g = game.clone()
+        self.deadline = deadline
+        self.nodes = 0
+        wins, self.by_cell = _windows(game.width, game.height, game.k)
+        self.weight = [0] + [4 ** n for n in range(1, game.k)] + [0]
+        self.xc = [0] * len(wins)
+        self.oc = [0] * len(wins)
+        self.eval_x = 0  # open-line score from X's point of view
+        self.killers = [[-1, -1] for _ in range(len(self.g.board) + 1)]
+        self.history = [0] * len(self.g.board)
+        self.pv: list = []
+        self.narrow = len(self.g.board) > 25
+        for i, c in enumerate(self.g.board):
+            if c != " ":
+                self._count(i, c, 1)
+
+    def _value(self, w: int) -> int:
+        xc, oc = self.xc[w], self.oc[w]
+        if xc and not oc:
+            return self.weight[xc]
+        if oc and not xc:
+            return -self.weight[oc]
+        return 0
+
+    def _count(self, i: int, mark: str, d: int) -> None:
+        counts = self.xc if mark == "X" else self.oc
+        for w in self.by_cell[i]:
+            before = self._value(w)
+            counts[w] += d
+            self.eval_x += self._value(w) - before
+
+    def _play(self, i: int) -> None:
+        mark = self.g.turn
+        self.g.play(i + 1)
+        self._count(i, mark, 1)
+
+    def _undo(self) -> None:
+        i = self.g.history[-1]
+        mark = self.g.board[i]
+        self.g.undo()
+        self._count(i, mark, -1)
+
+    def _candidates(self):
+        g = self.g
+        return g.near_moves() if self.narrow else g.moves()
+
+    def _ordered(self, ply: int, on_pv: bool):
+        moves = self._candidates()
+        hist = self.history
+        moves.sort(key=lambda i: -hist[i])
+        first = []
+        if on_pv and ply < len(self.pv):
+            first.append(self.pv[ply])
+        first.extend(m for m in self.killers[ply] if m >= 0)
+        if first:
+            front = [m for m in dict.fromkeys(first) if m in moves]
+            moves = front + [m for m in moves if m not in front]
+        return moves
+
+    def negamax(self, alpha: int, beta: int, depth: int, ply: int, on_pv: bool, line: list) -> int:
+        self.nodes += 1
+        if self.deadline is not None and not (self.nodes & 255) and time.perf_counter() > self.deadline:
+            raise _Timeout
+        g = self.g
+        if g.winner() is not None:
+            return -(WIN_SCORE - ply)
+        if g.terminal():
+            return 0
+        if depth <= 0:
+            return self.eval_x if g.turn == "X" else -self.eval_x
+        best = -WIN_SCORE - 1
+        child: list = []
+        for n, i in enumerate(self._ordered(ply, on_pv)):
+            self._play(i)
+            child.clear()
+            v = -self.negamax(-beta, -alpha, depth - 1, ply + 1, on_pv and n == 0, child)
+            self._undo()
+            if v > best:
+                best = v
+                if v > alpha:
+                    alpha = v
+                    line[:] = [i] + child
+                    if alpha >= beta:
+                        k = self.killers[ply]
+                        if k[0] != i:
+                            k[1], k[0] = k[0], i
+                        self.history[i] += depth * depth
+                        break
+        return best
+
+    def root(self, depth: int, best_so_far: list):
+        """Search all root moves to `depth`; best_so_far is [idx, val]
+        updated in place, so a timeout still leaves a usable answer.
+
+        Ties go to the lowest cell index regardless of search order: each
+        move is searched with a window one below the current best so an
+        equal score comes back exact. This keeps the result identical to
+        the root-parallel search."""
+        beta = WIN_SCORE + 1
+        best_v = best_i = None
+        line: list = []
+        child: list = []
+        for n, i in enumerate(self._ordered(0, True)):
+            lo = -WIN_SCORE - 2 if best_v is None else best_v - 1
+            self._play(i)
+            child.clear()
+            v = -self.negamax(-beta, -lo, depth - 1, 1, n == 0, child)
+            self._undo()
+            if best_v is None or v > best_v or (v == best_v and i < best_i):
+                best_v, best_i = v, i
+                line = [i] + child
+                best_so_far[:] = [i, v]
+        self.pv = line
+        return best_v
+
+    def child_values(self, max_depth: int, move: int):
+        """Root-parallel worker: play `move`, then deepen the reply search
+        and return the move's value (root side's view) for each root depth
+        1..max_depth that finished before the deadline."""
+        self._play(move)
+        out = []
+        try:
+            for depth in range(1, max_depth + 1):
+                line: list = []
+                v = -self.negamax(-WIN_SCORE - 2, WIN_SCORE + 2, depth - 1, 1, True, line)
+                self.pv = [-1] + line
+                out.append(v)
+                if self.g.terminal():
+                    out.extend([v] * (max_depth - depth))  # can't change with depth
+                    break
+        except _Timeout:
+            pass
+        return out
+
+def _search_mnk(game: MNKGame, as_player: Player, depth_limit: Optional[int],
+                time_ms: Optional[float] = None) -> Tuple[int, int]:
+    """Iterative deepening to `depth_limit` plies or until `time_ms` runs out.
+    Score: +1/-1 for a proven win/loss for as_player, else 0."""
+    if game.terminal():
+        legal = game.moves()
+        return (legal[0] if legal else -1) + 1, game.score(as_player)
+    deadline = None if time_ms is None else time.perf_counter() + time_ms / 1000.0
+    s = _Searcher(game, deadline)
+    empties = sum(1 for c in game.board if c == " ")
+    max_depth = empties if depth_limit is None else min(depth_limit, empties)
+    if max_depth <= 0:
+        return game.moves()[0] + 1, game.score(as_player)
+    done = [s._ordered(0, False)[0], 0]  # never return without a move
+    for depth in range(1, max_depth + 1):
+        current = list(done)
+        try:
+            s.root(depth, current)
+        except _Timeout:
+            # The previous PV move is searched first, so whatever a partial
+            # iteration picked already beat it at the deeper depth.
+            done = current
+            break
+        done = current
+        if abs(done[1]) >= WIN_SCORE - len(game.board):
+            break  # forced result found; deeper search can't change it
+    idx, val = done
+    val = (val >= WIN_SCORE - len(game.board)) - (val <= -(WIN_SCORE - len(game.board)))
+    return idx + 1, val if game.turn == as_player else -val
+
+# ---- Root-parallel search ----
+_POOL: Optional[ProcessPoolExecutor] = None
+_POOL_SIZE = 0
+
+def _noop() -> int:
+    return os.getpid()
+
+def warm_pool(workers: int) -> ProcessPoolExecutor:
+    """Start (or resize) the shared search pool and wait until every worker
+    process is up, so the first parallel move doesn't pay spawn cost."""
+    global _POOL, _POOL_SIZE
+    if _POOL is None or _POOL_SIZE != workers:
+        if _POOL is not None:
+            _POOL.shutdown(wait=False, cancel_futures=True)
+        _POOL = ProcessPoolExecutor(max_workers=workers)
+        _POOL_SIZE = workers
+        for f in [_POOL.submit(_noop) for _ in range(workers)]:
+            f.result()
+    return _POOL
+
+def _root_task(game: MNKGame, move: int, max_depth: int, deadline: Optional[float]):
+    """`deadline` is wall-clock (time.time()), fixed when the move was
+    submitted, so a task that waited in the queue gets only what is left.
+    One that starts after it still does a two-ply search (cheap, and enough
+    to see an immediate win or a reply that must be blocked)."""
+    if deadline is None:
+        return move, _Searcher(game, None).child_values(max_depth, move)
+    left = deadline - time.time()
+    if left <= 0:
+        return move, _Searcher(game, None).child_values(min(2, max_depth), move)
+    return move, _Searcher(game, time.perf_counter() + left).child_values(max_depth, move)
+
+def _search_mnk_parallel(game: MNKGame, as_player: Player, depth_limit: Optional[int],
+                         time_ms: Optional[float], workers: int) -> Tuple[int, int]:
+    """Split the root moves across the process pool. Each worker deepens
+    its own subtree; the answer comes from the deepest depth every root
+    move finished, with the same lowest-index tie-break as the serial root.
+    All tasks share one deadline, set before the first is submitted."""
+    if game.terminal():
+        return _search_mnk(game, as_player, depth_limit, time_ms)
+    deadline = None if time_ms is None else time.time() + time_ms / 1000.0
+    empties = sum(1 for c in game.board if c == " ")
+    max_depth = empties if depth_limit is None else min(depth_limit, empties)
+    if max_depth <= 0:
+        return _search_mnk(game, as_player, depth_limit, time_ms)
+    moves = _Searcher(game, None)._candidates()
+    pool = warm_pool(workers)
+    futures = [pool.submit(_root_task, game, m, max_depth, deadline) for m in moves]
+    values = dict(f.result() for f in futures)
+
+    done = min(len(v) for v in values.values())
+    if done == 0:
+        idx, val = moves[0], 0  # budget too small for even one ply
+    else:
+        val, idx = max((v[done - 1], -m) for m, v in values.items())
+        idx = -idx
+    lim = WIN_SCORE - len(game.board)
+    val = (val >= lim) - (val <= -lim)
+    return idx + 1, val if game.turn == as_player else -val
@@ -0,0 +1,114 @@
+# tictactoe/batch.py
+"""
+Bulk evaluation of many 3x3 boards at once.
+
+Boards come in as either
+  - an (N, 9) int array with 0 = empty, 1 = X, 2 = O, or
+  - packed bitboards, one int per board: x_mask << 9 | o_mask
+    (same layout as `BitBoard.key()`; pass `packed=True`).
+
+Every query is a table lookup indexed by the boards' masks, so with numpy
+the work for N boards is a handful of vectorized gathers. Without numpy the
+same tables are used from a list comprehension and lists are returned.
+Side to move is inferred from the mark counts (X moves first).
+"""
+from __future__ import annotations
+from typing import Dict, Optional, Tuple
+
+from .bitboard import FULL, IS_WIN
+from .book import BASE3, EMPTY_SLOT, _column_depth, get_book, solve_column
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+NONE, X, O = 0, 1, 2
+
+_IS_WIN = bytes(IS_WIN)
+_columns: Dict[int, bytes] = {}
+
+if np is not None:
+    _NP_IS_WIN = np.frombuffer(_IS_WIN, dtype=np.uint8).astype(bool)
+    _NP_BASE3 = np.array(BASE3, dtype=np.int32)
+    _BITS = (1 << np.arange(9)).astype(np.int32)
+
+def _move_column(depth_limit: Optional[int]) -> bytes:
+    """Encoded best move per base-3 slot: from the book if it has this
+    depth, otherwise solved once per process and cached."""
+    d = _column_depth(depth_limit)
+    if d not in _columns:
+        book = get_book()
+        col = book.column(depth_limit) if book is not None else None
+        _columns[d] = col if col is not None else bytes(solve_column(depth_limit))
+    return _columns[d]
+
+def masks(boards, packed: bool = False):
+    """(x_masks, o_masks) for a batch of boards. Packed boards with bits
+    above the 18-bit layout or a cell in both masks raise ValueError."""
+    if np is not None:
+        if packed:
+            b = np.asarray(boards, dtype=np.int64)
+            x, o = (b >> 9).astype(np.int32), (b & FULL).astype(np.int32)
+            if ((b >> 18) != 0).any():
+                raise ValueError("packed board out of range")
+            if (x & o).any():
+                raise ValueError("packed board has a cell marked by both X and O")
+            return x, o
+        b = np.asarray(boards, dtype=np.int8).reshape(-1, 9)
+        return (b == X).astype(np.int32) @ _BITS, (b == O).astype(np.int32) @ _BITS
+    if packed:
+        if any(k >> 18 for k in boards):
+            raise ValueError("packed board out of range")
+        if any(k >> 9 & k for k in boards):
+            raise ValueError("packed board has a cell marked by both X and O")
+        return [k >> 9 for k in boards], [k & FULL for k in boards]
+    bits = [1 << i for i in range(9)]
+    xs = [sum(bit for bit, c in zip(bits, row) if c == X) for row in boards]
+    os_ = [sum(bit for bit, c in zip(bits, row) if c == O) for row in boards]
+    return xs, os_
+
+def pack(boards):
+    """(N, 9) cell array -> packed bitboards."""
+    x, o = masks(boards)
+    if np is not None:
+        return x.astype(np.int64) << 9 | o
+    return [a << 9 | b for a, b in zip(x, o)]
+
+def winners(boards, packed: bool = False):
+    """Winner per board: 0 none, 1 X, 2 O."""
+    x, o = masks(boards, packed)
+    if np is not None:
+        return np.where(_NP_IS_WIN[x], X, np.where(_NP_IS_WIN[o], O, NONE)).astype(np.int8)
+    return [X if _IS_WIN[a] else O if _IS_WIN[b] else NONE for a, b in zip(x, o)]
+
+def terminal(boards, packed: bool = False):
+    """True where the board is won or full."""
+    x, o = masks(boards, packed)
+    if np is not None:
+        return _NP_IS_WIN[x] | _NP_IS_WIN[o] | ((x | o) == FULL)
+    return [bool(_IS_WIN[a] or _IS_WIN[b] or (a | b) == FULL) for a, b in zip(x, o)]
+
+def legal_masks(boards, packed: bool = False):
+    """9-bit mask of empty cells, or 0 when the game is over."""
+    x, o = masks(boards, packed)
+    if np is not None:
+        over = _NP_IS_WIN[x] | _NP_IS_WIN[o]
+        return np.where(over, 0, FULL & ~(x | o)).astype(np.int16)
+    return [0 if _IS_WIN[a] or _IS_WIN[b] else FULL & ~(a | b) for a, b in zip(x, o)]
+
+def best_moves(boards, depth_limit: Optional[int] = None, packed: bool = False) -> Tuple:
+    """(moves, values): 1-based best move and its value for the side to
+    move (+1/0/-1), matching `ai.best_move`. Finished or unreachable boards
+    get move 0 and value 0."""
+    col = _move_column(depth_limit)
+    x, o = masks(boards, packed)
+    if np is not None:
+        enc = np.frombuffer(col, dtype=np.uint8)[_NP_BASE3[x] + 2 * _NP_BASE3[o]]
+        hit = enc != EMPTY_SLOT
+        moves = np.where(hit, (enc & 0x0F) + 1, 0).astype(np.int8)
+        values = np.where(hit, (enc >> 4).astype(np.int8) - 1, 0).astype(np.int8)
+        return moves, values
+    enc = [col[BASE3[a] + 2 * BASE3[b]] for a, b in zip(x, o)]
+    return ([0 if e == EMPTY_SLOT else (e & 0x0F) + 1 for e in enc],
+            [0 if e == EMPTY_SLOT else (e >> 4) - 1 for e in enc])
@@ -0,0 +1,461 @@
+# tictactoe/bench.py
+"""
+Benchmarks.
+
+    python -m tictactoe.bench                       # timed suite, print stats
+    python -m tictactoe.bench --save out.json       # ...and write results
+    python -m tictactoe.bench --baseline base.json  # fail on regressions
+    python -m tictactoe.bench --compare             # one-off engine comparisons
+
+Each suite case is warmed up, then timed over many samples; median, p95 and
+p99 are reported per call. With --baseline, a case whose median is more than
+--threshold (default 25%) slower than the baseline's fails the run.
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import fnmatch
+import json
+import logging
+import os
+import platform
+import random
+import socket
+import sys
+import time
+from typing import Callable, Dict, List, Optional
+from .game import Game, ListGame, MNKGame
+from . import ai
+
+def _random_games(n: int, seed: int = 1234):
+    """Pre-generate move sequences (1..9) so both engines replay the same games."""
+    rng = random.Random(seed)
+    games = []
+    for _ in range(n):
+        g = ListGame.new()
+        seq = []
+        while not g.terminal():
+            idx = rng.choice(g.moves()) + 1
+            g.play(idx)
+            seq.append(idx)
+        games.append(seq)
+    return games
+
+def _replay(cls, games) -> float:
+    t0 = time.perf_counter()
+    for seq in games:
+        g = cls.new()
+        for idx in seq:
+            g.play(idx)
+            g.winner()
+            g.terminal()
+        g.clone()
+    return time.perf_counter() - t0
+
+def bench_engines(n: int = 20000) -> None:
+    games = _random_games(n)
+    plies = sum(len(s) for s in games)
+    for name, cls in (("ListGame", ListGame), ("Game (bitboard)", Game)):
+        _replay(cls, games[:500])  # warm-up
+        dt = _replay(cls, games)
+        print(f"{name:<16} {plies / dt:>12,.0f} plies/s  ({dt*1e3:.1f} ms for {n} games)")
+
+def bench_ai_tt() -> None:
+    """Empty-board best_move per depth: cold (fresh table) vs warm."""
+    for depth in (1, 3, 9):
+        ai.configure_tt(1 << 16)
+        t0 = time.perf_counter(); ai.best_move(Game.new(), "X", depth)
+        cold = time.perf_counter() - t0
+        t0 = time.perf_counter(); ai.best_move(Game.new(), "X", depth)
+        warm = time.perf_counter() - t0
+        print(f"best_move depth={depth}  cold {cold*1e3:7.2f} ms  warm {warm*1e3:7.3f} ms")
+
+def bench_parallel(depth: int = 5) -> None:
+    """Fixed-depth 15x15 search, 1..N pool workers (results must match)."""
+    g = MNKGame(15, 15, 5)
+    for idx in (113, 114, 128, 99, 127, 129):
+        g.play(idx)
+    t0 = time.perf_counter(); serial = ai.best_move(g, g.turn, depth)
+    base = time.perf_counter() - t0
+    print(f"root-parallel depth={depth}: serial {base*1e3:.0f} ms")
+    for n in range(1, (os.cpu_count() or 1) + 1):
+        ai.warm_pool(n)
+        t0 = time.perf_counter(); got = ai.best_move(g, g.turn, depth, workers=n)
+        dt = time.perf_counter() - t0
+        print(f"  workers={n:<2} {dt*1e3:8.0f} ms  x{base/dt:4.2f}  {'ok' if got == serial else 'MISMATCH'}")
+
+def bench_batch(n: int = 200_000) -> None:
+    """Batch API vs calling best_move/winner/terminal in a loop."""
+    from . import batch
+    games = []
+    for seq in _random_games(2000, seed=99):
+        g = Game.new()
+        for idx in seq[:len(seq) // 2]:
+            g.play(idx)
+        games.append(g)
+    rows = [[" XO".index(c) for c in g.board] for g in games]
+    boards = batch.np.array(rows * (n // len(rows)), dtype=batch.np.int8) if batch.np is not None else rows * (n // len(rows))
+    batch.best_moves(boards[:10])  # builds/loads the move table
+    t0 = time.perf_counter()
+    batch.winners(boards); batch.terminal(boards); batch.best_moves(boards)
+    dt_batch = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    for g in games:
+        g.winner(); g.terminal(); ai.best_move(g, g.turn)
+    dt_loop = (time.perf_counter() - t0) * (len(boards) / len(games))
+    print(f"batch eval: {len(boards)/dt_batch:>12,.0f} boards/s   loop: {len(boards)/dt_loop:>10,.0f} boards/s")
+
+# ---- Timed suite ----
+def stats(samples: List[float]) -> Dict[str, float]:
+    s = sorted(samples)
+    def pct(p: float) -> float:
+        return s[min(len(s) - 1, int(round(p * (len(s) - 1))))]
+    return {"median": pct(0.5), "p95": pct(0.95), "p99": pct(0.99), "n": len(s)}
+
+def measure(fn: Callable[[], object], samples: int = 200, warmup: int = 20, inner: int = 1) -> Dict[str, float]:
+    """Time `fn` (`inner` calls per sample); stats are microseconds per call."""
+    for _ in range(warmup):
+        fn()
+    out = []
+    perf = time.perf_counter
+    for _ in range(samples):
+        t0 = perf()
+        for _ in range(inner):
+            fn()
+        out.append((perf() - t0) * 1e6 / inner)
+    return stats(out)
+
+def _mid_game() -> Game:
+    g = Game.new()
+    for idx in (5, 1, 9):
+        g.play(idx)
+    return g
+
+def _engine_cases() -> Dict[str, Callable[[], object]]:
+    seqs = _random_games(64, seed=7)
+    played = []
+    for seq in seqs:
+        g = Game.new()
+        for idx in seq[:-1]:
+            g.play(idx)
+        played.append((g, seq[-1]))
+    it = {"i": 0}
+    def pick():
+        it["i"] = (it["i"] + 1) % len(played)
+        return played[it["i"]]
+    def play():
+        g, last = pick()
+        g = g.clone(); g.play(last)
+    def winner():
+        pick()[0].winner()
+    def terminal():
+        pick()[0].terminal()
+    def clone():
+        pick()[0].clone()
+    return {"game.play": play, "game.winner": winner, "game.terminal": terminal, "game.clone": clone}
+
+def _ai_cases() -> Dict[str, Callable[[], object]]:
+    from .guiFolder.config import DIFFICULTIES
+    cases = {}
+    for label, depth in DIFFICULTIES.items():
+        for pos_name, pos in (("empty", Game.new()), ("mid", _mid_game())):
+            # Fresh table per call: measures the search, not the cache.
+            cases[f"ai.best_move.{label.lower()}.{pos_name}"] = (
+                lambda pos=pos, depth=depth: ai.best_move(pos, pos.turn, depth, tt=ai.TranspositionTable()))
+    return cases
+
+def _state_msgs(width: int = 3, height: int = 3, k: int = 3, seed: int = 3) -> List[Dict]:
+    """Server state messages for one random game, in order."""
+    from .game import new_game
+    g = new_game(width, height, k)
+    rng = random.Random(seed)
+    msgs = []
+    while True:
+        msgs.append({"type": "state", "board": list(g.board), "turn": g.turn, "terminal": g.terminal(),
+                     "winner": g.winner(), "width": width, "height": height, "k": k})
+        if g.terminal():
+            return msgs
+        g.play(rng.choice(g.moves()) + 1)
+
+def _frame_cases():
+    """(cases, bytes per message) for JSON lines vs binary frames."""
+    from .server_net import dumps, read_json_line
+    from . import wire
+    state = _state_msgs()[3]
+    line = dumps(state)
+    loop = asyncio.new_event_loop()
+    reader = asyncio.StreamReader(loop=loop)
+    def decode():
+        reader.feed_data(line)
+        loop.run_until_complete(read_json_line(reader))
+    full = wire.Codec().encode(state)
+    # A whole game: the first state goes in full, the rest as deltas.
+    game = _state_msgs()
+    lines = [dumps(m) for m in game]
+    enc = wire.Codec()
+    frames = [enc.encode(m)[2:] for m in game]
+    def encode_game():
+        c = wire.Codec()
+        for m in game:
+            c.encode(m)
+    def decode_game():
+        c = wire.Codec()
+        for f in frames:
+            c.decode(f)
+    def decode_lines():
+        for ln in lines:
+            reader.feed_data(ln)
+            loop.run_until_complete(read_json_line(reader))
+    move = {"type": "move", "idx": 5}
+    cases = {"server_net.dumps": lambda: dumps(state), "server_net.read_json_line": decode,
+             "server_net.dumps.game": lambda: [dumps(m) for m in game],
+             "server_net.read_json_line.game": decode_lines,
+             "wire.encode.state": lambda: wire.Codec().encode(state),
+             "wire.decode.state": lambda: wire.Codec().decode(full[2:]),
+             "wire.encode.game": encode_game, "wire.decode.game": decode_game,
+             "wire.encode.move": lambda: wire.Codec().encode(move)}
+    json_game = sum(map(len, lines))
+    bin_game = sum(len(f) + 2 for f in frames)
+    sizes = {"server_net.dumps": len(line), "server_net.read_json_line": len(line),
+             "server_net.dumps.game": json_game, "server_net.read_json_line.game": json_game,
+             "wire.encode.state": len(full), "wire.decode.state": len(full),
+             "wire.encode.game": bin_game, "wire.decode.game": bin_game,
+             "wire.encode.move": len(wire.Codec().encode(move))}
+    return cases, sizes
+
+def bench_wire() -> None:
+    """Server->client bytes for a whole game, JSON lines vs binary frames."""
+    from .server_net import dumps
+    from . import wire
+    for dims in ((3, 3, 3), (7, 6, 4), (15, 15, 5)):
+        msgs = _state_msgs(*dims)
+        codec = wire.Codec()
+        js = sum(len(dumps(m)) for m in msgs)
+        bn = sum(len(codec.encode(m)) for m in msgs)
+        print(f"{'x'.join(map(str, dims[:2])):>6} game, {len(msgs):>3} states: "
+              f"json {js:>7,} B  binary {bn:>5,} B  ({js / bn:5.1f}x smaller)")
+
+def bench_round_trip(games: int = 40, wire_name: Optional[str] = None, journal: bool = False,
+                     metrics: bool = False) -> Dict[str, float]:
+    """Move -> state latency through a local server_net instance (microseconds),
+    optionally journaling to a temporary directory and/or collecting metrics."""
+    import tempfile
+    from .server_net import TicTacToeServer, dumps, read_json_line
+    from . import wire
+    samples: List[float] = []
+
+    async def until_state(reader, codec):
+        while True:
+            if codec is None:
+                msg = await read_json_line(reader)
+            else:
+                payload = await wire.read_frame(reader)
+                msg = None if payload is None else codec.decode(payload)
+            if msg is None or msg.get("type") == "state":
+                return msg
+
+    async def run(jr):
+        server = TicTacToeServer("bench", journal=jr)
+        if metrics:
+            server.enable_metrics()
+        srv = await asyncio.start_server(server.handle, "127.0.0.1", 0)
+        port = srv.sockets[0].getsockname()[1]
+        async with srv:
+            for _ in range(games):
+                conns = []
+                for name in ("x", "o"):
+                    r, w = await asyncio.open_connection("127.0.0.1", port)
+                    hello = {"type": "hello", "name": name, "pin": "bench"}
+                    codec = None
+                    if wire_name:
+                        hello["wire"] = wire_name
+                        codec = wire.Codec()
+                    w.write(dumps(hello)); await w.drain()
+                    if codec:
+                        await r.readline()  # wire ack
+                    conns.append((r, w, codec))
+                for r, _, codec in conns:
+                    await until_state(r, codec)
+                # X wins down the left column after five round trips
+                for n, idx in enumerate((1, 2, 4, 5, 7)):
+                    mover, other = conns[n % 2], conns[1 - n % 2]
+                    move = {"type": "move", "idx": idx}
+                    t0 = time.perf_counter()
+                    mover[1].write(mover[2].encode(move) if mover[2] else dumps(move)); await mover[1].drain()
+                    await until_state(mover[0], mover[2])
+                    samples.append((time.perf_counter() - t0) * 1e6)
+                    await until_state(other[0], other[2])
+                for _, w, _ in conns:
+                    w.close()
+                    await w.wait_closed()
+
+    level = logging.getLogger().level
+    logging.getLogger().setLevel(logging.WARNING)
+    with tempfile.TemporaryDirectory() as tmp:
+        from .journal import Journal
+        jr = Journal(tmp) if journal else None
+        try:
+            asyncio.run(run(jr))
+        finally:
+            logging.getLogger().setLevel(level)
+            if jr is not None:
+                jr.close()
+    return stats(samples[len(samples) // 10:])  # first games double as warm-up
+
+def bench_spectators(n: int = 10000, moves: int = 60) -> None:  # moves <= 60
+    """Mover round-trip on a 15x15 match with 0 vs `n` binary spectators, and
+    how long the fan-out takes to reach all of them."""
+    import resource
+    from .server_net import TicTacToeServer, dumps, read_json_line
+    from . import wire
+    soft = resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+    n = min(n, (soft - 100) // 2)  # both ends live in this process
+
+    async def until_state(reader, idx):
+        while True:
+            msg = await read_json_line(reader)
+            if msg is None or msg.get("type") == "state" and msg["board"][idx - 1] != " ":
+                return msg
+
+    async def run(watchers: int):
+        server = TicTacToeServer("bench", 15, 15, 5)
+        srv = await asyncio.start_server(server.handle, "127.0.0.1", 0, backlog=1024)
+        port = srv.sockets[0].getsockname()[1]
+        async with srv:
+            conns = []
+            for name in ("x", "o"):
+                r, w = await asyncio.open_connection("127.0.0.1", port)
+                w.write(dumps({"type": "hello", "name": name, "pin": "bench"})); await w.drain()
+                conns.append((r, w))
+            await read_json_line(conns[1][0])  # matched or waiting
+            hello = dumps({"type": "hello", "pin": "bench", "role": "spectator", "wire": wire.NAME})
+            def connect(count):
+                # Plain blocking sockets, never read: the kernel buffers absorb
+                # the deltas and the clients cost this event loop nothing.
+                out = []
+                for _ in range(count):
+                    s = socket.create_connection(("127.0.0.1", port))
+                    s.sendall(hello)
+                    out.append(s)
+                return out
+            spect = await asyncio.get_running_loop().run_in_executor(None, connect, watchers)
+            ses = next(iter(server.sessions))
+            while len(ses.spectators) < watchers:
+                await asyncio.sleep(0.01)
+            rtt, fan = [], []
+            for n_move in range(moves):
+                idx = n_move + 1  # first four rows, alternating marks: no five in a row
+                mover, other = conns[n_move % 2], conns[1 - n_move % 2]
+                t0 = time.perf_counter()
+                mover[1].write(dumps({"type": "move", "idx": idx})); await mover[1].drain()
+                await until_state(mover[0], idx)
+                rtt.append((time.perf_counter() - t0) * 1e6)
+                await until_state(other[0], idx)
+                if ses.spectators._task is not None:
+                    await ses.spectators._task
+                fan.append((time.perf_counter() - t0) * 1e3)
+            for sock in spect:
+                sock.close()
+            for _, w in conns:
+                w.close()
+            while server.sessions or len(ses.spectators):
+                await asyncio.sleep(0.01)
+            return stats(rtt), stats(fan)
+
+    level = logging.getLogger().level
+    logging.getLogger().setLevel(logging.WARNING)
+    try:
+        for watchers in (0, n):
+            rtt, fan = asyncio.run(run(watchers))
+            print(f"spectators={watchers:<6} mover round trip median {rtt['median']:8.1f} us  "
+                  f"p95 {rtt['p95']:8.1f}   all watchers reached {fan['median']:7.2f} ms")
+    finally:
+        logging.getLogger().setLevel(level)
+
+def run_suite(only: Optional[str] = None) -> Dict[str, Dict[str, float]]:
+    from . import book
+    saved = book.get_book()
+    saved_path = saved.path if saved else None
+    book.load_book(None)  # time the search itself, not the book
+    try:
+        results: Dict[str, Dict[str, float]] = {}
+        frame_cases, sizes = _frame_cases()
+        groups = ((_engine_cases(), dict(samples=200, inner=200)),
+                  (_ai_cases(), dict(samples=30, warmup=3)),
+                  (frame_cases, dict(samples=200, inner=100)))
+        for cases, opts in groups:
+            for name, fn in cases.items():
+                if only and not fnmatch.fnmatch(name, only):
+                    continue
+                results[name] = measure(fn, **opts)
+                if name in sizes:
+                    results[name]["bytes"] = sizes[name]
+                _print_row(name, results[name])
+        for name, opts in (("server_net.round_trip", {}),
+                           ("server_net.round_trip.bin1", {"wire_name": "bin1"}),
+                           ("server_net.round_trip.journal", {"journal": True}),
+                           ("server_net.round_trip.metrics", {"metrics": True})):
+            if not only or fnmatch.fnmatch(name, only):
+                results[name] = bench_round_trip(**opts)
+                _print_row(name, results[name])
+        return results
+    finally:
+        book.load_book(saved_path)
+
+def _print_row(name: str, st: Dict[str, float]) -> None:
+    size = f"   {st['bytes']:>4} B" if "bytes" in st else ""
+    print(f"{name:<34} median {st['median']:>10.2f} us   p95 {st['p95']:>10.2f}   p99 {st['p99']:>10.2f}{size}")
+
+def compare(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]],
+            threshold: float) -> List[str]:
+    """Names whose median regressed by more than `threshold` (0.25 = 25%)."""
+    failed = []
+    for name, st in sorted(results.items()):
+        base = baseline.get(name)
+        if not base:
+            continue
+        ratio = st["median"] / base["median"] if base["median"] else 1.0
+        flag = "REGRESSION" if ratio > 1 + threshold else ""
+        print(f"{name:<34} {base['median']:>10.2f} -> {st['median']:>10.2f} us  x{ratio:5.2f} {flag}")
+        if flag:
+            failed.append(name)
+    return failed
+
+def run_comparisons() -> None:
+    bench_engines()
+    bench_ai_tt()
+    bench_parallel()
+    bench_batch()
+    bench_wire()
+    bench_spectators()
+
+def _parse_args():
+    ap = argparse.ArgumentParser(description="TicTacToe benchmarks.")
+    ap.add_argument("--save", help="write results JSON here")
+    ap.add_argument("--baseline", help="compare against this results JSON")
+    ap.add_argument("--threshold", type=float, default=0.25, help="allowed median slowdown (0.25 = 25%%)")
+    ap.add_argument("--only", help="glob of case names to run, e.g. 'ai.*'")
+    ap.add_argument("--compare", action="store_true", help="run the one-off engine comparisons instead")
+    return ap.parse_args()
+
+def main():
+    args = _parse_args()
+    if args.compare:
+        run_comparisons()
+        return
+    results = run_suite(args.only)
+    if args.save:
+        meta = {"python": sys.version.split()[0], "platform": platform.platform(),
+                "cpus": os.cpu_count(), "time": time.strftime("%Y-%m-%dT%H:%M:%S")}
+        with open(args.save, "w") as f:
+            json.dump({"meta": meta, "results": results}, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        failed = compare(results, baseline, args.threshold)
+        if failed:
+            print(f"{len(failed)} regression(s) over {args.threshold:.0%}: {', '.join(failed)}")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+from __future__ import annotations
+from typing import Iterator, List, Optional
+
+# 3x3 board as two 9-bit masks, bit i == cell i (0-based, row-major).
+
+FULL = (1 << 9) - 1
+
+WIN_MASKS = tuple(
+    (1 << a) | (1 << b) | (1 << c)
+    for a, b, c in (
+        (0, 1, 2), (3, 4, 5), (6, 7, 8),  # rows
+        (0, 3, 6), (1, 4, 7), (2, 5, 8),  # cols
+        (0, 4, 8), (2, 4, 6),             # diags
+    )
+)
+
+# IS_WIN[mask] -> True if `mask` contains a full line. 512 entries, so a
+# win check is one list index instead of a scan over the lines.
+IS_WIN = tuple(any((m & w) == w for w in WIN_MASKS) for m in range(1 << 9))
+
+# Cells in ascending order for every 9-bit mask (move generation).
+CELLS = tuple(tuple(i for i in range(9) if m >> i & 1) for m in range(1 << 9))
+
+POPCOUNT = tuple(bin(m).count("1") for m in range(1 << 9))
+
+
+class BitBoard:
+    """Compact 3x3 engine: side masks + side to move, no per-move allocation.
+
+    `x`/`o` are 9-bit masks and `x_to_move` tells whose turn it is.
+    `make`/`unmake` take 0-based cell indexes and do no legality checks;
+    callers (the AI, `game.Game`) are expected to pass empty cells.
+    """
+    __slots__ = ("x", "o", "x_to_move")
+
+    def __init__(self, x: int = 0, o: int = 0, x_to_move: bool = True):
+        self.x = x
+        self.o = o
+        self.x_to_move = x_to_move
+
+    @classmethod
+    def from_cells(cls, board: List[str], turn: str = "X") -> "BitBoard":
+        x = o = 0
+        for i, c in enumerate(board):
+            if c == "X":
+                x |= 1 << i
+            elif c == "O":
+                o |= 1 << i
+        return cls(x, o, turn == "X")
+
+    def cells(self) -> List[str]:
+        x, o = self.x, self.o
+        return ["X" if x >> i & 1 else "O" if o >> i & 1 else " " for i in range(9)]
+
+    def copy(self) -> "BitBoard":
+        return BitBoard(self.x, self.o, self.x_to_move)
+
+    def empty(self) -> int:
+        return FULL & ~(self.x | self.o)
+
+    def moves(self) -> tuple:
+        return CELLS[FULL & ~(self.x | self.o)]
+
+    def iter_moves(self) -> Iterator[int]:
+        return iter(CELLS[FULL & ~(self.x | self.o)])
+
+    def make(self, i: int) -> None:
+        if self.x_to_move:
+            self.x |= 1 << i
+        else:
+            self.o |= 1 << i
+        self.x_to_move = not self.x_to_move
+
+    def unmake(self, i: int) -> None:
+        self.x_to_move = not self.x_to_move
+        if self.x_to_move:
+            self.x &= ~(1 << i)
+        else:
+            self.o &= ~(1 << i)
+
+    def winner(self) -> Optional[str]:
+        if IS_WIN[self.x]:
+            return "X"
+        if IS_WIN[self.o]:
+            return "O"
+        return None
+
+    def terminal(self) -> bool:
+        return IS_WIN[self.x] or IS_WIN[self.o] or (self.x | self.o) == FULL
+
+    def key(self) -> int:
+        """18-bit position key; side to move is implied by the stone count."""
+        return self.x << 9 | self.o
@@ -0,0 +1,180 @@
+# tictactoe/book.py
+"""
+Solved-position table ("book") for the 3x3 game.
+
+Every reachable position is solved once per depth limit and written to a
+small binary file that `ai.best_move` memory-maps and answers from with a
+single index lookup. Build it with:
+
+    python -m tictactoe.book build [--out PATH]
+
+Layout (little-endian):
+  header  MAGIC(8) | rev u16 | ncols u8 | depth u8 * ncols
+  body    ncols * 3**9 bytes, column-major; slot = base3(x) + 2*base3(o)
+          (the stone counts fix the side to move: X on equal counts)
+          byte = move (0..8) | (value + 1) << 4, or 0xFF if unreachable/terminal
+Depth 255 in the header means "no limit".
+"""
+from __future__ import annotations
+import mmap
+import os
+import struct
+from typing import Iterable, List, Optional, Tuple
+
+from .bitboard import POPCOUNT
+
+MAGIC = b"TTTBOOK\x00"
+# Bump when the search (tie-breaking, scoring) changes so old files are ignored.
+SEARCH_REV = 1
+NO_LIMIT = 255
+SLOTS = 3 ** 9
+EMPTY_SLOT = 0xFF
+
+DEFAULT_PATH = os.environ.get("TTT_BOOK") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "book.bin")
+
+# BASE3[mask] -> sum(3**i for set bits), so a position's slot is two lookups.
+BASE3 = tuple(sum(3 ** i for i in range(9) if m >> i & 1) for m in range(1 << 9))
+
+def slot(x: int, o: int) -> int:
+    return BASE3[x] + 2 * BASE3[o]
+
+def _column_depth(depth_limit: Optional[int]) -> int:
+    # 9 plies or more is a full solve on a 3x3 board.
+    if depth_limit is None or depth_limit >= 9:
+        return NO_LIMIT
+    return depth_limit
+
+class Book:
+    """Read-only view over a book file; pages are shared between processes."""
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        head = struct.calcsize("<8sHB")
+        magic, rev, ncols = struct.unpack_from("<8sHB", self.mm, 0)
+        if magic != MAGIC or rev != SEARCH_REV:
+            self.mm.close()
+            raise ValueError(f"stale or foreign book file: {path}")
+        depths = self.mm[head:head + ncols]
+        self.base = head + ncols
+        if len(self.mm) != self.base + ncols * SLOTS:
+            self.mm.close()
+            raise ValueError(f"truncated book file: {path}")
+        # depth -> byte offset of that column
+        self.columns = {d: self.base + c * SLOTS for c, d in enumerate(depths)}
+
+    def column(self, depth_limit: Optional[int]) -> Optional[bytes]:
+        """Raw bytes of one depth column, or None if absent."""
+        col = self.columns.get(_column_depth(depth_limit))
+        if col is None:
+            return None
+        return self.mm[col:col + SLOTS]
+
+    def lookup(self, x: int, o: int, x_to_move: bool, depth_limit: Optional[int]) -> Optional[Tuple[int, int]]:
+        """(cell 0..8, value for side to move) or None if not covered."""
+        col = self.columns.get(_column_depth(depth_limit))
+        if col is None or x_to_move != (POPCOUNT[x] == POPCOUNT[o]):
+            return None  # a side to move the stones don't imply isn't in the book
+        b = self.mm[col + BASE3[x] + 2 * BASE3[o]]
+        if b == EMPTY_SLOT:
+            return None
+        return b & 0x0F, (b >> 4) - 1
+
+    def close(self) -> None:
+        self.mm.close()
+
+_book: Optional[Book] = None
+_book_checked = False
+
+def get_book() -> Optional[Book]:
+    """Process-wide book, opened on first use; None if missing or stale."""
+    global _book, _book_checked
+    if not _book_checked:
+        _book_checked = True
+        try:
+            _book = Book(DEFAULT_PATH)
+        except (OSError, ValueError):
+            _book = None
+    return _book
+
+def load_book(path: Optional[str]) -> Optional[Book]:
+    """Swap the process-wide book (None disables it)."""
+    global _book, _book_checked
+    _book_checked = True
+    _book = Book(path) if path else None
+    return _book
+
+def _reachable():
+    """All reachable non-terminal positions as (x, o, x_to_move)."""
+    from .bitboard import BitBoard
+    seen = set()
+    out = []
+    stack = [BitBoard()]
+    while stack:
+        bb = stack.pop()
+        k = bb.key()
+        if k in seen:
+            continue
+        seen.add(k)
+        if bb.terminal():
+            continue
+        out.append((bb.x, bb.o, bb.x_to_move))
+        for i in bb.moves():
+            nb = bb.copy(); nb.make(i)
+            stack.append(nb)
+    return out
+
+def solve_column(depth_limit: Optional[int], positions=None) -> bytearray:
+    """One book column: the encoded best move for every reachable slot."""
+    from .ai import _search, TranspositionTable
+    from .game import Game
+    from .bitboard import BitBoard
+    col = bytearray([EMPTY_SLOT]) * SLOTS
+    tt = TranspositionTable()
+    g = Game.new()
+    for x, o, x_to_move in positions if positions is not None else _reachable():
+        g.bb = BitBoard(x, o, x_to_move)
+        idx, val = _search(g, g.turn, depth_limit, tt)
+        col[slot(x, o)] = (idx - 1) | (val + 1) << 4
+    return col
+
+def build(path: str = DEFAULT_PATH, depths: Optional[Iterable[Optional[int]]] = None) -> int:
+    """Solve every reachable position for each depth and write the book.
+    Returns the number of positions solved."""
+    if depths is None:
+        from .guiFolder.config import DIFFICULTIES
+        depths = list(DIFFICULTIES.values()) + [None]
+    cols: List[int] = sorted({_column_depth(d) for d in depths})
+    positions = _reachable()
+    body = b"".join(solve_column(None if d == NO_LIMIT else d, positions) for d in cols)
+
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(struct.pack("<8sHB", MAGIC, SEARCH_REV, len(cols)))
+        f.write(bytes(cols))
+        f.write(body)
+    os.replace(tmp, path)  # atomic: readers keep their old mapping
+    return len(positions)
+
+def _parse_args():
+    import argparse
+    ap = argparse.ArgumentParser(description="Build or inspect the solved-position book.")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("build", help="solve all positions and write the book")
+    b.add_argument("--out", default=DEFAULT_PATH)
+    i = sub.add_parser("info", help="show what a book file covers")
+    i.add_argument("--path", default=DEFAULT_PATH)
+    return ap.parse_args()
+
+def main():
+    args = _parse_args()
+    if args.cmd == "build":
+        n = build(args.out)
+        print(f"Wrote {args.out} ({n} positions)")
+    else:
+        bk = Book(args.path)
+        depths = ", ".join("none" if d == NO_LIMIT else str(d) for d in bk.columns)
+        print(f"{args.path}: rev {SEARCH_REV}, depth columns: {depths}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+# tictactoe/bots.py
+"""
+AI seats for server_net.
+
+A player left waiting for `--bot-after` seconds is paired with a `Bot`
+instead. The bot duck-types the reader/writer pair a player dict holds, so
+Session treats it like any other seat: the session's writes only wake it
+up, and it answers through `Session.play_move`.
+
+Searches (`ai.best_move` at a GUI difficulty) run in one `BotPool` per
+server process, a fixed-size process pool, so any number of bot games
+never block network I/O; they just queue for a worker. The pool records
+think time (the search itself) and wait time (time in the queue).
+"""
+from __future__ import annotations
+import asyncio
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Optional, Tuple
+
+from .ai import BIG_BOARD_TIME_MS, best_move
+from .game import new_game
+from .guiFolder.config import DIFFICULTIES
+
+def _think(job: tuple) -> Tuple[int, float]:
+    """(1-based move, search ms) for (w, h, k, board, turn, depth)."""
+    w, h, k, board, turn, depth = job
+    g = new_game(w, h, k)
+    g.board = board
+    g.turn = turn
+    t0 = time.perf_counter()
+    # Bots always have a depth, so bound big-board searches by time too
+    # (3x3 ignores time_ms and is solved exactly).
+    idx, _ = best_move(g, turn, depth_limit=depth, time_ms=BIG_BOARD_TIME_MS)
+    return idx, (time.perf_counter() - t0) * 1000
+
+class BotPool:
+    """Fixed-size process pool for bot moves, started on first use."""
+    def __init__(self, workers: int = 2, difficulty: str = "Medium"):
+        if difficulty not in DIFFICULTIES:
+            raise ValueError(f"difficulty must be one of {tuple(DIFFICULTIES)}")
+        self.workers = workers
+        self.difficulty = difficulty
+        self.depth = DIFFICULTIES[difficulty]
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self.metrics = None  # metrics.ServerMetrics, when enabled
+        # think-time metric
+        self.moves = 0
+        self.think_ms = 0.0
+        self.think_ms_max = 0.0
+        self.wait_ms = 0.0
+
+    async def move(self, game) -> int:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        job = (game.width, game.height, game.k, list(game.board), game.turn, self.depth)
+        t0 = time.perf_counter()
+        idx, ms = await asyncio.get_running_loop().run_in_executor(self._pool, _think, job)
+        self.moves += 1
+        self.think_ms += ms
+        self.think_ms_max = max(self.think_ms_max, ms)
+        self.wait_ms += max(0.0, (time.perf_counter() - t0) * 1000 - ms)
+        if self.metrics is not None:
+            self.metrics.bot_think.observe(ms / 1000)
+        return idx
+
+    def stats(self) -> Dict[str, float]:
+        n = self.moves or 1
+        return {"moves": self.moves, "think_ms_mean": self.think_ms / n,
+                "think_ms_max": self.think_ms_max, "wait_ms_mean": self.wait_ms / n}
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+class Bot:
+    """One AI seat; stands in for both the reader and the writer."""
+    def __init__(self, pool: BotPool):
+        self.pool = pool
+        self.transport = self
+        self.closed = False
+        self._wake = asyncio.Event()
+
+    def player(self) -> dict:
+        return {"name": f"Bot ({self.pool.difficulty})", "reader": self, "writer": self, "bot": self}
+
+    # -- the bits of StreamReader/StreamWriter/Transport a session touches --
+    def write(self, data: bytes) -> None:
+        self._wake.set()  # something changed; run() checks whose turn it is
+
+    async def drain(self) -> None:
+        pass
+
+    def get_write_buffer_size(self) -> int:
+        return 0
+
+    def at_eof(self) -> bool:
+        return self.closed
+
+    def is_closing(self) -> bool:
+        return self.closed
+
+    def close(self) -> None:
+        self.closed = True
+        self._wake.set()
+
+    abort = close
+
+    async def run(self, ses, mark: str) -> None:
+        """Play `mark` in `ses` until the session or the bot closes."""
+        while True:
+            await self._wake.wait()
+            self._wake.clear()
+            if self.closed or ses.closed:
+                return
+            if ses.game.turn == mark and not ses.game.terminal():
+                idx = await self.pool.move(ses.game)
+                if not (self.closed or ses.closed):  # the human may have left meanwhile
+                    await ses.play_move(mark, idx)
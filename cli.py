@@ -1,6 +1,8 @@
-import argparse
-from .game import Game
-from .ai import best_move
+import argparse, os, sys
+from .game import Game, new_game
+from .ai import best_move, warm_pool
+from .mcts import MCTSPlayer
+from . import selfplay
 
 def parse_args():
     p = argparse.ArgumentParser(description="TicTacToe CLI")
@@ -8,14 +10,47 @@ def parse_args():
     p.add_argument("--p1", choices=["X", "O"], default="X", help="player 1 mark")
     p.add_argument("--p2", choices=["X", "O"], default="O", help="player 2 mark")
     p.add_argument("--ai-depth", type=int, default=None, help="optional depth limit for AI")
+    p.add_argument("--ai-time-ms", type=float, default=None,
+                   help="think-time budget per AI move on bigger boards (iterative deepening)")
+    p.add_argument("--ai-workers", type=int, default=1,
+                   help="processes for root-parallel AI search on bigger boards")
+    p.add_argument("--engine", choices=["minimax", "mcts"], default="minimax",
+                   help="AI engine (mcts suits bigger boards)")
+    p.add_argument("--mcts-iterations", type=int, default=1000, help="MCTS tree iterations per move")
+    p.add_argument("--width", type=int, default=3, help="board columns")
+    p.add_argument("--height", type=int, default=3, help="board rows")
+    p.add_argument("--k", type=int, default=3, help="marks in a row needed to win")
+
+    sub = p.add_subparsers(dest="cmd")
+    sp = sub.add_parser("selfplay", help="run engine-vs-engine games headless")
+    sp.add_argument("--games", type=int, default=100)
+    sp.add_argument("--x", dest="x_engine", default="minimax",
+                    help="engine for X: minimax[:DEPTH], timed:MS, mcts[:ITERS], random")
+    sp.add_argument("--o", dest="o_engine", default="random", help="engine for O (same specs)")
+    sp.add_argument("--swap", action="store_true", help="alternate which engine plays X")
+    sp.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    sp.add_argument("--out", default="-", help="JSON Lines output file ('-' = stdout, '' = none)")
+    sp.add_argument("--seed", type=int, default=0)
     return p.parse_args()
 
+def run_selfplay(args):
+    dims = (args.width, args.height, args.k)
+    out = sys.stdout if args.out == "-" else open(args.out, "w") if args.out else None
+    try:
+        summary = selfplay.run(args.games, args.x_engine, args.o_engine, dims,
+                               workers=args.workers, out=out, seed=args.seed, swap=args.swap)
+    finally:
+        if out is not None and out is not sys.stdout:
+            out.close()
+    selfplay.print_summary(summary)
+
 def read_human_move(g: Game) -> int:
+    n = len(g.board)
     while True:
         try:
-            idx = int(input(f"Play {g.turn} at [1-9]: "))
+            idx = int(input(f"Play {g.turn} at [1-{n}]: "))
         except ValueError:
-            print("Please type a number 1..9.")
+            print(f"Please type a number 1..{n}.")
             continue
         if g.play(idx):
             return idx
@@ -23,18 +58,32 @@ def read_human_move(g: Game) -> int:
 
 def run_cli():
     args = parse_args()
-    g = Game.new()
+    if args.cmd == "selfplay":
+        run_selfplay(args)
+        return
+    g = new_game(args.width, args.height, args.k)
     human_vs_human = (args.mode == "human")
     ai_mark = "O" if args.p1 == "X" else "X"  # AI is the other player when in AI mode
 
-    print("Index map:\n1|2|3\n4|5|6\n7|8|9\n")
+    mcts = MCTSPlayer(args.mcts_iterations, args.ai_time_ms) if args.engine == "mcts" else None
+    # 3x3 is always solved in-process; only bigger boards use the pool.
+    if args.ai_workers > 1 and not human_vs_human and not mcts and not isinstance(g, Game):
+        warm_pool(args.ai_workers)
+
+    w = g.width
+    rows = ("|".join(str(r*w + c + 1) for c in range(w)) for r in range(g.height))
+    print("Index map:\n" + "\n".join(rows) + "\n")
 
     while not g.terminal():
         print(g.pretty())
         if human_vs_human or g.turn == args.p1:
             read_human_move(g)
         else:
-            idx, _ = best_move(g, as_player=ai_mark, depth_limit=args.ai_depth)
+            if mcts:
+                idx, _ = mcts.best_move(g)
+            else:
+                idx, _ = best_move(g, as_player=ai_mark, depth_limit=args.ai_depth,
+                                   time_ms=args.ai_time_ms, workers=args.ai_workers)
             g.play(idx)
             print(f"AI plays at {idx}")
 
@@ -1,4 +1,5 @@
-import asyncio, argparse, json, sys
+import asyncio, argparse, itertools, json, sys
+from . import wire
 
 ENC = "utf-8"
 def dumps(obj): return (json.dumps(obj, separators=(",", ":")) + "\n").encode(ENC)
@@ -9,62 +10,169 @@ async def read_json_line(reader: asyncio.StreamReader):
     try: return json.loads(line.decode(ENC))
     except json.JSONDecodeError: return {"type":"error","error":"bad_json"}
 
-def pretty_board(board):
+def pretty_board(board, width=3, height=None):
+    height = height or len(board) // width
+    pad = len(str(width * height))
     def cell(i):
         v = board[i]
-        return v if v in ("X","O") else str(i+1)
+        return (v if v in ("X","O") else str(i+1)).center(pad)
     r = []
-    for row in range(3):
-        r.append(f" {cell(row*3)} | {cell(row*3+1)} | {cell(row*3+2)} ")
-    return ("\n---+---+---\n").join(r)
+    for row in range(height):
+        r.append(" " + " | ".join(cell(row*width + c) for c in range(width)) + " ")
+    sep = "\n" + "+".join(["-" * (pad + 2)] * width) + "\n"
+    return sep.join(r)
 
-async def main(host, port, name, pin):
+RECONNECT_DELAYS = (0.25, 0.5, 1.0, 2.0, 4.0)  # then 4s until the deadline
+
+async def connect(host, port, hello, wire_name="json"):
+    """Open a connection and send `hello`. Returns (reader, writer, codec,
+    pending): codec is None on JSON, pending holds a first message that
+    arrived instead of the wire ack."""
     reader, writer = await asyncio.open_connection(host, port)
-    writer.write(dumps({"type":"hello","name":name,"pin":pin}))
+    writer.write(dumps(hello))
     await writer.drain()
+    codec = None
+    pending = []
+    if wire_name != "json":
+        # The server acks binary framing with one JSON line; anything else
+        # (an older server, or an error) means we stay on JSON.
+        first = await read_json_line(reader)
+        if first is not None and first.get("type") == "wire" and first.get("wire") == wire_name:
+            codec = wire.Codec()
+        elif first is not None:
+            pending.append(first)
+    return reader, writer, codec, pending
+
+async def reconnect(host, port, token, wire_name="json", within=30.0, on_attempt=None):
+    """Retry with backoff until the server takes `token` back or `within`
+    seconds pass. Returns connect()'s tuple, or None."""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + within
+    hello = {"type": "hello", "token": token}
+    if wire_name != "json":
+        hello["wire"] = wire_name
+    for n in itertools.count():
+        delay = RECONNECT_DELAYS[min(n, len(RECONNECT_DELAYS) - 1)]
+        if loop.time() + delay > deadline:
+            return None
+        await asyncio.sleep(delay)
+        if on_attempt is not None:
+            on_attempt(n + 1)
+        try:
+            return await connect(host, port, hello, wire_name)
+        except OSError:
+            continue
+
+async def main(host, port, name, pin, room=None, wire_name="json", watch=False, match=None, token=None,
+               reconnect_for=30.0):
+    hello = {"type":"hello","name":name,"pin":pin}
+    if room:
+        hello["room"] = room
+    if token:
+        hello["token"] = token
+    if watch:
+        hello["role"] = "spectator"
+        if match is not None:
+            hello["match"] = match
+    if wire_name != "json":
+        hello["wire"] = wire_name
+    reader, writer, codec, pending = await connect(host, port, hello, wire_name)
     print(">> Connected. Waiting…")
+    # Swapped wholesale when we reconnect.
+    conn = {"reader": reader, "writer": writer, "codec": codec, "pending": pending}
+    seat = {"token": None, "done": False}
+
+    def encode(msg):
+        return conn["codec"].encode(msg) if conn["codec"] else dumps(msg)
+
+    async def recv():
+        if conn["pending"]:
+            return conn["pending"].pop()
+        if conn["codec"] is None:
+            return await read_json_line(conn["reader"])
+        payload = await wire.read_frame(conn["reader"])
+        if payload is None:
+            return None
+        try:
+            return conn["codec"].decode(payload)
+        except ValueError:
+            return {"type":"error","error":"bad_frame"}
+
+    size = {"cells": 9}
 
     async def input_task():
         loop = asyncio.get_event_loop()
-        while True:
+        while not seat["done"]:
             line = await loop.run_in_executor(None, sys.stdin.readline)
             if not line: break
             cmd = line.strip().lower()
-            if cmd.startswith("move"):
-                try:
-                    idx = int(cmd.split()[1])
-                except Exception:
-                    print("!! usage: move <1-9>")
-                    continue
-                writer.write(dumps({"type":"move","idx":idx}))
-                await writer.drain()
-            elif cmd in ("quit","exit"):
-                writer.write(dumps({"type":"quit"})); await writer.drain()
-                break
+            try:
+                if cmd.startswith("move"):
+                    try:
+                        idx = int(cmd.split()[1])
+                    except Exception:
+                        print(f"!! usage: move <1-{size['cells']}>")
+                        continue
+                    conn["writer"].write(encode({"type":"move","idx":idx}))
+                    await conn["writer"].drain()
+                elif cmd in ("quit","exit"):
+                    seat["done"] = True
+                    conn["writer"].write(encode({"type":"quit"})); await conn["writer"].drain()
+                    break
+            except ConnectionError:
+                print("!! Not connected; try again once reconnected.")
 
     async def recv_task():
         while True:
-            msg = await read_json_line(reader)
+            try:
+                msg = await recv()
+            except ConnectionError:
+                msg = None
             if msg is None:
+                if seat["token"] and not seat["done"] and reconnect_for > 0:
+                    print("<< Connection lost.")
+                    conn["writer"].close()
+                    got = await reconnect(host, port, seat["token"], wire_name, reconnect_for,
+                                          lambda n: print(f"<< Reconnecting (attempt {n})…"))
+                    if got is not None:
+                        conn.update(zip(("reader", "writer", "codec", "pending"), got))
+                        continue
                 print("<< Disconnected.")
                 break
             if msg.get("status") == "waiting_for_opponent":
                 print("<< Waiting for opponent…")
-            elif msg.get("status") == "matched":
-                print(f"<< Matched: you={msg.get('you')} vs {msg.get('opponent')}")
+            elif msg.get("status") == "watching":
+                print(f"<< Watching match {msg.get('match')}: {msg.get('x')} (X) vs {msg.get('o')} (O)")
+            elif msg.get("status") in ("matched", "resumed"):
+                seat["token"] = msg.get("token")
+                verb = "Matched" if msg["status"] == "matched" else "Back in the game"
+                print(f"<< {verb}: you={msg.get('you')} vs {msg.get('opponent')} (token {seat['token']})")
             elif msg.get("type") == "state":
-                print(pretty_board(msg["board"]))
+                size["cells"] = len(msg["board"])
+                print(pretty_board(msg["board"], msg.get("width", 3), msg.get("height")))
                 if msg.get("terminal"):
                     print(f"<< Game over — Winner: {msg.get('winner') or 'Draw'}")
+            elif "type" not in msg and msg.get("error"):  # refused at hello
+                print("<< ERROR:", msg["error"])
+                break
             elif msg.get("type") == "your_turn":
-                print("<< Your turn. Use: move <1-9>")
+                print(f"<< Your turn. Use: move <1-{size['cells']}>")
+            elif msg.get("type") == "opponent_away":
+                print(f"<< Opponent dropped; holding their seat for {msg.get('grace', 0):g}s…")
+            elif msg.get("type") == "opponent_back":
+                print("<< Opponent is back.")
             elif msg.get("type") == "end":
+                seat["done"] = True
                 print(f"<< Game ended ({msg.get('reason')}).")
             elif msg.get("type") == "error":
                 print("<< ERROR:", msg.get("error"))
 
     await asyncio.gather(recv_task(), input_task())
-    writer.close(); await writer.wait_closed()
+    conn["writer"].close()
+    try:
+        await conn["writer"].wait_closed()
+    except ConnectionError:
+        pass
 
 if __name__ == "__main__":
     ap = argparse.ArgumentParser()
@@ -72,5 +180,15 @@ if __name__ == "__main__":
     ap.add_argument("--port", type=int, required=True)
     ap.add_argument("--name", required=True)
     ap.add_argument("--pin", required=True)
+    ap.add_argument("--room", default=None, help="named room (created with --pin if new)")
+    ap.add_argument("--wire", choices=["json", wire.NAME], default="json",
+                    help="message framing; falls back to json if the server doesn't offer it")
+    ap.add_argument("--token", default=None,
+                    help="rejoin your match with the token from its matched line (also after a server restart)")
+    ap.add_argument("--reconnect", type=float, default=30.0, metavar="SECONDS",
+                    help="how long to keep retrying after a dropped connection (0: don't)")
+    ap.add_argument("--watch", action="store_true", help="spectate the room's newest match")
+    ap.add_argument("--match", type=int, default=None, help="with --watch: match id to spectate")
     args = ap.parse_args()
-    asyncio.run(main(args.host, args.port, args.name, args.pin))
+    asyncio.run(main(args.host, args.port, args.name, args.pin, args.room, args.wire, args.watch, args.match,
+                     args.token, args.reconnect))
@@ -0,0 +1,461 @@
+# tictactoe/cluster.py
+"""
+Multi-process server: `python -m tictactoe.server_net --workers N`.
+
+N worker processes accept on the same port (SO_REUSEPORT), each running the
+normal asyncio server. The parent runs the UDP discovery responder once and
+a small matchmaking broker. The broker owns room PINs and the FIFO queues of
+waiting players, so players on different workers still get paired.
+
+Workers talk to the broker over AF_UNIX SOCK_SEQPACKET socket pairs (one
+JSON message per packet). When a player's opponent waits on another worker,
+the player's connected socket is handed over with SCM_RIGHTS (via the broker)
+and the session runs entirely on the opponent's worker. Only the hello goes
+through the broker; moves never leave the worker.
+"""
+from __future__ import annotations
+import asyncio
+import itertools
+import json
+import logging
+import multiprocessing as mp
+import os
+import selectors
+import signal
+import socket
+from collections import deque
+from typing import Dict, List, Optional
+
+from . import server_net
+from .server_net import LocalPeer, Room, TicTacToeServer, _gone, dumps, send
+
+MAX_PACKET = 1 << 16
+
+def _send(sock: socket.socket, msg: dict, fds=()) -> None:
+    data = json.dumps(msg, separators=(",", ":")).encode("utf-8")
+    if len(data) > MAX_PACKET:
+        raise ValueError(f"broker message of {len(data)} bytes is over MAX_PACKET")
+    socket.send_fds(sock, [data], list(fds))
+
+def _recv(sock: socket.socket):
+    """(msg, fds), or (None, []) at EOF. Raises ValueError (with any fds
+    closed) for a truncated or malformed packet."""
+    data, fds, flags, _ = socket.recv_fds(sock, MAX_PACKET, 4)
+    if not data:
+        for fd in fds:
+            os.close(fd)
+        return None, []
+    try:
+        if flags & socket.MSG_TRUNC:
+            raise ValueError("broker message truncated")
+        msg = json.loads(data)
+        if not isinstance(msg, dict):
+            raise ValueError("broker message is not an object")
+    except ValueError:
+        for fd in fds:
+            os.close(fd)
+        raise
+    return msg, fds
+
+# ---- Broker (parent process) ----
+class Broker:
+    """Rooms and matchmaking queues shared by all workers."""
+    def __init__(self, pin: str, links: List[socket.socket], max_rooms: int = 20000):
+        self.links = {i: s for i, s in enumerate(links)}
+        self.max_rooms = max_rooms
+        # name -> {"pin", "queue": deque of (worker, ticket), "active": sessions}
+        self.rooms: Dict[str, dict] = {"": {"pin": pin, "queue": deque(), "active": 0}}
+        self.ready: set = set()  # workers accepting connections
+        self.on_ready = None  # called once every worker is accepting
+        self._stop = False
+
+    def stop(self) -> None:
+        self._stop = True
+
+    def load(self) -> dict:
+        """Load figures for discovery replies (read from the responder's thread)."""
+        rooms = list(self.rooms.values())
+        sessions = sum(max(0, r["active"]) for r in rooms)
+        waiting = sum(len(r["queue"]) for r in rooms)
+        return {"rooms": len(rooms) - 1, "sessions": sessions,
+                "waiting": waiting, "players": 2 * sessions + waiting}
+
+    def serve_forever(self) -> None:
+        sel = selectors.DefaultSelector()
+        for i, s in self.links.items():
+            sel.register(s, selectors.EVENT_READ, i)
+        try:
+            while not self._stop and self.links:
+                for key, _ in sel.select(timeout=0.2):
+                    w = key.data
+                    try:
+                        msg, fds = _recv(key.fileobj)
+                    except OSError:
+                        msg, fds = None, []
+                    except ValueError as e:
+                        logging.warning(f"Dropped a bad message from worker {w}: {e}")
+                        continue
+                    if msg is None:
+                        sel.unregister(key.fileobj)
+                        self._worker_gone(w)
+                        continue
+                    try:
+                        self.on_message(w, msg, fds)
+                    except (KeyError, TypeError, ValueError) as e:
+                        logging.warning(f"Dropped a bad {msg.get('op')!r} message from worker {w}: {e!r}")
+                        for fd in fds:
+                            try:
+                                os.close(fd)
+                            except OSError:
+                                pass
+        finally:
+            sel.close()
+
+    def _worker_gone(self, w: int) -> None:
+        logging.warning(f"Worker {w} went away")
+        self.links.pop(w, None)
+        for room in self.rooms.values():
+            room["queue"] = deque(e for e in room["queue"] if e[0] != w)
+
+    def _reply(self, w: int, msg: dict, fds=()) -> bool:
+        link = self.links.get(w)
+        if link is not None:
+            try:
+                _send(link, msg, fds)
+                return True
+            except OSError:
+                pass
+        return False
+
+    def _handoff(self, w: int, msg: dict, fds) -> None:
+        adopt = {"op": "adopt", "opp": msg["opp"], "hello": msg["hello"]}
+        if self._reply(msg["to"], adopt, fds):
+            return
+        # The target worker is gone. An opponent who waited there went with
+        # it, so the sender tries the queue again; a match or spectated game
+        # that lived there is lost, and the client hears so.
+        if msg["opp"] is not None and self._reply(w, {**adopt, "opp": None}, fds):
+            return
+        watching = msg["hello"].get("role") == "spectator"
+        for fd in fds:
+            try:
+                os.write(fd, dumps({"error": "no_match" if watching else "bad_token"}))
+            except OSError:
+                pass
+
+    def on_message(self, w: int, msg: dict, fds) -> None:
+        op = msg.get("op")
+        if op == "join":
+            self._reply(w, self._join(w, msg))
+        elif op == "leave":
+            room = self.rooms.get(msg.get("room"))
+            if room is not None:
+                try:
+                    room["queue"].remove((w, msg["ticket"]))
+                except ValueError:
+                    pass
+                self._drop_if_idle(msg["room"])
+        elif op == "seated":  # a session the worker started without us (bot)
+            room = self.rooms.get(msg.get("room"))
+            if room is not None:
+                room["active"] += 1
+        elif op == "ended":
+            room = self.rooms.get(msg.get("room"))
+            if room is not None:
+                room["active"] -= 1
+                self._drop_if_idle(msg["room"])
+        elif op == "park":  # a recovered match: hold its room, with its PIN, as if active
+            room = self.rooms.setdefault(msg["room"], {"pin": msg["pin"], "queue": deque(), "active": 0})
+            room["active"] += 1
+        elif op == "handoff":
+            self._handoff(w, msg, fds)
+        elif op == "ready":
+            self.ready.add(w)
+            if self.on_ready is not None and self.ready >= set(self.links):
+                self.on_ready()
+                self.on_ready = None
+        for fd in fds:
+            os.close(fd)  # the receiver has its own copy
+
+    def _join(self, w: int, msg: dict) -> dict:
+        name, pin, t = str(msg.get("room") or ""), msg.get("pin"), msg["t"]
+        room = self.rooms.get(name)
+        if room is None:
+            if not pin:
+                return {"t": t, "error": "auth_failed"}
+            if len(self.rooms) >= self.max_rooms:
+                return {"t": t, "error": "too_many_rooms"}
+            room = self.rooms[name] = {"pin": pin, "queue": deque(), "active": 0}
+        elif pin != room["pin"]:
+            return {"t": t, "error": "auth_failed"}
+        if room["queue"] and not msg.get("hold"):
+            ow, ot = room["queue"].popleft()
+            room["active"] += 1
+            return {"t": t, "worker": ow, "opp": ot}
+        room["queue"].append((w, t))
+        return {"t": t, "wait": True}
+
+    def _drop_if_idle(self, name: str) -> None:
+        room = self.rooms.get(name)
+        if name and room is not None and not room["queue"] and room["active"] <= 0:
+            del self.rooms[name]
+
+# ---- Worker side ----
+class BrokerLink:
+    """Worker end of the broker socket, driven by the event loop."""
+    def __init__(self, sock: socket.socket, on_adopt, on_lost=None):
+        self.sock = sock
+        self.on_adopt = on_adopt
+        self.on_lost = on_lost
+        self.pending: Dict[int, asyncio.Future] = {}
+        asyncio.get_running_loop().add_reader(sock.fileno(), self._readable)
+
+    def send(self, msg: dict, fds=()) -> None:
+        _send(self.sock, msg, fds)
+
+    async def request(self, msg: dict, t: int) -> dict:
+        fut = self.pending[t] = asyncio.get_running_loop().create_future()
+        self.send({**msg, "t": t})
+        return await fut
+
+    def _readable(self) -> None:
+        try:
+            msg, fds = _recv(self.sock)
+        except ValueError as e:
+            logging.warning(f"Dropped a bad message from the broker: {e}")
+            return
+        if msg is None:
+            logging.error("Broker went away")
+            asyncio.get_running_loop().remove_reader(self.sock.fileno())
+            if self.on_lost:
+                self.on_lost()
+            return
+        fut = self.pending.pop(msg.get("t"), None)
+        if fut is not None:
+            fut.set_result(msg)
+        elif msg.get("op") == "adopt" and fds:
+            asyncio.create_task(self.on_adopt(msg, fds[0]))
+
+class ClusterServer(TicTacToeServer):
+    """A worker: like TicTacToeServer, but rooms and queues live in the broker.
+    Match ids are `index` modulo `workers`, so a spectator who names a match
+    is sent to its worker; one who doesn't sees the newest match in the room
+    on the worker they land on."""
+    def __init__(self, index: int, link_sock: socket.socket, pin: str, *args, workers: int = 1, **kwargs):
+        super().__init__(pin, *args, **kwargs)
+        self.index = index
+        self.workers = workers
+        first = next(self._match_ids)  # past every id in this worker's journal
+        self._match_ids = itertools.count(first + (index - first) % workers, workers)
+        self.link_sock = link_sock
+        self.link: Optional[BrokerLink] = None
+        self.tickets: Dict[int, tuple] = {}  # ticket -> (player, room) waiting here
+        self._ticket_ids = itertools.count(1)
+
+    def attach(self, on_lost=None) -> None:
+        """Start talking to the broker (needs the running loop)."""
+        self.link = BrokerLink(self.link_sock, self._adopt, on_lost)
+        for entry, mark in self.suspended.values():  # recovered matches; their tokens route here
+            if mark == "X":
+                m = entry["match"]
+                self.link.send({"op": "park", "room": m.room, "pin": m.pin})
+
+    def waiting_count(self) -> int:
+        return len(self.tickets)
+
+    def _new_token(self) -> str:
+        # The worker index tells any worker where the seat lives.
+        return f"{self.index}.{super()._new_token()}"
+
+    def _local_room(self, name: str, pin: str) -> Room:
+        room = self.rooms.get(name)
+        if room is None:
+            room = self.rooms[name] = Room(name, pin)
+        return room
+
+    def _session_closed(self, ses, room: Room) -> None:
+        super()._session_closed(ses, room)
+        self.link.send({"op": "ended", "room": room.name})
+
+    def _give_up(self, entry: dict) -> None:
+        super()._give_up(entry)
+        self.link.send({"op": "ended", "room": entry["room"].name})  # undoes the park
+
+    def _drop_if_idle(self, room: Room) -> None:
+        if not any(r is room for _, r in self.tickets.values()):
+            super()._drop_if_idle(room)
+
+    def _untick(self, t: int):
+        """Withdraw ticket `t` from the broker; its player, or None if it was
+        already paired or gone."""
+        waiting = self.tickets.pop(t, None)
+        if waiting is None:
+            return None
+        me, room = waiting
+        if not _gone(me):
+            self.link.send({"op": "seated", "room": room.name})  # before leave, so the room stays
+        self.link.send({"op": "leave", "room": room.name, "ticket": t})
+        return None if _gone(me) else me
+
+    async def _sweep(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            self._log_bots()
+            self._expire_parked()
+            for t, (p, room) in list(self.tickets.items()):
+                if _gone(p):
+                    del self.tickets[t]
+                    self.link.send({"op": "leave", "room": room.name, "ticket": t})
+                    self._drop_if_idle(room)
+
+    async def admit(self, hello: dict, reader, writer, opp: Optional[int] = None):
+        """Pair through the broker. `opp` is the ticket of a player waiting
+        here that the broker already matched this connection with."""
+        if hello.get("token"):
+            owner, _, _ = str(hello["token"]).partition(".")
+            if owner.isdigit() and int(owner) != self.index:
+                self._handoff(int(owner), None, hello, writer)
+            else:
+                await self.rejoin(hello, reader, writer)
+            return
+        name, pin = str(hello.get("room") or ""), hello.get("pin")
+        # An in-process seat can't be handed to another worker, so it always
+        # waits here for the next player instead of taking one waiting elsewhere.
+        hold = isinstance(writer, LocalPeer)
+        while True:
+            if opp is None:
+                t = next(self._ticket_ids)
+                reply = await self.link.request({"op": "join", "room": name, "pin": pin, "hold": hold}, t)
+                if "error" in reply:
+                    writer.write(dumps({"error": reply["error"]})); await writer.drain()
+                    writer.close(); return
+                if reply.get("wait"):
+                    me = self._player(hello, reader, writer)
+                    self.tickets[t] = (me, room := self._local_room(name, pin))
+                    self._arm_bot(room, lambda t=t: self._untick(t))
+                    await send(me, {"status": "waiting_for_opponent"})
+                    return
+                if reply["worker"] != self.index:
+                    self._handoff(reply["worker"], reply["opp"], hello, writer)
+                    return
+                opp = reply["opp"]
+            waiting = self.tickets.pop(opp, None)
+            opp = None
+            if waiting is None or _gone(waiting[0]):
+                # Stale queue entry: undo the broker's pairing, ask again.
+                self.link.send({"op": "ended", "room": name})
+                continue
+            opp_player, room = waiting
+            await self._start_session(room, opp_player, self._player(hello, reader, writer)).start()
+            return
+
+    async def _spectate(self, hello: dict, reader, writer):
+        match = hello.get("match")
+        if type(match) is int and match % self.workers != self.index:
+            self._handoff(match % self.workers, None, hello, writer)
+            return
+        if str(hello.get("room") or "") not in self.rooms:  # the broker has the PIN; we've no match
+            writer.write(dumps({"error": "no_match"})); await writer.drain()
+            writer.close(); return
+        await super()._spectate(hello, reader, writer)
+
+    def _handoff(self, worker: int, opp: Optional[int], hello: dict, writer) -> None:
+        """Send this connection (not yet answered) to the worker where its
+        opponent waits or its match lives."""
+        sock = writer.get_extra_info("socket")
+        self.link.send({"op": "handoff", "to": worker, "opp": opp, "hello": hello}, [sock.fileno()])
+        writer.transport.abort()  # drops our copy only; the connection lives on
+
+    async def _adopt(self, msg: dict, fd: int) -> None:
+        reader, writer = await asyncio.open_connection(sock=socket.socket(fileno=fd))
+        if msg["hello"].get("role") == "spectator":
+            await self._spectate(msg["hello"], reader, writer)
+        else:
+            await self.admit(msg["hello"], reader, writer, opp=msg["opp"])
+
+def _listen_socket(host: str, port: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    return sock
+
+async def _worker(index: int, workers: int, link_sock: socket.socket, host: str, port: int, pin: str,
+                  server_opts: dict, join_as: Optional[str]):
+    # One journal per worker: each process appends to its own segments.
+    jdir = server_opts.pop("journal_dir", None)
+    journal = server_net.open_journal(jdir and os.path.join(jdir, f"worker{index}"),
+                                      **server_opts.pop("journal_opts", None) or {})
+    maddr = server_opts.pop("metrics_addr", None)
+    server = ClusterServer(index, link_sock, pin, journal=journal, workers=workers, **server_opts)
+    if maddr:
+        await server_net.serve_metrics(server, maddr[0], maddr[1] + index)
+    lost = asyncio.Event()
+    server.attach(on_lost=lost.set)  # no broker, no matchmaking: exit
+    srv = await asyncio.start_server(server.handle, sock=_listen_socket(host, port), backlog=1024)
+    logging.info(f"Worker {index} (pid {os.getpid()}) accepting on {host}:{port}")
+    server.link.send({"op": "ready"})
+    if join_as:
+        asyncio.create_task(server_net.host_seat(server, pin, join_as))
+    try:
+        async with srv:
+            await lost.wait()
+    finally:
+        server.close()
+        if journal is not None:
+            journal.close()
+
+def _worker_main(*args) -> None:
+    try:
+        asyncio.run(_worker(*args))
+    except KeyboardInterrupt:
+        pass
+
+def serve(host: str, port: int, pin: str, workers: int, discovery_port: Optional[int] = None,
+          host_plays: bool = False, host_name: str = "HostPlayer",
+          announce_port: Optional[int] = server_net.ANNOUNCE_PORT, announce_every: float = 10.0,
+          discovery_mode: str = "broadcast", ready: bool = False, **server_opts) -> None:
+    """Run the broker here and `workers` accepting processes; blocks."""
+    reserved = None
+    if port == 0:
+        # Bound but never listening: it only pins the number the OS picked
+        # for the workers' SO_REUSEPORT group; connections go to listeners.
+        reserved = _listen_socket(host, 0)
+        port = reserved.getsockname()[1]
+    # spawn, not fork: children must not inherit each other's broker sockets
+    # (or EOF on a dead worker's socket would never arrive).
+    ctx = mp.get_context("spawn")
+    links, procs = [], []
+    for i in range(workers):
+        ours, theirs = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        join_as = host_name if host_plays and i == 0 else None
+        p = ctx.Process(target=_worker_main, args=(i, workers, theirs, host, port, pin, server_opts, join_as),
+                        daemon=True, name=f"ttt-worker-{i}")
+        p.start()
+        theirs.close()
+        links.append(ours)
+        procs.append(p)
+    logging.info(f"Broker up with {workers} workers on port {port}")
+    broker = Broker(pin, links, server_opts.get("max_rooms", 20000))
+    responder = None
+    if discovery_port is not None:
+        # the broker has no event loop, so the responder brings its own thread
+        responder = server_net.DiscoveryResponder(
+            host_name, port, True, load=broker.load, announce_port=announce_port,
+            announce_every=announce_every, mode=discovery_mode).start_thread(host, discovery_port)
+    if ready:
+        broker.on_ready = lambda: server_net.report_ready(port, discovery_port)
+    signal.signal(signal.SIGTERM, lambda *_: broker.stop())
+    try:
+        broker.serve_forever()
+    finally:
+        if responder is not None:
+            responder.stop_thread()
+        if reserved is not None:
+            reserved.close()
+        for s in links:
+            s.close()  # workers see EOF and exit
+        for p in procs:
+            p.join(2)
+            if p.is_alive():
+                p.terminate()
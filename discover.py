@@ -1,93 +1,383 @@
 # tictactoe/discover.py
+"""
+LAN discovery: broadcast a probe and collect TicTacToe servers' replies.
+
+`discover_iter` is an async iterator that yields each host as soon as it
+answers. The probe goes to every local interface's broadcast address at
+once (plus 255.255.255.255). Once a host has answered, the scan stops after
+`quiet` seconds without a new reply instead of sitting out the whole
+`timeout`. `discover` collects the same stream into a list (with an
+optional per-host callback), and `discover_lan` is the blocking wrapper.
+With `multicast=True` the probe goes to MULTICAST_GROUP instead, which
+servers listening on all interfaces join. Replies carry the server's load,
+and `least_loaded` picks the emptiest host.
+
+`HostRegistry` is the long-lived alternative to one-shot scans: it keeps
+every host it has heard of until the host's TTL runs out. Servers broadcast
+an "up" announcement when they start and every few seconds after, and a
+"down" one when they stop, to ANNOUNCE_PORT. The registry listens there and
+only probes once at start and then rarely (`probe_every`) to catch hosts
+whose announcements it missed, so the host list is available at once and
+the LAN sees one small datagram per host every few seconds rather than a
+probe plus a reply from every host whenever someone opens a join list.
+"""
 from __future__ import annotations
-import socket
+import asyncio
 import json
-import time
-from typing import List, Dict, Any, Tuple
+import logging
+import socket
+import struct
+import sys
+import threading
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Sequence
 
 ENC = "utf-8"
 DISCOVERY_MAGIC = b"TTT_DISCOVER_V1"
+ANNOUNCE_PORT = 9999  # same as server_net.ANNOUNCE_PORT
+MULTICAST_GROUP = "239.255.77.77"  # organization-local scope; TTL 1 keeps it on the LAN
+LIMITED_BROADCAST = "255.255.255.255"
 
-def discover_lan(timeout: float = 1.5, port: int = 9998, broadcast_addr: str = "<broadcast>") -> List[Dict[str, Any]]:
-    """
-    Broadcast a discovery ping on UDP `port` and collect TicTacToe server replies.
+def _linux_broadcasts() -> List[str]:
+    import fcntl
+    SIOCGIFFLAGS, SIOCGIFBRDADDR = 0x8913, 0x8919
+    IFF_UP, IFF_BROADCAST = 0x1, 0x2
+    out = []
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        for _, name in socket.if_nameindex():
+            req = struct.pack("256s", name.encode()[:15])
+            try:
+                flags = struct.unpack_from("H", fcntl.ioctl(s.fileno(), SIOCGIFFLAGS, req), 16)[0]
+                if flags & IFF_UP and flags & IFF_BROADCAST:
+                    out.append(socket.inet_ntoa(fcntl.ioctl(s.fileno(), SIOCGIFBRDADDR, req)[20:24]))
+            except OSError:
+                continue  # no IPv4 address on this interface
+    return out
 
-    Returns: list of dicts like
-      {
-        "ip": "10.0.0.30",
-        "port": 54321,
-        "name": "Bob",
-        "pin_required": True,
-        "service": "tictactoe",
-        "proto": 1
-      }
-    """
-    results: List[Dict[str, Any]] = []
-    seen: set[Tuple[str, int]] = set()
+def _primary_broadcast() -> List[str]:
+    """x.y.z.255 for the address the default route uses (a /24 guess)."""
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        try:
+            s.connect(("10.255.255.255", 1))  # no packet is sent
+            ip = s.getsockname()[0]
+        except OSError:
+            return []
+    return [] if ip.startswith("127.") else [ip.rsplit(".", 1)[0] + ".255"]
+
+def broadcast_addresses() -> List[str]:
+    """Directed broadcast address of each local IPv4 interface that has one,
+    followed by the limited broadcast address."""
+    found: List[str] = []
+    try:
+        found = _linux_broadcasts() if sys.platform.startswith("linux") else _primary_broadcast()
+    except (OSError, ImportError):
+        found = _primary_broadcast()
+    return list(dict.fromkeys(found + [LIMITED_BROADCAST]))
+
+def join_group(sock: socket.socket, interface: str = "0.0.0.0") -> bool:
+    """Add `sock` to MULTICAST_GROUP on `interface`; False if that fails
+    (e.g. no multicast route)."""
+    mreq = struct.pack("4s4s", socket.inet_aton(MULTICAST_GROUP), socket.inet_aton(interface))
+    try:
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
+    except OSError:
+        return False
+    return True
+
+def parse_reply(data: bytes, ip: str) -> Optional[Dict[str, Any]]:
+    """Host dict for a responder's datagram, or None if it isn't one."""
+    try:
+        payload = json.loads(data.decode(ENC))
+    except (UnicodeDecodeError, json.JSONDecodeError):
+        return None
+    if not isinstance(payload, dict) or payload.get("service") != "tictactoe":
+        return None
+    try:
+        port = int(payload.get("port") or 0)
+    except (TypeError, ValueError):
+        return None
+    if port <= 0:
+        return None
+    host = {
+        "ip": ip,
+        "port": port,
+        "name": payload.get("name") or "Host",
+        "pin_required": bool(payload.get("pin_required", True)),
+        "service": payload.get("service"),
+        "proto": payload.get("proto"),
+    }
+    if isinstance(payload.get("load"), dict):
+        host["load"] = payload["load"]  # e.g. {"rooms": 2, "sessions": 5, "waiting": 1, "players": 11}
+    for key in ("event", "ttl"):  # announcements only; HostRegistry pops them
+        if key in payload:
+            host[key] = payload[key]
+    return host
+
+class _Collector(asyncio.DatagramProtocol):
+    def __init__(self, queue: asyncio.Queue):
+        self.queue = queue
+
+    def datagram_received(self, data: bytes, addr) -> None:
+        host = parse_reply(data, addr[0])
+        if host is not None:
+            self.queue.put_nowait(host)
 
+    def error_received(self, exc: Exception) -> None:
+        pass  # e.g. ICMP unreachable from one of the broadcast targets
+
+def _targets(addresses: Optional[Sequence[str]], multicast: bool) -> Sequence[str]:
+    if addresses:
+        return addresses
+    return [MULTICAST_GROUP] if multicast else broadcast_addresses()
+
+async def discover_iter(timeout: float = 1.5, port: int = 9998, quiet: float = 0.4,
+                        addresses: Optional[Sequence[str]] = None,
+                        multicast: bool = False) -> AsyncIterator[Dict[str, Any]]:
+    """Yield each host (see discover_lan) once, as its reply arrives. The
+    probe goes to MULTICAST_GROUP instead of the broadcast addresses with
+    `multicast`."""
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
     sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+    sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 1)
+    sock.bind(("", 0))
+    transport, _ = await loop.create_datagram_endpoint(lambda: _Collector(queue), sock=sock)
     try:
-        sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
-        sock.settimeout(0.25)
+        for addr in _targets(addresses, multicast):
+            try:
+                transport.sendto(DISCOVERY_MAGIC, (addr, port))
+            except OSError:
+                continue
+        seen = set()
+        deadline = loop.time() + timeout
+        while True:
+            now = loop.time()
+            wait = deadline - now if not seen else min(deadline - now, quiet)
+            if wait <= 0:
+                return
+            try:
+                host = await asyncio.wait_for(queue.get(), wait)
+            except asyncio.TimeoutError:
+                return
+            key = (host["ip"], host["port"])
+            if key not in seen:
+                seen.add(key)
+                yield host
+    finally:
+        transport.close()
 
-        # Bind to an ephemeral port so we can receive replies
-        sock.bind(("", 0))
+async def discover(timeout: float = 1.5, port: int = 9998, quiet: float = 0.4,
+                   addresses: Optional[Sequence[str]] = None,
+                   on_host: Optional[Callable[[Dict[str, Any]], None]] = None,
+                   multicast: bool = False) -> List[Dict[str, Any]]:
+    """All hosts that answered, sorted by (ip, port); `on_host` sees each
+    one as it arrives."""
+    results = []
+    async for host in discover_iter(timeout, port, quiet, addresses, multicast):
+        results.append(host)
+        if on_host is not None:
+            on_host(host)
+    results.sort(key=lambda r: (r["ip"], r["port"]))
+    return results
 
-        # Send discovery probe
-        try:
-            sock.sendto(DISCOVERY_MAGIC, (broadcast_addr, port))
-        except OSError:
-            # Some networks don’t like <broadcast>; try 255.255.255.255 as a fallback
+def least_loaded(hosts: Sequence[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """The host with the fewest players (hosts that don't report load last)."""
+    def players(h):
+        load = h.get("load")
+        return (0, load.get("players", 0)) if isinstance(load, dict) else (1, 0)
+    return min(hosts, key=players, default=None)
+
+class _Listener(asyncio.DatagramProtocol):
+    def __init__(self, registry: "HostRegistry"):
+        self.registry = registry
+
+    def datagram_received(self, data: bytes, addr) -> None:
+        host = parse_reply(data, addr[0])
+        if host is not None:
+            self.registry._heard(host)
+
+    def error_received(self, exc: Exception) -> None:
+        pass
+
+class HostRegistry:
+    """
+    Hosts on the LAN, kept current by announcements and occasional probes.
+
+    Each entry expires after the TTL its server sent, or `ttl` for servers
+    that don't send one. With `multicast` it probes, and also hears
+    announcements, through MULTICAST_GROUP. Run it inside an event loop (`await start()` /
+    `await aclose()`) or on its own thread (`start_thread()` / `close()`).
+    `hosts()` and `subscribe()` may be used from any thread; subscribers
+    are called with the new host list on the registry's thread.
+    """
+    def __init__(self, port: int = 9998, announce_port: Optional[int] = ANNOUNCE_PORT,
+                 ttl: float = 150.0, probe_every: float = 60.0, probe_timeout: float = 1.5,
+                 addresses: Optional[Sequence[str]] = None, listen_ip: str = "", multicast: bool = False):
+        self.port = port
+        self.multicast = multicast
+        self.announce_port = announce_port
+        self.ttl = ttl
+        self.probe_every = probe_every
+        self.probe_timeout = probe_timeout
+        self.addresses = addresses
+        self.listen_ip = listen_ip
+        self.listening = False  # False if the announce port couldn't be bound
+        self._hosts: Dict[tuple, Dict[str, Any]] = {}
+        self._expires: Dict[tuple, float] = {}
+        self._snapshot: List[Dict[str, Any]] = []
+        self._subscribers: List[Callable[[List[Dict[str, Any]]], None]] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._transport = None
+        self._task = None
+        self._wake: Optional[asyncio.Event] = None
+        self._stop: Optional[asyncio.Event] = None
+        self._thread: Optional[threading.Thread] = None
+        self._next_probe = 0.0
+
+    def hosts(self) -> List[Dict[str, Any]]:
+        """Live hosts sorted by (ip, port)."""
+        return self._snapshot
+
+    def subscribe(self, fn: Callable[[List[Dict[str, Any]]], None]) -> Callable[[], None]:
+        """Call `fn(hosts)` on every change; returns the unsubscribe function."""
+        self._subscribers.append(fn)
+        def unsubscribe():
+            if fn in self._subscribers:
+                self._subscribers.remove(fn)
+        return unsubscribe
+
+    def probe(self) -> None:
+        """Probe now rather than at the next `probe_every` (thread-safe)."""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._probe_soon)
+
+    def _probe_soon(self) -> None:
+        self._next_probe = 0.0
+        self._wake.set()
+
+    async def start(self) -> "HostRegistry":
+        self._loop = asyncio.get_running_loop()
+        self._wake, self._stop = asyncio.Event(), asyncio.Event()
+        if self.announce_port:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            # several registries on one machine all get the broadcasts
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            if hasattr(socket, "SO_REUSEPORT"):
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
             try:
-                sock.sendto(DISCOVERY_MAGIC, ("255.255.255.255", port))
-            except Exception:
-                pass
+                sock.bind((self.listen_ip, self.announce_port))
+                if self.multicast:
+                    join_group(sock)
+                self._transport, _ = await self._loop.create_datagram_endpoint(lambda: _Listener(self), sock=sock)
+                self.listening = True
+            except OSError:
+                sock.close()  # probes alone still work
+        self._task = asyncio.create_task(self._run())
+        return self
 
-        # Collect replies until timeout window closes
-        deadline = time.time() + timeout
-        while time.time() < deadline:
+    async def aclose(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
             try:
-                data, addr = sock.recvfrom(4096)
-            except socket.timeout:
-                continue
-            except Exception:
-                break
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._transport is not None:
+            self._transport.close()
+            self._transport = None
+
+    def start_thread(self) -> "HostRegistry":
+        """Run on a daemon thread with its own event loop; returns once started."""
+        ready = threading.Event()
 
-            ip = addr[0]
+        async def main():
             try:
-                payload = json.loads(data.decode(ENC))
-            except Exception:
-                continue
+                await self.start()
+            finally:
+                ready.set()
+            await self._stop.wait()
+            await self.aclose()
 
-            if not isinstance(payload, dict):
-                continue
-            if payload.get("service") != "tictactoe":
-                continue
+        self._thread = threading.Thread(target=asyncio.run, args=(main(),), daemon=True, name="ttt-registry")
+        self._thread.start()
+        ready.wait()
+        return self
 
-            host_port = int(payload.get("port") or 0)
-            if host_port <= 0:
-                continue
+    def close(self) -> None:
+        """Stop a registry started with start_thread()."""
+        if self._thread is not None:
+            self._loop.call_soon_threadsafe(self._stop.set)
+            self._thread.join(2)
+            self._thread = None
 
-            key = (ip, host_port)
-            if key in seen:
-                continue
-            seen.add(key)
+    async def _run(self) -> None:
+        loop = self._loop
+        while True:
+            if loop.time() >= self._next_probe:
+                try:
+                    async for host in discover_iter(self.probe_timeout, self.port, addresses=self.addresses,
+                                                   multicast=self.multicast):
+                        self._heard(host)
+                except OSError as e:  # e.g. no IPv4 route yet; announcements still arrive
+                    logging.warning(f"LAN probe failed: {e}")
+                self._next_probe = loop.time() + self.probe_every
+            now = loop.time()
+            gone = [key for key, t in self._expires.items() if t <= now]
+            for key in gone:
+                del self._hosts[key], self._expires[key]
+            if gone:
+                self._changed()
+            self._wake.clear()
+            due = min(self._next_probe, *self._expires.values()) if self._expires else self._next_probe
+            try:
+                await asyncio.wait_for(self._wake.wait(), max(0.0, due - now))
+            except asyncio.TimeoutError:
+                pass
 
-            results.append({
-                "ip": ip,
-                "port": host_port,
-                "name": payload.get("name") or "Host",
-                "pin_required": bool(payload.get("pin_required", True)),
-                "service": payload.get("service"),
-                "proto": payload.get("proto"),
-            })
+    def _heard(self, host: Dict[str, Any]) -> None:
+        key = (host["ip"], host["port"])
+        event, ttl = host.pop("event", None), host.pop("ttl", None)
+        if event == "down":
+            if self._hosts.pop(key, None) is not None:
+                del self._expires[key]
+                self._changed()
+            return
+        try:
+            ttl = float(ttl) if ttl is not None else self.ttl
+        except (TypeError, ValueError):
+            ttl = self.ttl
+        known = key in self._expires
+        self._expires[key] = self._loop.time() + ttl
+        if self._hosts.get(key) != host:
+            self._hosts[key] = host
+            self._changed()
+        if not known:
+            self._wake.set()  # may expire before whatever _run is waiting for
 
-    finally:
-        sock.close()
+    def _changed(self) -> None:
+        self._snapshot = [self._hosts[k] for k in sorted(self._hosts)]
+        for fn in list(self._subscribers):
+            fn(self._snapshot)
 
-    # Sort by IP then port for consistency
-    results.sort(key=lambda r: (r["ip"], r["port"]))
-    return results
+def discover_lan(timeout: float = 1.5, port: int = 9998, broadcast_addr: Optional[str] = None,
+                 quiet: float = 0.4) -> List[Dict[str, Any]]:
+    """
+    Blocking scan (don't call it from a running event loop or a GUI thread).
+
+    Returns: list of dicts like
+      {
+        "ip": "10.0.0.30",
+        "port": 54321,
+        "name": "Bob",
+        "pin_required": True,
+        "service": "tictactoe",
+        "proto": 1
+      }
+    """
+    if broadcast_addr == "<broadcast>":
+        broadcast_addr = LIMITED_BROADCAST
+    return asyncio.run(discover(timeout, port, quiet, [broadcast_addr] if broadcast_addr else None))
 
 
 # Optional CLI for testing: `python -m tictactoe.discover --port 9998`
@@ -96,16 +386,40 @@ def _parse_args():
     ap = argparse.ArgumentParser(description="Discover TicTacToe hosts on LAN.")
     ap.add_argument("--port", type=int, default=9998)
     ap.add_argument("--timeout", type=float, default=1.5)
+    ap.add_argument("--quiet", type=float, default=0.4, help="stop this long after the last new reply")
+    ap.add_argument("--watch", action="store_true", help="keep a host registry running and print every change")
+    ap.add_argument("--announce-port", type=int, default=ANNOUNCE_PORT)
+    ap.add_argument("--multicast", action="store_true", help=f"probe {MULTICAST_GROUP} instead of broadcasting")
     return ap.parse_args()
 
+async def _watch(args):
+    def changed(hosts):
+        print(f"-- {len(hosts)} host(s)")
+        for h in hosts:
+            _show(h)
+    registry = HostRegistry(args.port, args.announce_port, probe_timeout=args.timeout, multicast=args.multicast)
+    registry.subscribe(changed)
+    await registry.start()
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await registry.aclose()
+
+def _show(h):
+    load = h.get("load")
+    busy = f"  {load.get('players', 0)} players, {load.get('rooms', 0)} rooms" if load else ""
+    print(f"{h['ip']}:{h['port']}  {h.get('name','Host')}  (pin_required={h.get('pin_required', True)}){busy}")
+
 def main():
     args = _parse_args()
-    hosts = discover_lan(timeout=args.timeout, port=args.port)
-    if not hosts:
-        print("No hosts found.")
+    if args.watch:
+        try:
+            asyncio.run(_watch(args))
+        except KeyboardInterrupt:
+            pass
         return
-    for h in hosts:
-        print(f"{h['ip']}:{h['port']}  {h.get('name','Host')}  (pin_required={h.get('pin_required', True)})")
+    if not asyncio.run(discover(args.timeout, args.port, args.quiet, on_host=_show, multicast=args.multicast)):
+        print("No hosts found.")
 
 if __name__ == "__main__":
     main()
@@ -1,20 +1,242 @@
 from __future__ import annotations
 from dataclasses import dataclass
 from typing import List, Optional, Tuple
+from .bitboard import BitBoard, IS_WIN
 
 Player = str  # "X" or "O"
 
-@dataclass
 class Game:
+    """3x3 game backed by `BitBoard` masks.
+
+    `board` is exposed as the usual list of " "/"X"/"O" (built on access),
+    so callers and the JSON `state` messages see the same shape as before.
+    """
+    __slots__ = ("bb",)
+    width = height = k = 3
+
+    def __init__(self, board: Optional[List[str]] = None, turn: Player = "X"):
+        self.bb = BitBoard.from_cells(board, turn) if board is not None else BitBoard()
+
+    @classmethod
+    def new(cls) -> "Game":
+        return cls()
+
+    @property
+    def board(self) -> List[str]:
+        return self.bb.cells()
+
+    @board.setter
+    def board(self, cells: List[str]) -> None:
+        self.bb = BitBoard.from_cells(cells, self.turn)
+
+    @property
+    def turn(self) -> Player:
+        return "X" if self.bb.x_to_move else "O"
+
+    @turn.setter
+    def turn(self, p: Player) -> None:
+        self.bb.x_to_move = (p == "X")
+
+    def __repr__(self) -> str:
+        return f"Game(board={self.board!r}, turn={self.turn!r})"
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Game):
+            return NotImplemented
+        bb, ob = self.bb, other.bb
+        return (bb.x, bb.o, bb.x_to_move) == (ob.x, ob.o, ob.x_to_move)
+
+    def clone(self) -> "Game":
+        g = Game.__new__(Game)
+        g.bb = self.bb.copy()
+        return g
+
+    def moves(self) -> List[int]:
+        return list(self.bb.moves())
+
+    def play(self, idx: int) -> bool:
+        """Attempt to play at index (1..9). Returns True if success."""
+        bb = self.bb
+        idx = idx - 1
+        if 0 <= idx < 9 and not ((bb.x | bb.o) >> idx & 1) and not (IS_WIN[bb.x] or IS_WIN[bb.o]):
+            bb.make(idx)
+            return True
+        return False
+
+    def winner(self) -> Optional[Player]:
+        return self.bb.winner()
+
+    def terminal(self) -> bool:
+        return self.bb.terminal()
+
+    def score(self, max_player: Player) -> int:
+        w = self.winner()
+        if w == max_player:
+            return +1
+        if w and w != max_player:
+            return -1
+        return 0  # draw or non-terminal (only used at leaf)
+
+    def pretty(self) -> str:
+        b = self.board
+        rows = [" | ".join(b[i:i+3]) for i in range(0, 9, 3)]
+        return f"\n{rows[0]}\n---------\n{rows[1]}\n---------\n{rows[2]}\n"
+
+
+# Direction steps (dr, dc) for win lines: horizontal, vertical, two diagonals.
+_DIRS = ((0, 1), (1, 0), (1, 1), (1, -1))
+
+class MNKGame:
+    """width x height board, k in a row wins (e.g. 15x15 five-in-a-row).
+
+    Same API as `Game` (1-based `play`, 0-based `moves`). The winner is
+    found after each move by walking only the lines through the played
+    cell, and played cells are kept in `history` so `undo` is O(1).
+    """
+    def __init__(self, width: int = 15, height: int = 15, k: int = 5,
+                 board: Optional[List[str]] = None, turn: Player = "X"):
+        if not (1 <= k <= max(width, height)):
+            raise ValueError("k must fit on the board")
+        self.width, self.height, self.k = width, height, k
+        self.turn = turn
+        self.history: List[int] = []
+        self._winner: Optional[Player] = None
+        self._filled = 0
+        self.cells: List[str] = [" "] * (width * height)
+        if board is not None:
+            self.board = board
+
+    @classmethod
+    def new(cls, width: int = 15, height: int = 15, k: int = 5) -> "MNKGame":
+        return cls(width, height, k)
+
+    @property
+    def board(self) -> List[str]:
+        return self.cells
+
+    @board.setter
+    def board(self, cells: List[str]) -> None:
+        """Load a whole position (e.g. from a `state` message); rescans once."""
+        if len(cells) != self.width * self.height:
+            raise ValueError("board size does not match dimensions")
+        self.cells = list(cells)
+        self.history = []
+        self._filled = sum(1 for c in self.cells if c != " ")
+        self._winner = None
+        for i, c in enumerate(self.cells):
+            if c != " " and self._line_through(i):
+                self._winner = c
+                break
+
+    def clone(self) -> "MNKGame":
+        g = MNKGame.__new__(MNKGame)
+        g.width, g.height, g.k = self.width, self.height, self.k
+        g.turn = self.turn
+        g.cells = self.cells.copy()
+        g.history = self.history.copy()
+        g._winner = self._winner
+        g._filled = self._filled
+        return g
+
+    def moves(self) -> List[int]:
+        return [i for i, c in enumerate(self.cells) if c == " "]
+
+    def near_moves(self, radius: int = 1) -> List[int]:
+        """Empty cells within `radius` of a mark (the center on an empty
+        board). Cuts the branching factor on big boards."""
+        cells, w, h = self.cells, self.width, self.height
+        seen = set()
+        for i, c in enumerate(cells):
+            if c == " ":
+                continue
+            r0, c0 = divmod(i, w)
+            for r in range(max(0, r0 - radius), min(h, r0 + radius + 1)):
+                for cc in range(max(0, c0 - radius), min(w, c0 + radius + 1)):
+                    j = r * w + cc
+                    if cells[j] == " ":
+                        seen.add(j)
+        if not seen:
+            center = (h // 2) * w + w // 2
+            return [center] if cells[center] == " " else self.moves()
+        return sorted(seen)
+
+    def _line_through(self, i: int) -> bool:
+        """True if the stone on cell i is part of k in a row. O(k)."""
+        w, h, k, cells = self.width, self.height, self.k, self.cells
+        mark = cells[i]
+        r0, c0 = divmod(i, w)
+        for dr, dc in _DIRS:
+            n = 1
+            for sgn in (1, -1):
+                r, c = r0 + sgn * dr, c0 + sgn * dc
+                while n < k and 0 <= r < h and 0 <= c < w and cells[r * w + c] == mark:
+                    n += 1
+                    r += sgn * dr; c += sgn * dc
+            if n >= k:
+                return True
+        return False
+
+    def play(self, idx: int) -> bool:
+        """Attempt to play at index (1..width*height). Returns True if success."""
+        idx = idx - 1
+        if 0 <= idx < len(self.cells) and self.cells[idx] == " " and self._winner is None:
+            self.cells[idx] = self.turn
+            self.history.append(idx)
+            self._filled += 1
+            if self._line_through(idx):
+                self._winner = self.turn
+            self.turn = "O" if self.turn == "X" else "X"
+            return True
+        return False
+
+    def undo(self) -> None:
+        """Take back the last move made with `play`."""
+        idx = self.history.pop()
+        self.cells[idx] = " "
+        self._filled -= 1
+        self._winner = None  # play() refuses moves after a win
+        self.turn = "O" if self.turn == "X" else "X"
+
+    def winner(self) -> Optional[Player]:
+        return self._winner
+
+    def terminal(self) -> bool:
+        return self._winner is not None or self._filled == len(self.cells)
+
+    def score(self, max_player: Player) -> int:
+        w = self._winner
+        if w == max_player:
+            return +1
+        if w and w != max_player:
+            return -1
+        return 0
+
+    def pretty(self) -> str:
+        w = self.width
+        rows = [" ".join(c if c != " " else "." for c in self.cells[r*w:(r+1)*w]) for r in range(self.height)]
+        return "\n" + "\n".join(rows) + "\n"
+
+
+def new_game(width: int = 3, height: int = 3, k: int = 3):
+    """Bitboard `Game` for classic 3x3, `MNKGame` for anything else."""
+    if (width, height, k) == (3, 3, 3):
+        return Game.new()
+    return MNKGame(width, height, k)
+
+
+@dataclass
+class ListGame:
+    """Original list-of-strings implementation, kept as a reference for
+    tests and `bench.py`."""
     board: List[str]
     turn: Player = "X"
 
     @classmethod
-    def new(cls) -> "Game":
+    def new(cls) -> "ListGame":
         return cls([" "] * 9, "X")
 
-    def clone(self) -> "Game":
-        return Game(self.board.copy(), self.turn)
+    def clone(self) -> "ListGame":
+        return ListGame(self.board.copy(), self.turn)
 
     def moves(self) -> List[int]:
         return [i for i, c in enumerate(self.board) if c == " "]
@@ -27,7 +249,6 @@ class Game:
             self.turn = "O" if self.turn == "X" else "X"
             return True
         return False
-    
 
     def winner(self) -> Optional[Player]:
         b = self.board
@@ -50,9 +271,4 @@ class Game:
             return +1
         if w and w != max_player:
             return -1
-        return 0  # draw or non-terminal (only used at leaf)
-
-    def pretty(self) -> str:
-        b = self.board
-        rows = [" | ".join(b[i:i+3]) for i in range(0, 9, 3)]
-        return f"\n{rows[0]}\n---------\n{rows[1]}\n---------\n{rows[2]}\n"
+        return 0
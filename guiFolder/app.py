@@ -14,6 +14,7 @@ class TicTacToeApp(tk.Tk):
         self.mode = tk.StringVar(value="PvAI")
         self.diff_label = tk.StringVar(value="Hard")
         self.depth_limit = DIFFICULTIES[self.diff_label.get()]
+        self.variant = tk.StringVar(value="3x3")
 
         self.net = {
             "active": False,
@@ -23,7 +24,7 @@ class TicTacToeApp(tk.Tk):
             "port": 0,
             "pin": "",
             "name": "",
-            "server_proc": None,
+            "server": None,  # server_net.EmbeddedServer while hosting
         }
 
         container = ttk.Frame(self); container.grid(sticky="nsew")
@@ -1,6 +1,14 @@
 CELL = 100
 PAD = 8
 GRID = 3
+MAX_BOARD_PX = 600  # bigger boards shrink CELL to fit
+
+# Board variants: label -> (width, height, k in a row)
+VARIANTS = {
+    "3x3": (3, 3, 3),
+    "7x6 (4 in a row)": (7, 6, 4),
+    "15x15 (5 in a row)": (15, 15, 5),
+}
 
 # Difficulty presets: label -> depth_limit
 DIFFICULTIES = {
@@ -8,3 +16,10 @@ DIFFICULTIES = {
     "Medium": 3,
     "Hard": 9,
 }
+
+# MCTS tree iterations per difficulty, used on boards bigger than 3x3
+MCTS_ITERATIONS = {
+    "Easy": 30,
+    "Medium": 200,
+    "Hard": 800,
+}
@@ -1,9 +1,11 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
-import threading, asyncio, json, time
-from ...game import Game
-from ...ai import best_move
-from ..config import CELL, PAD, GRID, DIFFICULTIES
+import threading, asyncio, json
+from ...game import Game, new_game
+from ...ai import best_move, BIG_BOARD_TIME_MS
+from ...mcts import MCTSPlayer
+from ...client_net import reconnect
+from ..config import CELL, PAD, GRID, DIFFICULTIES, VARIANTS, MAX_BOARD_PX, MCTS_ITERATIONS
 
 # ---------- Minimal embedded async client for network play ----------
 ENC = "utf-8"
@@ -28,6 +30,8 @@ class NetClient:
         self.reader = None
         self.writer = None
         self.thread = None
+        self.token = None     # resume token from matched/resumed
+        self._ended = False
         self._stopping = False
 
     def start(self):
@@ -45,14 +49,35 @@ class NetClient:
             self.writer.write(_dumps({"type": "hello", "name": self.name, "pin": self.pin}))
             await self.writer.drain()
             while True:
-                msg = await _read_json_line(self.reader)
+                try:
+                    msg = await _read_json_line(self.reader)
+                except ConnectionError:
+                    msg = None
                 if msg is None:
+                    if await self._reconnect():
+                        continue
                     self.on_event({"type": "_disconnect"})
                     return
+                if msg.get("status") in ("matched", "resumed"):
+                    self.token = msg.get("token")
+                elif msg.get("type") == "end":
+                    self._ended = True
                 self.on_event(msg)
         except Exception as e:
             self.on_event({"type": "_error", "error": str(e)})
 
+    async def _reconnect(self) -> bool:
+        """After a dropped connection, retry with backoff using the resume token."""
+        if not self.token or self._ended or self._stopping:
+            return False
+        self.writer.close()
+        got = await reconnect(self.host, self.port, self.token,
+                              on_attempt=lambda n: self.on_event({"type": "_reconnecting", "attempt": n}))
+        if got is None:
+            return False
+        self.reader, self.writer = got[:2]
+        return True
+
     def send_move(self, idx: int):
         if not self.writer or not self.loop:
             return
@@ -96,6 +121,51 @@ class NetClient:
         except Exception:
             pass
 
+class LocalNetClient(NetClient):
+    """The host's own seat in an EmbeddedServer: runs on the server's event
+    loop and talks to it through a LocalPeer, so there is no socket and no
+    JSON between the host's board and the server."""
+    def __init__(self, server, name: str, on_event):
+        super().__init__("", server.port, name, server.pin, on_event)
+        self.server = server
+        self.peer = None
+
+    def start(self):
+        self.loop = self.server.loop
+        asyncio.run_coroutine_threadsafe(self._amain(), self.loop)
+
+    async def _amain(self):
+        try:
+            self.peer = await self.server.join_local(self.name)
+            while True:
+                msg = await self.peer.recv()
+                if msg is None:
+                    if not self._stopping:
+                        self.on_event({"type": "_disconnect"})
+                    return
+                if msg.get("type") == "end":
+                    self._ended = True
+                self.on_event(msg)
+        except Exception as e:
+            self.on_event({"type": "_error", "error": str(e)})
+
+    def send_move(self, idx: int):
+        if self.peer is not None:
+            self.loop.call_soon_threadsafe(self.peer.send, {"type": "move", "idx": idx})
+
+    def _shutdown(self, send_quit: bool):
+        if self._stopping or self.peer is None:
+            return
+        self._stopping = True
+        def bye():
+            if send_quit:
+                self.peer.send({"type": "quit"})
+            self.peer.hang_up()
+        try:
+            self.loop.call_soon_threadsafe(bye)
+        except RuntimeError:
+            pass  # the server's loop is already gone
+
 # ---------- Game Page ----------
 class GamePage(ttk.Frame):
     """PvAI, PvP Local, or Network (LAN).
@@ -131,7 +201,9 @@ class GamePage(ttk.Frame):
 
         # State
         self.g = None
+        self.cell = CELL
         self.ai_mark = None
+        self.mcts = None  # big-board AI, one tree per game
         self.last_move_cell = None
 
         # Network helpers
@@ -159,8 +231,8 @@ class GamePage(ttk.Frame):
             self.new_btn.grid()
 
         if self.is_network:
-            # Network mode
-            self.g = Game.new()
+            # Network mode (dimensions follow the server's state messages)
+            self._set_game(Game.new())
             self.ai_mark = None
 
             if full_refresh_title:
@@ -173,23 +245,32 @@ class GamePage(ttk.Frame):
             if self.c.net.get("connect_client"):
                 self.update_status("Connecting…")
                 if not self.net_client:
-                    self.net_client = NetClient(
-                        host=self.c.net["host"],
-                        port=self.c.net["port"],
-                        name=self.c.net.get("name") or ("LocalPlayer" if self.c.net.get("is_host") else "GuestPlayer"),
-                        pin=self.c.net["pin"],
-                        on_event=self._net_event
-                    )
+                    name = self.c.net.get("name") or ("LocalPlayer" if self.c.net.get("is_host") else "GuestPlayer")
+                    if self.c.net.get("server") is not None:
+                        # hosting in-process: sit in without a socket
+                        self.net_client = LocalNetClient(self.c.net["server"], name, self._net_event)
+                    else:
+                        self.net_client = NetClient(
+                            host=self.c.net["host"],
+                            port=self.c.net["port"],
+                            name=name,
+                            pin=self.c.net["pin"],
+                            on_event=self._net_event
+                        )
                     self.net_client.start()
             else:
                 self.update_status("Waiting for opponent… (host is seated)")
         else:
             # Local modes
-            self.g = Game.new()
+            self._set_game(new_game(*VARIANTS[self.c.variant.get()]))
             if self.c.mode.get() == "PvAI":
                 self.ai_mark = "O"  # human is X
             else:
                 self.ai_mark = None
+            self.mcts = None
+            if self.ai_mark and not isinstance(self.g, Game):
+                self.mcts = MCTSPlayer(iterations=MCTS_ITERATIONS[self.c.diff_label.get()],
+                                       time_ms=BIG_BOARD_TIME_MS)
 
             if full_refresh_title:
                 if self.c.mode.get() == "PvAI":
@@ -203,31 +284,41 @@ class GamePage(ttk.Frame):
             if self.c.mode.get() == "PvAI" and self.g.turn == self.ai_mark:
                 self.after(150, self.ai_reply)
 
+    def _set_game(self, g):
+        """Swap in a game and size the canvas to its board."""
+        self.g = g
+        self.cell = min(CELL, MAX_BOARD_PX // max(g.width, g.height))
+        self.canvas.config(width=g.width*self.cell, height=g.height*self.cell)
+
     # ---------- Drawing ----------
     def draw(self):
         c = self.canvas
+        cell, w, h = self.cell, self.g.width, self.g.height
+        m = max(3, cell * 15 // CELL)  # mark inset
         c.delete("all")
         # grid
-        for i in range(1, GRID):
-            c.create_line(i*CELL, 0, i*CELL, GRID*CELL, width=2)
-            c.create_line(0, i*CELL, GRID*CELL, i*CELL, width=2)
+        for i in range(1, w):
+            c.create_line(i*cell, 0, i*cell, h*cell, width=2)
+        for i in range(1, h):
+            c.create_line(0, i*cell, w*cell, i*cell, width=2)
         # highlight
         if self.last_move_cell is not None:
             r, col = self.last_move_cell
-            x0, y0 = col*CELL, r*CELL
-            x1, y1 = x0 + CELL, y0 + CELL
+            x0, y0 = col*cell, r*cell
+            x1, y1 = x0 + cell, y0 + cell
             c.create_rectangle(x0+2, y0+2, x1-2, y1-2, outline="#4a90e2", width=3)
         # marks / hints
         for i, mark in enumerate(self.g.board):
-            x = (i % GRID) * CELL
-            y = (i // GRID) * CELL
+            x = (i % w) * cell
+            y = (i // w) * cell
             if mark == "X":
-                c.create_line(x+15, y+15, x+CELL-15, y+CELL-15, width=3)
-                c.create_line(x+CELL-15, y+15, x+15, y+CELL-15, width=3)
+                c.create_line(x+m, y+m, x+cell-m, y+cell-m, width=3)
+                c.create_line(x+cell-m, y+m, x+m, y+cell-m, width=3)
             elif mark == "O":
-                c.create_oval(x+15, y+15, x+CELL-15, y+CELL-15, width=3)
+                c.create_oval(x+m, y+m, x+cell-m, y+cell-m, width=3)
             else:
-                c.create_text(x + CELL//2, y + CELL//2, text=str(i+1), fill="#cccccc", font=("Arial", 18))
+                c.create_text(x + cell//2, y + cell//2, text=str(i+1), fill="#cccccc",
+                              font=("Arial", max(7, cell * 18 // CELL)))
 
     # ---------- Status ----------
     def update_status(self, msg=None):
@@ -244,17 +335,19 @@ class GamePage(ttk.Frame):
             if self.g.turn == self.ai_mark:
                 self.status.config(text=f"AI (O) thinking… [{self.c.diff_label.get()}]")
             else:
-                self.status.config(text="Your turn (X). Click a square (1–9).")
+                self.status.config(text="Your turn (X). Click a square.")
         else:
-            self.status.config(text=f"PvP Local — {self.g.turn}'s turn. Click a square (1–9).")
+            self.status.config(text=f"PvP Local — {self.g.turn}'s turn. Click a square.")
 
     # ---------- Input ----------
     def on_click(self, event):
         if self.g.terminal():
             return
-        col = event.x // CELL
-        row = event.y // CELL
-        idx = row * GRID + col + 1  # 1-based
+        col = event.x // self.cell
+        row = event.y // self.cell
+        if not (0 <= col < self.g.width and 0 <= row < self.g.height):
+            return
+        idx = row * self.g.width + col + 1  # 1-based
 
         if self.is_network:
             if self.net_client:
@@ -281,10 +374,13 @@ class GamePage(ttk.Frame):
     def ai_reply(self):
         if self.g.terminal():
             self.finish(); return
-        depth = DIFFICULTIES[self.c.diff_label.get()]
-        idx, _ = best_move(self.g, as_player=self.ai_mark, depth_limit=depth)
+        if self.mcts:
+            idx, _ = self.mcts.best_move(self.g)
+        else:
+            depth = DIFFICULTIES[self.c.diff_label.get()]
+            idx, _ = best_move(self.g, as_player=self.ai_mark, depth_limit=depth)
         zero = idx - 1
-        row, col = zero // GRID, zero % GRID
+        row, col = zero // self.g.width, zero % self.g.width
         self.g.play(idx)
         self.last_move_cell = (row, col)
         self.draw()
@@ -318,21 +414,14 @@ class GamePage(ttk.Frame):
             except Exception:
                 pass
 
-        sp = self.c.net.get("server_proc")
-        if self.is_network and self.c.net.get("is_host") and sp:
+        server = self.c.net.get("server")
+        if self.is_network and self.c.net.get("is_host") and server:
             try:
-                if sp.poll() is None:
-                    sp.terminate()
-                    for _ in range(10):
-                        if sp.poll() is not None:
-                            break
-                        time.sleep(0.05)
-                    if sp.poll() is None:
-                        sp.kill()
+                server.stop()
             except Exception:
                 pass
             finally:
-                self.c.net["server_proc"] = None
+                self.c.net["server"] = None
 
         self.net_client = None
         if self.is_network:
@@ -352,21 +441,14 @@ class GamePage(ttk.Frame):
             except Exception:
                 pass
 
-        sp = self.c.net.get("server_proc")
-        if self.is_network and self.c.net.get("is_host") and sp:
+        server = self.c.net.get("server")
+        if self.is_network and self.c.net.get("is_host") and server:
             try:
-                if sp.poll() is None:
-                    sp.terminate()
-                    for _ in range(10):
-                        if sp.poll() is not None:
-                            break
-                        time.sleep(0.05)
-                    if sp.poll() is None:
-                        sp.kill()
+                server.stop()
             except Exception:
                 pass
             finally:
-                self.c.net["server_proc"] = None
+                self.c.net["server"] = None
 
         self.net_client = None
         if self.is_network:
@@ -382,13 +464,23 @@ class GamePage(ttk.Frame):
         t = msg.get("type")
         if t in ("hello", "status") and msg.get("status") == "waiting_for_opponent":
             self.update_status("Waiting for opponent…")
-        elif msg.get("status") == "matched" or t == "hello":
+        elif msg.get("status") in ("matched", "resumed") or t == "hello":
             you = msg.get("you")
             opp = msg.get("opponent")
             if you or opp:
-                self.update_status(f"Matched: you={you} vs {opp}")
+                verb = "Reconnected" if msg.get("status") == "resumed" else "Matched"
+                self.update_status(f"{verb}: you={you} vs {opp}")
+        elif t == "_reconnecting":
+            self.update_status(f"Connection lost — reconnecting (attempt {msg.get('attempt')})…")
+        elif t == "opponent_away":
+            self.update_status(f"Opponent disconnected — holding their seat for {msg.get('grace', 0):g}s…")
+        elif t == "opponent_back":
+            self.update_status("Opponent is back.")
         elif t == "state":
             board = msg.get("board", [" "] * 9)
+            dims = (msg.get("width", 3), msg.get("height", 3), msg.get("k", 3))
+            if dims != (self.g.width, self.g.height, self.g.k):
+                self._set_game(new_game(*dims))
             self.g.board = board[:]
             self.g.turn = msg.get("turn", "X")
             self.draw()
@@ -397,7 +489,7 @@ class GamePage(ttk.Frame):
             else:
                 self.update_status()
         elif t == "your_turn":
-            self.update_status("Your turn — click a square (1–9).")
+            self.update_status("Your turn — click a square.")
         elif t == "end":
             if self.is_network and self.net_client:
                 try:
@@ -1,6 +1,6 @@
 import tkinter as tk
 from tkinter import ttk
-from ..config import DIFFICULTIES
+from ..config import DIFFICULTIES, VARIANTS
 
 class HomePage(ttk.Frame):
     """Landing page: choose mode (PvAI / PvP Local) + PvAI options (difficulty, role)."""
@@ -26,6 +26,12 @@ class HomePage(ttk.Frame):
         self.diff_box.grid(row=2, column=1, sticky="w", padx=(0,16), pady=4)
         self.diff_box.bind("<<ComboboxSelected>>", lambda _e: self.c.update_depth_from_label())
 
+        # Board size (also used when hosting)
+        ttk.Label(self, text="Board:").grid(row=3, column=0, sticky="w", padx=(16,8), pady=4)
+        self.variant_box = ttk.Combobox(self, state="readonly", width=16,
+                                        textvariable=self.c.variant, values=list(VARIANTS.keys()))
+        self.variant_box.grid(row=3, column=1, sticky="w", padx=(0,16), pady=4)
+
         ttk.Button(self, text="Start Game", command=lambda: self.c.show("GamePage")).grid(
             row=4, column=0, columnspan=3, pady=(12, 16), ipadx=12
         )
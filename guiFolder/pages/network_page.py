@@ -1,30 +1,21 @@
 # tictactoe/gui/pages/network_page.py
-import sys, socket, subprocess
+import queue
 import tkinter as tk
 from tkinter import ttk, messagebox, simpledialog, font
-from ...discover import discover_lan
-
-def first_free_port(start=49152, end=65535, host="0.0.0.0") -> int | None:
-    """Return first available TCP port in [start, end], or None if none found."""
-    for p in range(start, end + 1):
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-            s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            try:
-                s.bind((host, p))
-            except OSError:
-                continue
-            return p
-    return None
+from ...discover import HostRegistry
+from ...server_net import EmbeddedServer
+from ..config import VARIANTS
 
 class NetworkPage(ttk.Frame):
     """
     Multiplayer page with two buttons:
-      - Host: launch server, connect GUI as host player
-      - Join: scan LAN, display available hosts as clickable buttons
+      - Host: run a server in-process, seat the GUI as host player
+      - Join: display the LAN's hosts as clickable buttons
     """
     def __init__(self, parent, controller):
         super().__init__(parent)
         self.c = controller
+        self.registry = None  # HostRegistry, started the first time the page is shown
 
         ttk.Label(self, text="Multiplayer", font=("Segoe UI", 18, "bold")).grid(
             row=0, column=0, columnspan=2, pady=(16, 12)
@@ -44,6 +35,14 @@ class NetworkPage(ttk.Frame):
             row=3, column=0, columnspan=2, pady=(0, 16)
         )
 
+    def on_show(self):
+        # Start listening for hosts now, so Join has a list ready.
+        if self.registry is None:
+            try:
+                self.registry = HostRegistry().start_thread()
+            except OSError:
+                self.registry = None
+
     # ---------------- Host flow ----------------
     def _host(self):
         name = simpledialog.askstring("Your Name", "Enter your display name:", parent=self)
@@ -51,17 +50,11 @@ class NetworkPage(ttk.Frame):
         pin = simpledialog.askstring("Set PIN", "Enter a game PIN:", show="•", parent=self)
         if not pin: return
 
-        port = first_free_port()
-        if not port:
-            messagebox.showerror("No Ports", "Couldn't find a free port to host on.")
-            return
-
+        # The server runs on a background loop in this process; remote
+        # players reach it over TCP on whatever port the OS gave it.
+        width, height, k = VARIANTS[self.c.variant.get()]
         try:
-            self.c.net["server_proc"] = subprocess.Popen(
-                [sys.executable, "-m", "tictactoe.server_net",
-                 "--host", "0.0.0.0", "--port", str(port), "--pin", pin, "--host-name", name], 
-                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
-            )
+            server = EmbeddedServer(pin, name=name.strip(), width=width, height=height, k=k).start()
         except Exception as e:
             messagebox.showerror("Host Error", f"Failed to start server:\n{e}")
             return
@@ -71,24 +64,19 @@ class NetworkPage(ttk.Frame):
             "is_host": True,
             "connect_client": True,
             "host": "127.0.0.1",
-            "port": port,
+            "port": server.port,
             "pin": pin,
             "name": name.strip(),
+            "server": server,
         })
         self.c.show("GamePage")
 
 
 # ---------------- Join flow ----------------
     def _join(self):
-        try:
-            servers = discover_lan(timeout=2.0)
-        except Exception as e:
-            messagebox.showerror("Scan Failed", str(e)); return
-
-        if not servers:
-            messagebox.showinfo("No Hosts", "No LAN hosts found."); return
-
-        # Build popup
+        # The registry already knows the LAN's hosts; the popup shows them at
+        # once and redraws whenever one comes or goes.
+        self.on_show()
         popup = tk.Toplevel(self)
         popup.title("Select Host")
         popup.resizable(False, False)
@@ -96,34 +84,86 @@ class NetworkPage(ttk.Frame):
         ttk.Label(popup, text="Available Games", font=("Segoe UI", 14, "bold")).grid(
             row=0, column=0, padx=12, pady=(12, 8)
         )
+        rows = ttk.Frame(popup)
+        rows.grid(row=1, column=0, sticky="ew")
+        status = ttk.Label(popup, text="Searching the LAN…")
+        status.grid(row=2, column=0, padx=12, pady=4)
+        ttk.Button(popup, text="Cancel", command=popup.destroy).grid(
+            row=3, column=0, pady=(8,12)
+        )
 
         bold_font = font.nametofont("TkDefaultFont").copy()
         bold_font.configure(weight="bold")
 
-        for i, s in enumerate(servers):
-            frame = ttk.Frame(popup)
-            frame.grid(row=i+1, column=0, sticky="ew", padx=12, pady=4)
-
-            # "Join "
-            ttk.Label(frame, text="Play against ").pack(side="left")
-
-            # host name (bold)
-            host_name = s.get("name", "Players")
-            ttk.Label(frame, text=host_name, font=bold_font).pack(side="left")
-
-
-            # Join button at the end
-            join_btn = ttk.Button(
-                frame,
-                text="▶",
-                command=lambda s=s, win=popup: self._select_host(s, win)
-            )
-            join_btn.pack(side="right")
-
-        ttk.Button(popup, text="Cancel", command=popup.destroy).grid(
-            row=len(servers)+1, column=0, pady=(8,12)
-        )
-
+        def show(hosts):
+            if not popup.winfo_exists():
+                return
+            for child in rows.winfo_children():
+                child.destroy()
+            for i, s in enumerate(hosts):
+                frame = ttk.Frame(rows)
+                frame.grid(row=i, column=0, sticky="ew", padx=12, pady=4)
+
+                # "Join "
+                ttk.Label(frame, text="Play against ").pack(side="left")
+
+                # host name (bold)
+                host_name = s.get("name", "Players")
+                ttk.Label(frame, text=host_name, font=bold_font).pack(side="left")
+
+                # how busy the host is, if it says
+                load = s.get("load")
+                if load:
+                    ttk.Label(frame, text=f"  ({load.get('players', 0)} playing)").pack(side="left")
+
+                # Join button at the end
+                join_btn = ttk.Button(
+                    frame,
+                    text="▶",
+                    command=lambda s=s, win=popup: self._select_host(s, win)
+                )
+                join_btn.pack(side="right")
+            if hosts:
+                status.configure(text=f"Found {len(hosts)} game(s).")
+            elif self.registry is None:
+                status.configure(text="LAN discovery unavailable.")
+            else:
+                status.configure(text="No LAN hosts yet. New games appear here as they start.")
+
+        if self.registry is None:
+            show([])
+            return
+        def searched():
+            if not self.registry.hosts():
+                show([])
+
+        def closed(event):
+            if event.widget is popup:
+                unsubscribe()
+
+        # Subscribers run on the registry's thread, and Tk may only be touched
+        # from its own: they hand the lists over here, and the Tk side polls.
+        updates = queue.Queue()
+        def poll():
+            if not popup.winfo_exists():
+                return
+            latest = None
+            while not updates.empty():
+                latest = updates.get_nowait()
+            if latest is not None:
+                show(latest)
+            self.after(200, poll)
+
+        hosts = self.registry.hosts()
+        if hosts:
+            show(hosts)
+        else:
+            # probe now and leave "Searching…" up while it runs
+            self.registry.probe()
+            popup.after(2000, searched)
+        unsubscribe = self.registry.subscribe(updates.put)
+        popup.bind("<Destroy>", closed)
+        self.after(200, poll)
 
     def _select_host(self, server_info: dict, win: tk.Toplevel):
         win.destroy()
@@ -143,6 +183,6 @@ class NetworkPage(ttk.Frame):
             "port": int(server_info["port"]),
             "pin": pin.strip(),
             "name": name.strip(),
-            "server_proc": None,
+            "server": None,
         })
         self.c.show("GamePage")
@@ -0,0 +1,286 @@
+# tictactoe/journal.py
+"""
+Append-only match journal for server_net.
+
+Every session appends a START record, one MOVE per move and an END record
+to a directory of segment files. Appends only queue bytes in memory; a
+writer thread writes and fsyncs them every `fsync_interval` seconds, so the
+event loop never waits on the disk. Segments roll over at `segment_bytes`.
+
+A crash loses at most the last interval. On restart, `recover()` returns the
+matches that have no END, and the server rebuilds them so players can come
+back with their resume tokens. Only a hash of each token is journaled. Past matches can be streamed out with:
+
+    python -m tictactoe.journal list   DIR
+    python -m tictactoe.journal replay DIR MATCH_ID [--delay SECONDS]
+
+Record layout (little-endian):
+  u16 body length | u32 crc32(body) | body
+  body = kind u8 | match id u64 | payload
+    START  f64 unix time | w u16 | h u16 | k u16 | X, O token digests (16 bytes
+           each, zeros for a bot) | room, pin, x, o (u8 length + utf-8 each)
+    MOVE   cell u16 (0-based)
+    END    reason u8 (index into wire.REASONS)
+A torn or corrupt record ends the log; the writer truncates it on open.
+"""
+from __future__ import annotations
+import hashlib
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from .wire import REASONS
+
+START, MOVE, END = 1, 2, 3
+SUFFIX = ".ttj"
+_HEAD = struct.Struct("<HI")
+_KIND_ID = struct.Struct("<BQ")
+_START = struct.Struct("<dHHH16s16s")
+_NO_SEAT = bytes(16)
+_MOVE = struct.Struct("<H")
+
+def _segments(path: str) -> List[str]:
+    if not os.path.isdir(path):
+        return []
+    return sorted(os.path.join(path, f) for f in os.listdir(path) if f.endswith(SUFFIX))
+
+def _text(s: str) -> bytes:
+    b = s.encode("utf-8")[:255]
+    return bytes((len(b),)) + b
+
+def seat_digest(token: str) -> bytes:
+    """What the journal keeps of a resume token."""
+    return hashlib.sha256(token.encode("utf-8")).digest()[:16]
+
+def _texts(body, p: int, n: int) -> List[str]:
+    out = []
+    for _ in range(n):
+        ln = body[p]
+        out.append(bytes(body[p + 1:p + 1 + ln]).decode("utf-8", "replace"))
+        p += 1 + ln
+    return out
+
+def _record(body: bytes) -> bytes:
+    return _HEAD.pack(len(body), zlib.crc32(body)) + body
+
+class Match:
+    __slots__ = ("id", "started", "room", "dims", "x", "o", "pin", "seats", "moves", "end")
+
+    def __init__(self, match_id: int, started: float, room: str, dims: Tuple[int, int, int], x: str, o: str,
+                 pin: str = "", seats: Tuple[Optional[bytes], Optional[bytes]] = (None, None)):
+        self.id = match_id
+        self.started = started
+        self.room = room
+        self.dims = dims
+        self.x = x
+        self.o = o
+        self.pin = pin                   # the room's PIN ("" for the lobby)
+        self.seats = seats               # X, O token digests; None for a bot seat
+        self.moves: List[int] = []       # 0-based cells
+        self.end: Optional[str] = None   # reason, None while in progress
+
+# ---- Reading ----
+def _parse(buf, path: str) -> Iterator[Tuple[int, int, int, object]]:
+    """(end offset, kind, match id, fields) for each good record in `buf`."""
+    off, n = 0, len(buf)
+    while off + _HEAD.size <= n:
+        size, crc = _HEAD.unpack_from(buf, off)
+        start = off + _HEAD.size
+        body = buf[start:start + size]
+        if size < _KIND_ID.size or len(body) < size or zlib.crc32(body) != crc:
+            return  # torn tail from a crash
+        kind, mid = _KIND_ID.unpack_from(body, 0)
+        p = _KIND_ID.size
+        if kind == START:
+            ts, w, h, k, dx, do = _START.unpack_from(body, p)
+            room, pin, x, o = _texts(body, p + _START.size, 4)
+            seats = tuple(None if d == _NO_SEAT else d for d in (dx, do))
+            fields = (ts, room, (w, h, k), x, o, pin, seats)  # Match() order
+        elif kind == MOVE:
+            fields = _MOVE.unpack_from(body, p)[0]
+        elif kind == END:
+            fields = REASONS[body[p]] if body[p] < len(REASONS) else "disconnect"
+        else:
+            return
+        off = start + size
+        yield off, kind, mid, fields
+
+def _read_segment(seg: str) -> Iterator[Tuple[int, int, int, object]]:
+    with open(seg, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            # memoryview slices keep the scan copy-free; release before close.
+            view = memoryview(mm)
+            try:
+                yield from _parse(view, seg)
+            finally:
+                view.release()
+
+def records(path: str) -> Iterator[Tuple[int, int, object]]:
+    """(kind, match id, fields) for every record, oldest first."""
+    for seg in _segments(path):
+        for _, kind, mid, fields in _read_segment(seg):
+            yield kind, mid, fields
+
+def load(path: str, only: Optional[int] = None) -> Dict[int, Match]:
+    """All matches in the journal (or just `only`), keyed by id."""
+    matches: Dict[int, Match] = {}
+    for kind, mid, fields in records(path):
+        if only is not None and mid != only:
+            continue
+        if kind == START:
+            matches[mid] = Match(mid, *fields)
+        elif mid in matches:
+            if kind == MOVE:
+                matches[mid].moves.append(fields)
+            else:
+                matches[mid].end = fields
+    return matches
+
+def recover(path: str) -> List[Match]:
+    """Matches that were still being played when the journal stopped."""
+    return [m for m in load(path).values() if m.end is None]
+
+def states(m: Match) -> Iterator[dict]:
+    """The state messages the players saw, in order."""
+    from .game import new_game
+    g = new_game(*m.dims)
+    w, h, k = m.dims
+    def state():
+        return {"type": "state", "board": list(g.board), "turn": g.turn, "terminal": g.terminal(),
+                "winner": g.winner(), "width": w, "height": h, "k": k}
+    yield state()
+    for cell in m.moves:
+        g.play(cell + 1)
+        yield state()
+
+# ---- Writing ----
+class Journal:
+    """Buffered appender. Thread-safe; the I/O happens on its own thread."""
+    def __init__(self, path: str, fsync_interval: float = 0.05, segment_bytes: int = 16 << 20):
+        self.path = path
+        self.fsync_interval = fsync_interval
+        self.segment_bytes = segment_bytes
+        os.makedirs(path, exist_ok=True)
+        self._buf: List[bytes] = []
+        self._lock = threading.Lock()      # guards _buf
+        self._io_lock = threading.Lock()   # one writer at a time
+        self._file = None
+        self._size = 0
+        self._open_tail()
+        self._closed = False
+        self._wake = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="journal", daemon=True)
+        self._thread.start()
+
+    def _open_tail(self) -> None:
+        segs = _segments(self.path)
+        if not segs:
+            self._roll(1)
+            return
+        last = segs[-1]
+        good = 0
+        for good, *_ in _read_segment(last):
+            pass
+        self._file = open(last, "r+b")
+        if good != os.path.getsize(last):
+            self._file.truncate(good)  # drop a torn record so appends stay readable
+        self._file.seek(good)
+        self._size = good
+
+    def _roll(self, n: int) -> None:
+        if self._file is not None:
+            self._file.close()
+        self._file = open(os.path.join(self.path, f"{n:08d}{SUFFIX}"), "ab")
+        self._size = 0
+
+    # -- producers (called from the event loop) --
+    def _append(self, body: bytes) -> None:
+        rec = _record(body)
+        with self._lock:
+            self._buf.append(rec)
+
+    def start(self, match_id: int, room: str, dims: Tuple[int, int, int], x: str, o: str,
+              pin: str = "", x_token: Optional[str] = None, o_token: Optional[str] = None) -> None:
+        seats = (seat_digest(t) if t else _NO_SEAT for t in (x_token, o_token))
+        self._append(_KIND_ID.pack(START, match_id) + _START.pack(time.time(), *dims, *seats)
+                     + _text(room) + _text(pin) + _text(x) + _text(o))
+
+    def move(self, match_id: int, cell: int) -> None:
+        self._append(_KIND_ID.pack(MOVE, match_id) + _MOVE.pack(cell))
+
+    def end(self, match_id: int, reason: str) -> None:
+        code = REASONS.index(reason) if reason in REASONS else REASONS.index("disconnect")
+        self._append(_KIND_ID.pack(END, match_id) + bytes((code,)))
+
+    # -- writer --
+    def _run(self) -> None:
+        while not self._closed:
+            self._wake.wait(self.fsync_interval)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self) -> None:
+        """Write and fsync everything appended so far."""
+        with self._io_lock:
+            with self._lock:
+                buf, self._buf = self._buf, []
+            if not buf or self._file is None:
+                return
+            data = b"".join(buf)
+            self._file.write(data)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._size += len(data)
+            if self._size >= self.segment_bytes:
+                n = int(os.path.basename(self._file.name)[:-len(SUFFIX)])
+                self._roll(n + 1)
+
+    def close(self) -> None:
+        self._closed = True
+        self._wake.set()
+        self._thread.join()
+        self.flush()
+        with self._io_lock:
+            self._file.close()
+            self._file = None
+
+# ---- CLI ----
+def _parse_args():
+    import argparse
+    ap = argparse.ArgumentParser(description="Inspect and replay a server_net match journal.")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    ls = sub.add_parser("list", help="one line per match")
+    ls.add_argument("path")
+    rp = sub.add_parser("replay", help="stream a match's states as JSON lines")
+    rp.add_argument("path")
+    rp.add_argument("match", type=int)
+    rp.add_argument("--delay", type=float, default=0.0, help="seconds between states")
+    return ap.parse_args()
+
+def main():
+    import json, sys
+    args = _parse_args()
+    if args.cmd == "list":
+        for m in load(args.path).values():
+            when = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(m.started))
+            print(f"{m.id:>8}  {when}  {'x'.join(map(str, m.dims[:2])):>5}  room={m.room!r:<10} "
+                  f"{m.x} vs {m.o}  {len(m.moves)} moves  {m.end or 'in progress'}")
+        return
+    m = load(args.path, only=args.match).get(args.match)
+    if m is None:
+        sys.exit(f"match {args.match} not found in {args.path}")
+    for n, st in enumerate(states(m)):
+        if n and args.delay:
+            time.sleep(args.delay)
+        print(json.dumps(st, separators=(",", ":")), flush=True)
+    if m.end:
+        print(json.dumps({"type": "end", "reason": m.end}, separators=(",", ":")))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,298 @@
+# tictactoe/loadgen.py
+"""
+Headless load generator for server_net.
+
+    python -m tictactoe.loadgen --host 127.0.0.1 --port 5000 --pin 1234 \
+        --clients 2000 --procs 4 --rate 2 --duration 30
+
+Opens `--clients` connections spread over `--procs` processes. Each client
+does the hello/PIN handshake, is paired with another client by the server
+and plays games back to back. On `your_turn` it waits 1/--rate seconds,
+then sends a move chosen by a selfplay engine spec (`random` by default,
+or e.g. `minimax:2`). After each game it reconnects, until --duration is up.
+
+Recorded per run:
+  connect  TCP connect + hello until the server's first reply
+  rtt      move sent until the state showing it arrives
+  errors   by kind (connect failures, refusals, server errors, drops)
+  games and moves per second
+Latencies go into log-bucketed histograms, so results from several
+processes merge exactly. `--json` prints the report as one JSON object for
+before/after comparisons.
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+import math
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Optional
+
+from . import wire
+from .client_net import connect, dumps, read_json_line
+from .game import new_game
+from .selfplay import make_engine
+
+class Histogram:
+    """Latencies in microseconds, STEPS buckets per power of two (about 9%
+    resolution). Merging adds counts."""
+    STEPS = 8
+
+    def __init__(self):
+        self.counts: Dict[int, int] = {}
+        self.n = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, us: float) -> None:
+        b = int(math.log2(max(us, 1.0)) * self.STEPS)
+        self.counts[b] = self.counts.get(b, 0) + 1
+        self.n += 1
+        self.total += us
+        self.max = max(self.max, us)
+
+    def merge(self, other: "Histogram") -> None:
+        for b, c in other.counts.items():
+            self.counts[b] = self.counts.get(b, 0) + c
+        self.n += other.n
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def percentile(self, p: float) -> float:
+        """Upper edge of the bucket holding the p-quantile (0 if empty)."""
+        if not self.n:
+            return 0.0
+        rank, seen = p * self.n, 0
+        for b in sorted(self.counts):
+            seen += self.counts[b]
+            if seen >= rank:
+                return min(2 ** ((b + 1) / self.STEPS), self.max)
+        return self.max
+
+    def summary(self) -> Dict[str, float]:
+        """Milliseconds."""
+        out = {"n": self.n, "mean": self.total / self.n / 1000 if self.n else 0.0}
+        for name, p in (("p50", 0.5), ("p90", 0.9), ("p99", 0.99), ("p999", 0.999)):
+            out[name] = self.percentile(p) / 1000
+        out["max"] = self.max / 1000
+        return out
+
+    def bars(self, width: int = 40) -> str:
+        """One line per power of two: bucket range in ms and a bar."""
+        rows: Dict[int, int] = {}
+        for b, c in self.counts.items():
+            rows[b // self.STEPS] = rows.get(b // self.STEPS, 0) + c
+        if not rows:
+            return ""
+        top = max(rows.values())
+        return "\n".join(f"  {2 ** e / 1000:>9.3f} - {2 ** (e + 1) / 1000:<9.3f} ms "
+                         f"{'#' * max(1, round(width * rows[e] / top)):<{width}} {rows[e]}"
+                         for e in range(min(rows), max(rows) + 1) if e in rows)
+
+class Stats:
+    def __init__(self):
+        self.connect = Histogram()
+        self.rtt = Histogram()
+        self.errors: Dict[str, int] = {}
+        self.games = 0
+        self.moves = 0
+        self.wall = 0.0
+
+    def error(self, kind: str) -> None:
+        self.errors[kind] = self.errors.get(kind, 0) + 1
+
+    def merge(self, other: "Stats") -> None:
+        self.connect.merge(other.connect)
+        self.rtt.merge(other.rtt)
+        for k, c in other.errors.items():
+            self.errors[k] = self.errors.get(k, 0) + c
+        self.games += other.games
+        self.moves += other.moves
+        self.wall = max(self.wall, other.wall)
+
+    def report(self) -> Dict:
+        wall = self.wall or 1.0
+        return {"wall_s": self.wall, "games": self.games, "games_per_s": self.games / wall,
+                "moves": self.moves, "moves_per_s": self.moves / wall,
+                "connect_ms": self.connect.summary(), "rtt_ms": self.rtt.summary(),
+                "errors": dict(sorted(self.errors.items()))}
+
+def _raise_fd_limit() -> None:
+    try:
+        import resource
+    except ImportError:  # not on Windows
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+def _chooser(spec: str, seed: int):
+    """state message -> 0-based cell."""
+    if spec == "random":
+        rng = random.Random(seed)
+        return lambda st: rng.choice([i for i, c in enumerate(st["board"]) if c == " "])
+    engine = make_engine(spec, seed)
+    def choose(st):
+        g = new_game(st["width"], st["height"], st["k"])
+        g.board = st["board"]
+        g.turn = st["turn"]
+        return engine(g) - 1
+    return choose
+
+async def _player(stats: Stats, host: str, port: int, hello: dict, wire_name: str,
+                  think: float, choose, timeout: float, stop_at: float) -> None:
+    loop = asyncio.get_running_loop()
+    perf = time.perf_counter
+    while loop.time() < stop_at:
+        t0 = perf()
+        try:
+            reader, writer, codec, pending = await asyncio.wait_for(connect(host, port, hello, wire_name), timeout)
+        except (OSError, asyncio.TimeoutError):
+            stats.error("connect")
+            await asyncio.sleep(0.5)
+            continue
+
+        async def recv():
+            if pending:
+                return pending.pop()
+            if codec is None:
+                return await read_json_line(reader)
+            payload = await wire.read_frame(reader)
+            return None if payload is None else codec.decode(payload)
+
+        def send(msg):
+            writer.write(codec.encode(msg) if codec else dumps(msg))
+
+        first, state, sent_at, cell = True, None, None, None
+        try:
+            while True:
+                # Unpaired at the end of the run: stop waiting for an opponent.
+                wait = timeout if state is not None else min(timeout, max(0.1, stop_at - loop.time()))
+                msg = await asyncio.wait_for(recv(), wait)
+                if first:
+                    stats.connect.add((perf() - t0) * 1e6)
+                    first = False
+                if msg is None:
+                    stats.error("disconnect")
+                    break
+                t = msg.get("type")
+                if t == "state":
+                    state = msg
+                    if sent_at is not None and msg["board"][cell] != " ":
+                        stats.rtt.add((perf() - sent_at) * 1e6)
+                        stats.moves += 1
+                        sent_at = None
+                elif t == "your_turn" or t == "error" and msg.get("error") == "invalid_move":
+                    if t == "error":
+                        stats.error("invalid_move")
+                    if think:
+                        await asyncio.sleep(think)
+                    if loop.time() >= stop_at:
+                        send({"type": "quit"})
+                        break
+                    cell = choose(state)
+                    send({"type": "move", "idx": cell + 1})
+                    sent_at = perf()
+                elif t == "end":
+                    stats.games += 1
+                    break
+                elif t == "error":
+                    stats.error(msg.get("error", "error"))
+                elif t is None and msg.get("error"):
+                    stats.error(f"refused:{msg['error']}")
+                    await asyncio.sleep(0.5)
+                    break
+        except asyncio.TimeoutError:
+            if state is not None or loop.time() < stop_at:
+                stats.error("timeout")
+        except (OSError, ValueError):
+            stats.error("disconnect")
+        writer.close()
+
+async def swarm(host: str, port: int, pin: str, clients: int, duration: float, rate: float = 0.0,
+                engine: str = "random", wire_name: str = "json", room: Optional[str] = None,
+                ramp: float = 0.0, timeout: float = 10.0, seed: int = 0, first: int = 0) -> Stats:
+    """Run `clients` players in this event loop for `duration` seconds.
+    Connects are spread over `ramp` seconds; `first` numbers the clients."""
+    stats = Stats()
+    loop = asyncio.get_running_loop()
+    t0 = loop.time()
+    stop_at = t0 + duration
+
+    async def one(i: int):
+        if ramp:
+            await asyncio.sleep(ramp * i / clients)
+        hello = {"type": "hello", "name": f"load{first + i}", "pin": pin}
+        if room:
+            hello["room"] = room
+        if wire_name != "json":
+            hello["wire"] = wire_name
+        await _player(stats, host, port, hello, wire_name, 1.0 / rate if rate else 0.0,
+                      _chooser(engine, seed + first + i), timeout, stop_at)
+
+    await asyncio.gather(*(one(i) for i in range(clients)))
+    stats.wall = loop.time() - t0
+    return stats
+
+def _proc(job: tuple) -> Stats:
+    args, kwargs = job
+    _raise_fd_limit()
+    return asyncio.run(swarm(*args, **kwargs))
+
+def run(host: str, port: int, pin: str, clients: int, duration: float, procs: int = 1, **kwargs) -> Stats:
+    """swarm() across `procs` processes, merged."""
+    if procs <= 1:
+        return _proc(((host, port, pin, clients, duration), kwargs))
+    shares = [clients // procs + (i < clients % procs) for i in range(procs)]
+    jobs = [((host, port, pin, share, duration), {**kwargs, "first": sum(shares[:i])})
+            for i, share in enumerate(shares) if share]
+    total = Stats()
+    with ProcessPoolExecutor(max_workers=len(jobs)) as pool:
+        for st in pool.map(_proc, jobs):
+            total.merge(st)
+    return total
+
+def print_report(stats: Stats, file=sys.stdout) -> None:
+    r = stats.report()
+    print(f"{r['wall_s']:.1f}s: {r['games']} games ({r['games_per_s']:,.1f}/s), "
+          f"{r['moves']} moves ({r['moves_per_s']:,.1f}/s)", file=file)
+    for name in ("connect_ms", "rtt_ms"):
+        s = r[name]
+        print(f"  {name[:-3]:<8} n={s['n']:<8} mean {s['mean']:8.3f}  p50 {s['p50']:8.3f}  p90 {s['p90']:8.3f}  "
+              f"p99 {s['p99']:8.3f}  p99.9 {s['p999']:8.3f}  max {s['max']:8.3f} ms", file=file)
+    if stats.rtt.n:
+        print("  rtt histogram:", file=file)
+        print(stats.rtt.bars(), file=file)
+    errors = ", ".join(f"{k}={c}" for k, c in r["errors"].items()) or "none"
+    print(f"  errors: {errors}", file=file)
+
+def main():
+    ap = argparse.ArgumentParser(description="Simulate many LAN clients against a server_net instance.")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, required=True)
+    ap.add_argument("--pin", required=True)
+    ap.add_argument("--room", default=None, help="play in this named room instead of the lobby")
+    ap.add_argument("--clients", type=int, default=100, help="concurrent connections")
+    ap.add_argument("--procs", type=int, default=1, help="processes to spread the clients over")
+    ap.add_argument("--duration", type=float, default=10.0, help="seconds to run")
+    ap.add_argument("--rate", type=float, default=1.0, help="moves per second per client (0: as fast as possible)")
+    ap.add_argument("--engine", default="random", help="move choice: random or a selfplay spec like minimax:2")
+    ap.add_argument("--wire", choices=["json", wire.NAME], default="json")
+    ap.add_argument("--ramp", type=float, default=1.0, help="seconds over which to open the connections")
+    ap.add_argument("--timeout", type=float, default=10.0, help="seconds to wait for any server message")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = ap.parse_args()
+    stats = run(args.host, args.port, args.pin, args.clients, args.duration, args.procs,
+                rate=args.rate, engine=args.engine, wire_name=args.wire, room=args.room,
+                ramp=args.ramp, timeout=args.timeout, seed=args.seed)
+    if args.json:
+        print(json.dumps(stats.report()))
+    else:
+        print_report(stats)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+# tictactoe/mcts.py
+"""
+Monte Carlo Tree Search (UCT) player for any board size.
+
+Each tree iteration expands one node and scores it with a *batch* of random
+playouts. With numpy installed the batch is simulated in one shot as array
+operations: every playout is a random ranking of the empty cells, a k-window
+is won at the ply its last cell is filled, and the earliest such ply decides
+the game. Without numpy the same batch is played move by move.
+
+The tree is kept between calls, so consecutive moves in one game reuse the
+statistics gathered for the position that was actually reached.
+"""
+from __future__ import annotations
+import math
+import random
+import time
+from typing import Dict, List, Optional, Tuple
+
+from .game import MNKGame, Player
+
+try:
+    import numpy as np
+except ImportError:  # pure-Python playouts
+    np = None
+
+DEFAULT_BATCH = 64
+_BIG = 1 << 30
+
+class Node:
+    __slots__ = ("move", "parent", "children", "untried", "visits", "wins")
+
+    def __init__(self, move: int, parent: Optional["Node"], untried: List[int]):
+        self.move = move          # 0-based cell played to reach this node
+        self.parent = parent
+        self.children: Dict[int, "Node"] = {}
+        self.untried = untried
+        self.visits = 0
+        self.wins = 0.0           # for the player who made `move`
+
+def _as_mnk(game) -> MNKGame:
+    if isinstance(game, MNKGame):
+        return game.clone()
+    return MNKGame(game.width, game.height, game.k, board=game.board, turn=game.turn)
+
+# ---- Batched playouts ----
+_WINDOW_ARRAYS = {}
+
+def _window_array(width: int, height: int, k: int):
+    from .ai import _windows
+    key = (width, height, k)
+    if key not in _WINDOW_ARRAYS:
+        _WINDOW_ARRAYS[key] = np.array(_windows(width, height, k)[0], dtype=np.int32).reshape(-1, k)
+    return _WINDOW_ARRAYS[key]
+
+def rollouts(g: MNKGame, n: int, rng) -> Tuple[int, int, int]:
+    """Play `n` uniformly random games from `g`; returns (x_wins, o_wins, draws)."""
+    if np is not None:
+        return _rollouts_np(g, n, rng)
+    return _rollouts_py(g, n, rng)
+
+def _rollouts_np(g: MNKGame, n: int, rng) -> Tuple[int, int, int]:
+    cells = np.array([0 if c == " " else 1 if c == "X" else 2 for c in g.board], dtype=np.int8)
+    empties = np.flatnonzero(cells == 0)
+    m = len(empties)
+    if m == 0:
+        return 0, 0, n
+    # rank[b, j] = ply (0-based) at which empty cell j gets played in playout b
+    rank_e = np.argsort(np.argsort(rng.random((n, m)), axis=1), axis=1).astype(np.int32)
+    rank = np.full((n, len(cells)), -1, dtype=np.int32)
+    rank[:, empties] = rank_e
+    me, other = (1, 2) if g.turn == "X" else (2, 1)
+    owner = np.broadcast_to(cells, (n, len(cells))).copy()
+    owner[:, empties] = np.where(rank_e % 2 == 0, me, other)
+
+    win = _window_array(g.width, g.height, g.k)
+    done_at = rank[:, win].max(axis=2)          # ply the window fills up
+    w_owner = owner[:, win]
+    t = []
+    for p in (1, 2):
+        mine = (w_owner == p).all(axis=2)
+        t.append(np.where(mine, done_at, _BIG).min(axis=1))
+    tx, to = t
+    xw = int(np.count_nonzero(tx < to))
+    ow = int(np.count_nonzero(to < tx))
+    return xw, ow, n - xw - ow
+
+def _rollouts_py(g: MNKGame, n: int, rng) -> Tuple[int, int, int]:
+    xw = ow = 0
+    empties = g.moves()
+    for _ in range(n):
+        sim = g.clone()
+        order = empties[:]
+        rng.shuffle(order)
+        for i in order:
+            sim.play(i + 1)
+            if sim.winner() is not None:
+                break
+        w = sim.winner()
+        xw += w == "X"
+        ow += w == "O"
+    return xw, ow, n - xw - ow
+
+# ---- Player ----
+class MCTSPlayer:
+    """UCT search with an iteration and/or time budget and tree reuse."""
+    def __init__(self, iterations: Optional[int] = 1000, time_ms: Optional[float] = None,
+                 batch: int = DEFAULT_BATCH, c: float = 1.4, seed: Optional[int] = None):
+        self.iterations = iterations
+        self.time_ms = time_ms
+        self.batch = batch
+        self.c = c
+        self.rng = np.random.default_rng(seed) if np is not None else random.Random(seed)
+        self.root: Optional[Node] = None
+        self.root_board: Optional[List[str]] = None
+
+    def reset(self) -> None:
+        self.root = None
+        self.root_board = None
+
+    @staticmethod
+    def _expandable(g: MNKGame) -> List[int]:
+        return [] if g.terminal() else (g.near_moves() if len(g.board) > 25 else g.moves())
+
+    def _reuse(self, g: MNKGame) -> Node:
+        """Walk the old tree along the marks placed since the last search."""
+        node, old = self.root, self.root_board
+        if node is not None and old is not None and len(old) == len(g.board):
+            diff = [i for i, (a, b) in enumerate(zip(old, g.board)) if a != b]
+            if all(old[i] == " " for i in diff):
+                # Alternate marks starting with the side that was to move.
+                mark = "X" if old.count("X") == old.count("O") else "O"
+                left = set(diff)
+                while node is not None and left:
+                    nxt = next((i for i in left if g.board[i] == mark and i in node.children), None)
+                    node = node.children.get(nxt) if nxt is not None else None
+                    left.discard(nxt)
+                    mark = "O" if mark == "X" else "X"
+                if node is not None and not left:
+                    node.parent = None
+                    return node
+        return Node(-1, None, self._expandable(g))
+
+    def search(self, game) -> Tuple[int, Node]:
+        """Run the budget from `game`; returns (best 1-based index, root)."""
+        g0 = _as_mnk(game)
+        if g0.terminal():
+            raise ValueError("no moves in a finished game")
+        root = self._reuse(g0)
+        deadline = None if self.time_ms is None else time.perf_counter() + self.time_ms / 1000.0
+        it = 0
+        c, log = self.c, math.log
+        while True:
+            if it and self.iterations is not None and it >= self.iterations:
+                break
+            if it and deadline is not None and time.perf_counter() > deadline:
+                break
+            it += 1
+            node, g = root, g0.clone()
+            # Selection
+            while not node.untried and node.children:
+                lv = log(node.visits)
+                node = max(node.children.values(),
+                           key=lambda ch: ch.wins / ch.visits + c * math.sqrt(lv / ch.visits))
+                g.play(node.move + 1)
+            # Expansion
+            if node.untried:
+                i = node.untried.pop(int(self.rng.random() * len(node.untried)))
+                g.play(i + 1)
+                child = Node(i, node, self._expandable(g))
+                node.children[i] = child
+                node = child
+            # Simulation (batched)
+            if g.terminal():
+                w = g.winner()
+                n = self.batch
+                xw, ow = (n, 0) if w == "X" else (0, n) if w == "O" else (0, 0)
+            else:
+                n = self.batch
+                xw, ow, _ = rollouts(g, n, self.rng)
+            draws = n - xw - ow
+            # Backpropagation: wins credited to whoever moved into the node
+            mover_is_x = g.turn == "O"
+            while node is not None:
+                node.visits += n
+                node.wins += (xw if mover_is_x else ow) + 0.5 * draws
+                mover_is_x = not mover_is_x
+                node = node.parent
+
+        best = max(root.children.values(), key=lambda ch: ch.visits)
+        # Keep the tree rooted at our move; the next call descends from here.
+        self.root = best
+        best.parent = None
+        g0.play(best.move + 1)
+        self.root_board = list(g0.board)
+        return best.move + 1, root
+
+    def best_move(self, game, as_player: Optional[Player] = None) -> Tuple[int, float]:
+        """(1-based index, estimated win rate for the side to move)."""
+        idx, root = self.search(game)
+        ch = root.children[idx - 1]
+        return idx, ch.wins / ch.visits
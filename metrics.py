@@ -0,0 +1,192 @@
+# tictactoe/metrics.py
+"""
+Prometheus-style metrics for server_net.
+
+    python -m tictactoe.server_net ... --metrics-port 9100
+    curl http://127.0.0.1:9100/metrics
+
+Everything is plain attribute arithmetic on the event loop thread: no
+locks, no allocation per update beyond a dict slot for a new label. The
+server keeps `metrics = None` when the endpoint is off and each hot-path
+hook is one `is not None` test, so disabled instrumentation costs next to
+nothing.
+
+Gauges that describe server state (waiting players, sessions, open
+connections) are callbacks read at scrape time rather than updated on the
+hot path. A sampler task measures event-loop lag once per interval and
+turns the move counter and write-buffer peaks into per-interval values.
+"""
+from __future__ import annotations
+import asyncio
+from bisect import bisect_left
+from typing import Callable, Dict, Iterator, Optional, Sequence, Tuple
+
+# seconds; covers a loopback round trip up to a stalled loop
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5)
+
+def _fmt(v: float) -> str:
+    return repr(float(v)) if v != int(v) or abs(v) >= 1e15 else str(int(v))
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, label: Optional[str] = None):
+        self.name, self.help, self.label = name, help, label
+        self.value = 0
+        self.values: Dict[str, float] = {}  # by label value
+
+    def inc(self, n: float = 1) -> None:
+        self.value += n
+
+    def inc_by(self, key: str, n: float = 1) -> None:
+        self.values[key] = self.values.get(key, 0) + n
+
+    def samples(self) -> Iterator[Tuple[str, float]]:
+        if self.label is None:
+            yield self.name, self.value
+        for k, v in sorted(self.values.items()):
+            yield f'{self.name}{{{self.label}="{k}"}}', v
+
+class Gauge(Counter):
+    """Set directly, or read from `fn` at scrape time."""
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, label: Optional[str] = None, fn: Optional[Callable[[], float]] = None):
+        super().__init__(name, help, label)
+        self.fn = fn
+
+    def set(self, v: float, key: Optional[str] = None) -> None:
+        if key is None:
+            self.value = v
+        else:
+            self.values[key] = v
+
+    def samples(self) -> Iterator[Tuple[str, float]]:
+        if self.fn is not None:
+            self.value = self.fn()
+        return super().samples()
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name, self.help = name, help
+        self.bounds = tuple(buckets)
+        self.counts = [0] * (len(self.bounds) + 1)  # last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, v: float) -> None:
+        self.counts[bisect_left(self.bounds, v)] += 1
+        self.sum += v
+        self.count += 1
+
+    def samples(self) -> Iterator[Tuple[str, float]]:
+        seen = 0
+        for bound, c in zip(self.bounds, self.counts):
+            seen += c
+            yield f'{self.name}_bucket{{le="{_fmt(bound)}"}}', seen
+        yield f'{self.name}_bucket{{le="+Inf"}}', self.count
+        yield f"{self.name}_sum", self.sum
+        yield f"{self.name}_count", self.count
+
+class Registry:
+    def __init__(self, prefix: str = "tictactoe_"):
+        self.prefix = prefix
+        self.metrics = []
+
+    def _add(self, m):
+        m.name = self.prefix + m.name
+        self.metrics.append(m)
+        return m
+
+    def counter(self, name: str, help: str, label: Optional[str] = None) -> Counter:
+        return self._add(Counter(name, help, label))
+
+    def gauge(self, name: str, help: str, label: Optional[str] = None, fn=None) -> Gauge:
+        return self._add(Gauge(name, help, label, fn))
+
+    def histogram(self, name: str, help: str, buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help, buckets))
+
+    def render(self) -> str:
+        """Text exposition format 0.0.4."""
+        out = []
+        for m in self.metrics:
+            out.append(f"# HELP {m.name} {m.help}")
+            out.append(f"# TYPE {m.name} {m.kind}")
+            out.extend(f"{name} {_fmt(v)}" for name, v in m.samples())
+        return "\n".join(out) + "\n"
+
+class ServerMetrics(Registry):
+    """The server's metrics. `gauges` maps a gauge name to a callback for
+    the state gauges (connections, waiting_players, sessions, spectators)."""
+    def __init__(self, gauges: Dict[str, Callable[[], float]], interval: float = 1.0):
+        super().__init__()
+        self.interval = interval
+        self.connections_total = self.counter("connections_total", "Connections accepted.")
+        for name, fn in gauges.items():
+            self.gauge(name, f"Current {name.replace('_', ' ')}.", fn=fn)
+        self.messages_in = self.counter("messages_received_total", "Messages received, by type.", "type")
+        self.messages_out = self.counter("messages_sent_total", "Messages sent to players, by type.", "type")
+        self.bytes_in = self.counter("bytes_received_total", "Bytes received from players.")
+        self.bytes_out = self.counter("bytes_sent_total", "Bytes queued to players and spectators.", "peer")
+        self.moves = self.counter("moves_total", "Moves played.")
+        self.moves_per_second = self.gauge("moves_per_second", "Moves per second over the last interval.")
+        self.handshake = self.histogram("handshake_seconds", "Connection accepted until seated or refused.")
+        self.move_seconds = self.histogram("move_seconds", "Move received until its state is written to both players.")
+        self.bot_think = self.histogram("bot_think_seconds", "Bot search time per move.")
+        self.buffer_high_water = self.gauge("write_buffer_high_water_bytes",
+                                            "Largest unsent buffer seen in the last interval.", "peer")
+        self.loop_lag = self.histogram("event_loop_lag_seconds", "How late the sampler's sleep woke up.")
+        self.loop_lag_last = self.gauge("event_loop_lag_last_seconds", "Event-loop lag at the last sample.")
+        # peaks for the current interval, published by the sampler
+        self.hw_player = 0
+        self.hw_spectator = 0
+        self._task = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._sample())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _sample(self) -> None:
+        loop = asyncio.get_running_loop()
+        moves, last = self.moves.value, loop.time()
+        while True:
+            await asyncio.sleep(self.interval)
+            now = loop.time()
+            lag = max(0.0, now - last - self.interval)
+            self.loop_lag.observe(lag)
+            self.loop_lag_last.set(lag)
+            self.moves_per_second.set((self.moves.value - moves) / (now - last))
+            moves, last = self.moves.value, now
+            self.buffer_high_water.set(self.hw_player, "player")
+            self.buffer_high_water.set(self.hw_spectator, "spectator")
+            self.hw_player = self.hw_spectator = 0
+
+async def serve(registry: Registry, host: str, port: int) -> asyncio.AbstractServer:
+    """Minimal HTTP endpoint: GET /metrics returns `registry.render()`."""
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request = await asyncio.wait_for(reader.readline(), 5.0)
+            while (await asyncio.wait_for(reader.readline(), 5.0)) not in (b"\r\n", b"\n", b""):
+                pass  # headers
+            parts = request.split()
+            if len(parts) >= 2 and parts[0] == b"GET" and parts[1].split(b"?")[0] in (b"/metrics", b"/"):
+                status, body = "200 OK", registry.render().encode()
+            else:
+                status, body = "404 Not Found", b"not found\n"
+            writer.write(f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                         f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body)
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+    return await asyncio.start_server(handle, host, port)
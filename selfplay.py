@@ -0,0 +1,111 @@
+# tictactoe/selfplay.py
+"""
+Headless engine-vs-engine games, used by `python -m tictactoe.cli selfplay`.
+
+Engine specs:
+  minimax[:DEPTH]   ai.best_move (no DEPTH: perfect play on 3x3, best
+                    within best_move's default time budget on bigger boards)
+  timed:MS          ai.best_move with an MS think-time budget
+  mcts[:ITERS]      mcts.MCTSPlayer
+  random            uniform random legal move
+"""
+from __future__ import annotations
+import json
+import random
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Callable, Dict, Iterator, Optional, TextIO
+
+from .ai import best_move
+from .game import new_game
+from .mcts import MCTSPlayer
+
+Engine = Callable[[object], int]
+
+def make_engine(spec: str, seed: Optional[int] = None) -> Engine:
+    """Build a fresh move function (game -> 1-based index) from a spec."""
+    name, _, arg = spec.partition(":")
+    if name == "random":
+        rng = random.Random(seed)
+        return lambda g: rng.choice(g.moves()) + 1
+    if name == "minimax":
+        depth = int(arg) if arg else None
+        return lambda g: best_move(g, g.turn, depth_limit=depth)[0]
+    if name == "timed":
+        ms = float(arg or 100)
+        return lambda g: best_move(g, g.turn, time_ms=ms)[0]
+    if name == "mcts":
+        player = MCTSPlayer(iterations=int(arg or 1000), seed=seed)
+        return lambda g: player.best_move(g)[0]
+    raise ValueError(f"unknown engine spec: {spec!r}")
+
+def play_game(job: tuple) -> Dict:
+    """Play one game; `job` is (game_no, x_spec, o_spec, (w, h, k), seed)."""
+    n, x_spec, o_spec, dims, seed = job
+    g = new_game(*dims)
+    engines = {"X": make_engine(x_spec, seed), "O": make_engine(o_spec, seed + 1)}
+    moves, think = [], []
+    while not g.terminal():
+        t0 = time.perf_counter()
+        idx = engines[g.turn](g)
+        think.append(round((time.perf_counter() - t0) * 1000, 3))
+        g.play(idx)
+        moves.append(idx)
+    return {"game": n, "x": x_spec, "o": o_spec, "winner": g.winner(),
+            "moves": moves, "think_ms": think}
+
+def _jobs(games: int, x_spec: str, o_spec: str, dims, seed: int, swap: bool) -> Iterator[tuple]:
+    for n in range(games):
+        a, b = (o_spec, x_spec) if swap and n % 2 else (x_spec, o_spec)
+        yield (n, a, b, dims, seed + 2 * n)
+
+def _results(jobs: Iterator[tuple], workers: int) -> Iterator[Dict]:
+    """Yield results as games finish, keeping at most 2*workers in flight."""
+    if workers <= 1:
+        for job in jobs:
+            yield play_game(job)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = set()
+        for job in jobs:
+            pending.add(pool.submit(play_game, job))
+            if len(pending) >= 2 * workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for f in done:
+                    yield f.result()
+        for f in pending:
+            yield f.result()
+
+def run(games: int, x_spec: str, o_spec: str, dims=(3, 3, 3), workers: int = 1,
+        out: Optional[TextIO] = None, seed: int = 0, swap: bool = False) -> Dict:
+    """Stream one JSON line per game to `out` and return the aggregate."""
+    wins: Dict[str, int] = {}
+    total_moves = 0
+    think_total = 0.0
+    t0 = time.perf_counter()
+    for res in _results(_jobs(games, x_spec, o_spec, dims, seed, swap), workers):
+        if out is not None:
+            out.write(json.dumps(res, separators=(",", ":")) + "\n")
+        w = res["winner"]
+        key = "draw" if w is None else f"{res['x'] if w == 'X' else res['o']} ({w})"
+        wins[key] = wins.get(key, 0) + 1
+        total_moves += len(res["moves"])
+        think_total += sum(res["think_ms"])
+    wall = time.perf_counter() - t0
+    return {
+        "games": games,
+        "results": wins,
+        "moves": total_moves,
+        "wall_s": wall,
+        "moves_per_s": total_moves / wall if wall else 0.0,
+        "avg_think_ms": think_total / total_moves if total_moves else 0.0,
+    }
+
+def print_summary(summary: Dict, file: TextIO = sys.stderr) -> None:
+    n = summary["games"] or 1
+    print(f"{summary['games']} games in {summary['wall_s']:.2f}s "
+          f"({summary['moves_per_s']:,.0f} moves/s, avg think {summary['avg_think_ms']:.3f} ms)", file=file)
+    for key, count in sorted(summary["results"].items()):
+        label = "draws" if key == "draw" else f"{key} wins"
+        print(f"  {label:<24} {count:>7}  {100.0 * count / n:5.1f}%", file=file)
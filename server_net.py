@@ -1,44 +1,191 @@
-import asyncio, argparse, logging, json, socket, threading
-from .game import Game  # uses 1–9 indexing
+import asyncio, argparse, itertools, logging, json, secrets, socket, threading, time
+from collections import OrderedDict
+from .game import new_game  # uses 1-based indexing
+from . import wire
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s: %(message)s")
 
 DISCOVERY_MAGIC = b"TTT_DISCOVER_V1"
 DISCOVERY_ENCODING = "utf-8"
 
-def _udp_discovery_responder_loop(listen_ip: str, dport: int, name: str, game_port: int, pin_required: bool):
-    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-    try:
-        sock.bind((listen_ip, dport))
-        logging.info(f"UDP discovery responder on {listen_ip}:{dport}")
-    except Exception as e:
-        logging.warning(f"UDP discovery bind failed on {dport}: {e}")
-        sock.close()
-        return
-    while True:
+MAX_SOURCES = 4096  # probers the discovery responder remembers
+ANNOUNCE_PORT = 9999  # discover.HostRegistry listens here
+DISCOVERY_MODES = ("broadcast", "multicast", "both")
+
+class DiscoveryResponder(asyncio.DatagramProtocol):
+    """Answers discovery probes, as a datagram endpoint on the event loop.
+
+    Probes may arrive by broadcast or, when the responder listens on all
+    interfaces, through the discover.MULTICAST_GROUP it joins. The reply is
+    serialized once; with a `load` callback (returning e.g. rooms and player
+    counts) it is rebuilt at most every `load_every` seconds, and only when
+    the load changed. A source gets one reply per `probe_gap` seconds for
+    the same port and at most `burst` for different ports, so a probe that
+    reaches us through several broadcast addresses, or a flood, costs a
+    dict lookup rather than a reply. Only the newest MAX_SOURCES probers are
+    remembered, and forgetting one costs O(1).
+
+    With `announce_port` set it also sends the reply, tagged `"event": "up"`,
+    at once and every `announce_every` seconds (by broadcast, multicast or
+    both, per `mode`), so host registries (discover.HostRegistry) learn
+    about it without probing; `stop()` sends a final `"event": "down"`. The
+    reply then carries a `ttl` of three intervals. `announce_to` overrides
+    the targets.
+    """
+    def __init__(self, name: str, game_port: int, pin_required: bool, load=None,
+                 announce_port: int | None = None, announce_every: float = 10.0, announce_to=None,
+                 mode: str = "broadcast", load_every: float = 1.0, probe_gap: float = 1.0, burst: int = 8):
+        if mode not in DISCOVERY_MODES:
+            raise ValueError(f"mode must be one of {DISCOVERY_MODES}")
+        self.payload = {
+            "service": "tictactoe",
+            "proto": 1,
+            "name": name,
+            "port": game_port,
+            "pin_required": bool(pin_required),
+        }
+        if announce_port is not None:
+            self.payload["ttl"] = 3 * announce_every  # how long registries may keep us without news
+        self.load = load
+        self.load_every = load_every
+        self.announce_port = announce_port
+        self.announce_every = announce_every
+        self.announce_to = announce_to
+        self.mode = mode
+        self.probe_gap = probe_gap
+        self.burst = burst
+        self.replies = 0
+        self.dropped = 0  # probes rate-limited away
+        self.transport = None
+        self._sources = OrderedDict()  # ip -> [window start, ports answered in it], oldest first
+        self._reply = b""
+        self._built = float("-inf")
+        self._task = None
+        self._rebuild()
+
+    def _rebuild(self) -> None:
+        if self.load is not None:
+            load = self.load()
+            if load == self.payload.get("load") and self._reply:
+                return
+            self.payload["load"] = load
+        self._reply = json.dumps(self.payload).encode(DISCOVERY_ENCODING)
+
+    def reply(self, now: float) -> bytes:
+        if self.load is not None and now - self._built >= self.load_every:
+            self._built = now
+            self._rebuild()
+        return self._reply
+
+    async def start(self, listen_ip: str, dport: int) -> "DiscoveryResponder":
+        from .discover import join_group
+        loop = asyncio.get_running_loop()
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
         try:
-            data, addr = sock.recvfrom(1024)
-            if data.strip() == DISCOVERY_MAGIC:
-                payload = {
-                    "service": "tictactoe",
-                    "proto": 1,
-                    "name": name,
-                    "port": game_port,
-                    "pin_required": bool(pin_required),
-                }
-                sock.sendto(json.dumps(payload).encode(DISCOVERY_ENCODING), addr)
-        except Exception:
-            continue
+            sock.bind((listen_ip, dport))
+        except OSError as e:
+            logging.warning(f"UDP discovery bind failed on {dport}: {e}")
+            sock.close()
+            return self
+        # a socket bound to one address never sees datagrams sent to the group
+        multicast = listen_ip in ("", "0.0.0.0") and join_group(sock)
+        await loop.create_datagram_endpoint(lambda: self, sock=sock)
+        logging.info(f"UDP discovery responder on {listen_ip}:{dport}" + (" (+multicast)" if multicast else ""))
+        if self.announce_port is not None:
+            self._task = asyncio.create_task(self._announce_forever())
+        return self
+
+    def connection_made(self, transport) -> None:
+        self.transport = transport
+
+    def datagram_received(self, data: bytes, addr) -> None:
+        if data.strip() != DISCOVERY_MAGIC:
+            return
+        now = time.monotonic()
+        ip, port = addr[0], addr[1]
+        sources = self._sources
+        seen = sources.get(ip)
+        if seen is None or now - seen[0] >= self.probe_gap:
+            sources.pop(ip, None)
+            seen = sources[ip] = [now, set()]
+            # Windows open in time order, so the expired ones (and, in a
+            # flood of new sources, the oldest live ones) are at the front.
+            while sources and (len(sources) > MAX_SOURCES
+                               or now - next(iter(sources.values()))[0] >= self.probe_gap):
+                sources.popitem(last=False)
+        if port in seen[1] or len(seen[1]) >= self.burst:
+            self.dropped += 1
+            return
+        seen[1].add(port)
+        self.replies += 1
+        self.transport.sendto(self.reply(now), addr)
+
+    def error_received(self, exc: Exception) -> None:
+        pass  # e.g. ICMP unreachable for a prober that's gone
+
+    def _targets(self) -> list:
+        if self.announce_to is None:
+            from .discover import MULTICAST_GROUP, broadcast_addresses
+            self.announce_to = ((broadcast_addresses() if self.mode != "multicast" else [])
+                                + ([MULTICAST_GROUP] if self.mode != "broadcast" else []))
+        return self.announce_to
+
+    def announce(self, event: str) -> None:
+        if self.transport is None or self.announce_port is None:
+            return
+        self._built = time.monotonic()
+        self._rebuild()
+        data = json.dumps({**self.payload, "event": event}).encode(DISCOVERY_ENCODING)
+        for addr in self._targets():
+            try:
+                self.transport.sendto(data, (addr, self.announce_port))
+            except OSError:
+                continue  # e.g. no route for that interface
+
+    async def _announce_forever(self) -> None:
+        while True:
+            self.announce("up")
+            await asyncio.sleep(self.announce_every)
+
+    def stop(self) -> None:
+        """Announce "down" and close the endpoint."""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self.transport is not None:
+            self.announce("down")
+            self.transport.close()
+            self.transport = None
+
+    def start_thread(self, listen_ip: str, dport: int) -> "DiscoveryResponder":
+        """Run on a daemon thread with its own event loop, for a process
+        (the cluster broker) that has none; `stop_thread()` ends it."""
+        ready = threading.Event()
 
-def start_udp_discovery_responder(listen_ip: str, dport: int, name: str, game_port: int, pin_required: bool):
-    t = threading.Thread(
-        target=_udp_discovery_responder_loop,
-        args=(listen_ip, dport, name, game_port, pin_required),
-        daemon=True,
-    )
-    t.start()
-    return t
+        async def main():
+            try:
+                await self.start(listen_ip, dport)
+                self._loop, self._done = asyncio.get_running_loop(), asyncio.Event()
+            finally:
+                ready.set()
+            await self._done.wait()
+            self.stop()
+
+        self._thread = threading.Thread(target=asyncio.run, args=(main(),), daemon=True, name="ttt-discovery")
+        self._thread.start()
+        ready.wait()
+        return self
+
+    def stop_thread(self) -> None:
+        self._loop.call_soon_threadsafe(self._done.set)
+        self._thread.join(2)
+
+async def start_discovery_responder(listen_ip: str, dport: int, name: str, game_port: int, pin_required: bool,
+                                    **opts) -> DiscoveryResponder:
+    """Answer probes on `dport` on the running loop; `opts` go to DiscoveryResponder."""
+    return await DiscoveryResponder(name, game_port, pin_required, **opts).start(listen_ip, dport)
 
 # ---- helpers ----
 ENC = "utf-8"
@@ -54,124 +201,1012 @@ async def read_json_line(reader: asyncio.StreamReader):
     except json.JSONDecodeError:
         return {"type": "error", "error": "bad_json"}
 
+HELLO_FIELDS = frozenset(("type", "name", "pin", "room", "role", "wire", "token", "match"))
+MAX_FIELD = 64  # characters per hello string; keeps a hello far below a broker packet
+
+def clean_hello(hello):
+    """`hello` with only the known fields, scalars only, strings cut to
+    MAX_FIELD characters; None if it isn't a JSON object."""
+    if not isinstance(hello, dict):
+        return None
+    out = {}
+    for key in HELLO_FIELDS & hello.keys():
+        v = hello[key]
+        if isinstance(v, str):
+            v = v[:MAX_FIELD]
+        elif v is not None and not isinstance(v, (bool, int, float)):
+            continue
+        out[key] = v
+    return out
+
 async def send(player, data):
+    local = player.get("local")
+    if local is not None:
+        local.deliver((data,))
+        return
+    codec = player.get("codec")
     try:
-        player["writer"].write(dumps(data))
+        player["writer"].write(codec.encode(data) if codec else dumps(data))
         await player["writer"].drain()
     except Exception:
         pass
 
+async def recv(player, metrics=None):
+    """Next message from a player in whichever framing they negotiated."""
+    local = player.get("local")
+    if local is not None:
+        return await local.receive()
+    codec = player.get("codec")
+    if codec is None:
+        try:
+            line = await player["reader"].readline()
+        except ValueError:  # over the reader's limit; the line is discarded
+            return {"type": "error", "error": "bad_json"}
+        if not line:
+            return None
+        if metrics is not None:
+            metrics.bytes_in.inc(len(line))
+        try:
+            msg = json.loads(line.decode(ENC))
+        except ValueError:  # bad JSON or bad UTF-8
+            return {"type": "error", "error": "bad_json"}
+        return msg if isinstance(msg, dict) else {"type": "error", "error": "bad_json"}
+    payload = await wire.read_frame(player["reader"])
+    if payload is None:
+        return None
+    if metrics is not None:
+        metrics.bytes_in.inc(len(payload) + 2)
+    try:
+        return codec.decode(payload)
+    except ValueError:
+        return {"type": "error", "error": "bad_frame"}
+
+def encode_for(player, msg, cache=None) -> bytes:
+    """Bytes for `msg` in the player's framing. JSON lines are shared through
+    `cache` (keyed by message identity); binary codecs keep per-player state."""
+    codec = player.get("codec")
+    if codec is not None:
+        return codec.encode(msg)
+    if cache is None:
+        return dumps(msg)
+    data = cache.get(id(msg))
+    if data is None:
+        data = cache[id(msg)] = dumps(msg)
+    return data
+
+# ---- In-process players ----
+class LocalPeer:
+    """A player in the server's own process (the embedded host, see
+    EmbeddedServer): messages pass as dicts through two queues, with no
+    socket and no serialization. Like bots.Bot it stands in for both the
+    reader and the writer, so Session treats it as any other seat.
+
+    The server side uses deliver()/receive(); the client side, on the same
+    event loop, uses send()/recv()/hang_up().
+    """
+    def __init__(self):
+        self.transport = self
+        self.closed = False         # server closed the seat
+        self.client_closed = False  # client hung up
+        self._to_server: asyncio.Queue = asyncio.Queue()
+        self._to_client: asyncio.Queue = asyncio.Queue()
+
+    # -- server side: the bits of StreamReader/StreamWriter/Transport in use --
+    def deliver(self, msgs) -> None:
+        if not self.closed:
+            for m in msgs:
+                self._to_client.put_nowait(m)
+
+    async def receive(self):
+        """Next message from the client; None once it hung up."""
+        return await self._to_server.get()
+
+    def write(self, data: bytes) -> None:
+        # Only handshake refusals are written as bytes.
+        self.deliver(json.loads(line) for line in data.decode(ENC).splitlines() if line)
+
+    async def drain(self) -> None:
+        pass
+
+    async def wait_closed(self) -> None:
+        pass
+
+    def get_write_buffer_size(self) -> int:
+        return 0
+
+    def get_extra_info(self, name, default=None):
+        return default
+
+    def at_eof(self) -> bool:
+        return self.client_closed and self._to_server.empty()
+
+    def is_closing(self) -> bool:
+        return self.closed
+
+    def close(self) -> None:
+        if not self.closed:
+            self.closed = True
+            self._to_client.put_nowait(None)
+
+    abort = close
+
+    # -- client side --
+    def send(self, msg: dict) -> None:
+        if not self.client_closed:
+            self._to_server.put_nowait(msg)
+
+    async def recv(self):
+        """Next message for the client; None once the server closed the seat."""
+        return await self._to_client.get()
+
+    def hang_up(self) -> None:
+        if not self.client_closed:
+            self.client_closed = True
+            self._to_server.put_nowait(None)
+
+# ---- Spectators ----
+class Watcher:
+    __slots__ = ("writer", "binary", "seen")
+
+    def __init__(self, writer, binary: bool):
+        self.writer = writer
+        self.binary = binary
+        self.seen = 0  # version of the last state this watcher was sent
+
+class FanOut:
+    """Streams one session to its spectators. Each update is serialized once
+    per framing and the same bytes go to every watcher. A watcher whose send
+    buffer is over `max_buffer` is skipped, which keeps at most one pending
+    update per watcher: it gets a full snapshot of the latest state when it
+    has drained. Writes happen in slices from a background task, so the
+    players' own messages never wait for the fan-out."""
+    SLICE = 32  # watchers written between yields to the event loop
+
+    def __init__(self, max_buffer: int = 64 * 1024, close_timeout: float = 5.0):
+        self.watchers = {}
+        self.max_buffer = max_buffer
+        self.close_timeout = close_timeout
+        self.version = 0
+        self.state = None      # latest state, the snapshot for late joiners
+        self.tail = []         # messages after it (e.g. end)
+        self.closed = False
+        self._codec = wire.Codec()  # shared delta frames
+        self._codec_version = 0     # version the shared codec last encoded
+        self._pending = False
+        self._task = None
+        self.metrics = None
+
+    def __len__(self):
+        return len(self.watchers)
+
+    def publish(self, state: dict, tail=(), cache=None) -> None:
+        self.version += 1
+        self.state, self.tail = state, list(tail)
+        if self.tail and self.tail[-1].get("type") == "end":
+            self.closed = True
+        self._json = b"".join(encode_for({}, m, cache) for m in (state, *self.tail))
+        self._pending = True
+        if self.watchers and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._pump())
+
+    def _snapshot(self, binary: bool) -> bytes:
+        if not binary:
+            return self._json
+        c = wire.Codec()
+        return b"".join(c.encode(m) for m in (self.state, *self.tail))
+
+    def add(self, writer, binary: bool, hello: dict) -> Watcher:
+        """Register a watcher and send it `hello` plus the current snapshot."""
+        w = Watcher(writer, binary)
+        c = wire.Codec() if binary else None
+        writer.write(c.encode(hello) if c else dumps(hello))
+        if self.state is not None:
+            writer.write(self._snapshot(binary))
+            w.seen = self.version
+        if self.closed:
+            writer.close()
+        else:
+            self.watchers[id(w)] = w
+        return w
+
+    def remove(self, w: Watcher) -> None:
+        self.watchers.pop(id(w), None)
+
+    async def _pump(self):
+        while self._pending:
+            self._pending = False
+            v, prev = self.version, self._codec_version
+            delta = b"".join(self._codec.encode(m) for m in (self.state, *self.tail))
+            self._codec_version = v
+            shared = {False: self._json, True: delta}
+            full = None
+            watchers = list(self.watchers.values())
+            m, sent, peak = self.metrics, 0, 0
+            for n in range(0, len(watchers), self.SLICE):
+                await asyncio.sleep(0)  # let player traffic through first
+                if self.version != v:
+                    break  # a newer update is pending; it goes to everyone
+                for w in watchers[n:n + self.SLICE]:
+                    writer = w.writer
+                    if w.seen >= v:
+                        continue
+                    if writer.is_closing():
+                        self.remove(w)
+                        continue
+                    buffered = writer.transport.get_write_buffer_size()
+                    if buffered > self.max_buffer:
+                        continue  # skip this update; catch up with a snapshot later
+                    if not w.binary or w.seen == prev:
+                        data = shared[w.binary]
+                    else:
+                        if full is None:
+                            full = self._snapshot(True)
+                        data = full
+                    writer.write(data)
+                    w.seen = v
+                    if m is not None:
+                        sent += len(data)
+                        peak = max(peak, buffered + len(data))
+            if m is not None:
+                m.bytes_out.inc_by("spectator", sent)
+                m.hw_spectator = max(m.hw_spectator, peak)
+        if self.closed:
+            self._close_all()
+
+    def _close_all(self) -> None:
+        for w in list(self.watchers.values()):
+            if w.seen == self.version:
+                w.writer.close()
+            else:
+                asyncio.create_task(self._catch_up(w))
+        self.watchers.clear()
+
+    async def _catch_up(self, w: Watcher) -> None:
+        """Final snapshot for a watcher that fell behind, once it drains."""
+        try:
+            await asyncio.wait_for(w.writer.drain(), self.close_timeout)
+            w.writer.write(self._snapshot(w.binary))
+            w.writer.close()
+        except Exception:
+            w.writer.transport.abort()
+
 # ---- Game session on server ----
+SLOW_POLICIES = ("disconnect", "drop")
+YOUR_TURN = {"type": "your_turn"}
+IN_TYPES = ("move", "quit", "error")  # metric labels; other client types count as "other"
+_session_ids = itertools.count(1)
+
 class Session:
-    def __init__(self, pX, pO):
-        self.game = Game.new()
+    def __init__(self, pX, pO, width: int = 3, height: int = 3, k: int = 3, on_close=None,
+                 max_buffer: int = 256 * 1024, drain_timeout: float = 5.0, slow_policy: str = "disconnect",
+                 watcher_buffer: int = 64 * 1024, journal=None, match_id: int | None = None,
+                 grace: float = 0.0, metrics=None):
+        self.id = match_id or next(_session_ids)
+        self.game = new_game(width, height, k)
         self.players = {"X": pX, "O": pO}
+        self.journal = journal
+        self.end_reason = None
         self.closed = False
+        self.on_close = on_close
+        self.tasks = []
+        self._finished = False
+        # Backpressure: a peer with more than max_buffer bytes unsent, or
+        # whose drain takes longer than drain_timeout, is a slow consumer.
+        self.max_buffer = max_buffer
+        self.drain_timeout = drain_timeout
+        self.slow_policy = slow_policy
+        self.spectators = FanOut(watcher_buffer, drain_timeout)
+        self.spectators.metrics = self.metrics = metrics
+        # Reconnects: a dropped player keeps their seat for `grace` seconds
+        # and comes back by presenting tokens[mark].
+        self.grace = grace
+        self.tokens = {}
+        self.away = {}  # mark -> TimerHandle ending the match
 
-    async def broadcast_state(self, terminal_reason: str | None = None):
-        msg = {
+    def _state_msg(self) -> dict:
+        return {
             "type": "state",
-            "board": self.game.board,
+            "board": list(self.game.board),  # spectators may encode it later
             "turn": self.game.turn,
             "terminal": self.game.terminal(),
             "winner": self.game.winner(),
+            "width": self.game.width,
+            "height": self.game.height,
+            "k": self.game.k,
         }
-        for p in self.players.values():
-            await send(p, msg)
+
+    async def broadcast_state(self, terminal_reason: str | None = None, before=None):
+        """State to both players, followed by `end` or the mover's `your_turn`,
+        as one write per player. `before` maps mark -> messages to send first."""
+        state = self._state_msg()
+        batches = {m: [*(before or {}).get(m, ()), state] for m in self.players}
+        tail = []
         if terminal_reason or self.game.terminal():
-            for p in self.players.values():
-                await send(p, {"type": "end", "reason": terminal_reason or ("winner" if self.game.winner() else "draw")})
+            tail.append({"type": "end", "reason": terminal_reason or ("winner" if self.game.winner() else "draw")})
+            for msgs in batches.values():
+                msgs.extend(tail)
+        else:
+            batches[self.game.turn].append(YOUR_TURN)
+        cache = {}
+        # Spectators get the same bytes, queued once the players are written.
+        await self.deliver(batches, cache, then=lambda: self.spectators.publish(state, tail, cache))
+
+    async def deliver(self, batches, cache=None, then=None) -> None:
+        """Write each player's messages as one chunk, call `then`, and drain
+        all players concurrently so a slow one can't hold up the other."""
+        if cache is None:
+            cache = {}
+        drains = []
+        metrics = self.metrics
+        for mark, msgs in batches.items():
+            p = self.players[mark]
+            if metrics is not None:
+                for m in msgs:
+                    metrics.messages_out.inc_by(m.get("type") or m.get("status", "?"))
+            if "local" in p:
+                p["local"].deliver(msgs)
+                continue
+            if self._push(p, msgs, cache):
+                drains.append(self._drain(p))
+        if then is not None:
+            then()
+        if len(drains) == 1:
+            await drains[0]
+        elif drains:
+            await asyncio.gather(*drains)
+
+    def _push(self, player, msgs, cache) -> bool:
+        """Queue `msgs` as one chunk; True if it didn't all go out and needs
+        draining. Under the drop policy only states are ever skipped: the
+        next one makes up for them, but nothing makes up for a lost `end`
+        or `your_turn`."""
+        writer = player["writer"]
+        if writer.is_closing():
+            return False
+        data = b"".join(encode_for(player, m, cache) for m in msgs)
+        transport = writer.transport
+        if transport.get_write_buffer_size() + len(data) > self.max_buffer:
+            self._slow(player, "buffer full")
+            if writer.is_closing():
+                return False
+            data = b"".join(encode_for(player, m, cache) for m in msgs if m.get("type") != "state")
+            if not data:
+                return False
+        writer.write(data)
+        buffered = transport.get_write_buffer_size()
+        if self.metrics is not None:
+            self.metrics.bytes_out.inc_by("player", len(data))
+            if buffered > self.metrics.hw_player:
+                self.metrics.hw_player = buffered
+        return buffered > 0
+
+    async def _drain(self, player) -> None:
+        try:
+            await asyncio.wait_for(player["writer"].drain(), self.drain_timeout)
+        except asyncio.TimeoutError:
+            self._slow(player, "drain timeout")
+        except Exception:
+            pass
+
+    def _slow(self, player, why: str) -> None:
+        logging.warning(f"Slow consumer {player['name']} ({why}): {self.slow_policy}")
+        if self.slow_policy == "drop":
+            # Whatever we skipped, the next state must be a full one.
+            if player.get("codec") is not None:
+                player["codec"].resync()
+        else:
+            # Abort rather than close: close would wait on the full buffer.
+            # The reader sees EOF and the peer is told about the disconnect.
+            player["writer"].transport.abort()
+
+    def _seat_msg(self, status: str, mark: str) -> dict:
+        msg = {"status": status, "you": mark, "opponent": self.players["O" if mark == "X" else "X"]["name"]}
+        if mark in self.tokens:
+            msg["token"] = self.tokens[mark]
+        return msg
 
     async def start(self):
-        await send(self.players["X"], {"status":"matched","you":"X","opponent": self.players["O"]["name"]})
-        await send(self.players["O"], {"status":"matched","you":"O","opponent": self.players["X"]["name"]})
+        await self.broadcast_state(before={m: [self._seat_msg("matched", m)] for m in self.players})
+        self.tasks = [asyncio.create_task(self.listen_player("X")),
+                      asyncio.create_task(self.listen_player("O"))]
+
+    def finish(self):
+        """Close both connections and tell the owner, once."""
+        if self._finished:
+            return
+        self._finished = True
+        self.closed = True
+        for timer in self.away.values():
+            timer.cancel()
+        self.away.clear()
+        if self.journal is not None:
+            reason = self.end_reason or "disconnect"
+            if self.game.terminal():
+                reason = "winner" if self.game.winner() else "draw"
+            self.journal.end(self.id, reason)
+        if not self.spectators.closed:
+            self.spectators.publish(self._state_msg(), [{"type": "end", "reason": "disconnect"}])
+        for p in self.players.values():
+            try:
+                p["writer"].close()
+            except Exception:
+                pass
+        if self.on_close:
+            self.on_close(self)
+
+    async def play_move(self, mark: str, idx: int) -> str | None:
+        """Apply `mark`'s move (1-based) and broadcast it; the error name if
+        it's refused. The move that ends the game closes the session."""
+        t0 = time.perf_counter()
+        if self.game.turn != mark:
+            return "not_your_turn"
+        if not (1 <= idx <= len(self.game.board)) or not self.game.play(idx):
+            return "invalid_move"
+        if self.journal is not None:
+            self.journal.move(self.id, idx - 1)  # buffered; written off the loop
         await self.broadcast_state()
-        await send(self.players["X"], {"type":"your_turn"})
-        asyncio.create_task(self.listen_player("X"))
-        asyncio.create_task(self.listen_player("O"))
+        if self.metrics is not None:
+            self.metrics.moves.inc()
+            self.metrics.move_seconds.observe(time.perf_counter() - t0)
+        if self.game.terminal():
+            self.closed = True
+            self.finish()
+        return None
 
     async def listen_player(self, mark: str):
-        reader = self.players[mark]["reader"]
-        peer = self.players["O" if mark=="X" else "X"]
+        me = self.players[mark]
+        reader = me["reader"]
+        other = "O" if mark=="X" else "X"
+        if "bot" in me:
+            await me["bot"].run(self, mark)
+            return
         try:
             while not reader.at_eof() and not self.closed:
-                msg = await read_json_line(reader)
+                msg = await recv(me, self.metrics)
                 if msg is None:
                     break
                 mtype = msg.get("type")
+                if self.metrics is not None:
+                    self.metrics.messages_in.inc_by(mtype if mtype in IN_TYPES else "other")
                 if mtype == "move":
-                    idx = int(msg.get("idx", 0))
-                    if self.game.turn != mark:
-                        await send(self.players[mark], {"type":"error","error":"not_your_turn"})
-                        continue
-                    if not (1 <= idx <= 9) or not self.game.play(idx):
-                        await send(self.players[mark], {"type":"error","error":"invalid_move"})
-                        continue
-                    await self.broadcast_state()
-                    if self.game.terminal():
-                        self.closed = True
+                    idx = msg.get("idx")
+                    err = await self.play_move(mark, idx) if type(idx) is int else "invalid_move"
+                    if err:
+                        await self.deliver({mark: [{"type":"error","error":err}]})
+                    elif self.closed:
                         break
-                    await send(self.players[self.game.turn], {"type":"your_turn"})
                 elif mtype == "quit":
                     self.closed = True
-                    await send(peer, {"type":"end","reason":"opponent_quit"})
+                    self.end_reason = "opponent_quit"
+                    await self.deliver({other: [{"type":"end","reason":"opponent_quit"}]})
                     break
                 else:
                     pass
-        except Exception as e:
-            if not self.closed:
-                self.closed = True
-                await send(peer, {"type":"end","reason":"disconnect"})
+        except (OSError, EOFError):
+            pass  # connection lost: same as EOF
+        if self.players[mark] is not me:
+            return  # the seat was taken over by a reconnect
+        if not self.closed and self.grace and self.tokens:
+            await self._detach(mark)
+            return
+        if not self.closed:
+            self.closed = True
+            await self.deliver({other: [{"type":"end","reason":"disconnect"}]})
+        self.finish()
+
+    async def _detach(self, mark: str) -> None:
+        """Hold a dropped player's seat open for `grace` seconds."""
+        other = "O" if mark == "X" else "X"
+        logging.info(f"{self.players[mark]['name']} dropped from match {self.id}; holding seat {self.grace:g}s")
+        self.away[mark] = asyncio.get_running_loop().call_later(self.grace, self._expire, mark)
+        await self.deliver({other: [{"type": "opponent_away", "grace": self.grace}]})
+
+    def _expire(self, mark: str) -> None:
+        self.away.pop(mark, None)
+        if not self.closed:
+            self.closed = True
+            self.tasks.append(asyncio.create_task(self._abandon(mark)))
+
+    async def _abandon(self, mark: str) -> None:
+        other = "O" if mark == "X" else "X"
+        await self.deliver({other: [{"type": "end", "reason": "disconnect"}]})
+        self.finish()
+
+    async def rejoin(self, mark: str, player: dict) -> None:
+        """Give `mark`'s seat to a reconnected `player`. They get `resumed`,
+        the current board (which covers every state they missed) and
+        `your_turn` if it is theirs."""
+        timer = self.away.pop(mark, None)
+        if timer is not None:
+            timer.cancel()
+        old, self.players[mark] = self.players[mark], player
+        player["name"] = old["name"]
+        if not old["writer"].is_closing():
+            old["writer"].transport.abort()  # half-open; its listener sees EOF and steps aside
+        other = "O" if mark == "X" else "X"
+        msgs = [self._seat_msg("resumed", mark), self._state_msg()]
+        if self.game.turn == mark:
+            msgs.append(YOUR_TURN)
+        logging.info(f"{player['name']} rejoined match {self.id}")
+        await self.deliver({mark: msgs, other: [{"type": "opponent_back"}]})
+        self.tasks.append(asyncio.create_task(self.listen_player(mark)))
+
+# ---- Rooms and matchmaking ----
+class Room:
+    """Named match room with its own PIN and FIFO matchmaking queue.
+    The lobby is the room named "" and uses the server PIN."""
+    __slots__ = ("name", "pin", "waiting", "sessions", "parked")
+
+    def __init__(self, name: str, pin: str):
+        self.name = name
+        self.pin = pin
+        self.waiting = OrderedDict()  # id(player) -> player waiting for an opponent, oldest first
+        self.sessions = set()
+        self.parked = 0  # recovered matches waiting for their players
+
+    def idle(self) -> bool:
+        return not self.waiting and not self.sessions and not self.parked
+
+def _gone(player) -> bool:
+    """True if a queued player's connection has dropped."""
+    return player["reader"].at_eof() or player["writer"].is_closing()
+
+def _unqueue(room: Room, player):
+    """Take `player` out of the room's queue; None if they're not there."""
+    if room.waiting.pop(id(player), None) is None or _gone(player):
+        return None
+    return player
 
 # ---- Main server that matches players and (optionally) self-joins ----
 class TicTacToeServer:
-    def __init__(self, pin: str):
+    def __init__(self, pin: str, width: int = 3, height: int = 3, k: int = 3,
+                 max_rooms: int = 20000, sweep_interval: float = 5.0,
+                 slow_policy: str = "disconnect", max_buffer: int = 256 * 1024, drain_timeout: float = 5.0,
+                 watcher_buffer: int = 64 * 1024, journal=None, resume_grace: float = 30.0,
+                 bot_after: float = 0.0, bot_difficulty: str = "Medium", bot_workers: int = 2):
+        if slow_policy not in SLOW_POLICIES:
+            raise ValueError(f"slow_policy must be one of {SLOW_POLICIES}")
         self.pin = pin
-        self.waiting = None
+        self.dims = (width, height, k)
+        self.session_opts = {"slow_policy": slow_policy, "max_buffer": max_buffer,
+                             "drain_timeout": drain_timeout, "watcher_buffer": watcher_buffer,
+                             "grace": resume_grace}
+        self.rooms = {"": Room("", pin)}
         self.sessions = set()
+        self.seats = {}  # resume token -> (session, mark)
+        self.max_rooms = max_rooms
+        self.sweep_interval = sweep_interval
+        self._sweeper = None
+        # AI seats for players nobody pairs with within bot_after seconds
+        self.bot_after = bot_after
+        self.bots = None
+        if bot_after > 0:
+            from .bots import BotPool
+            self.bots = BotPool(bot_workers, bot_difficulty)
+        self._bot_moves = 0
+        self.metrics = None
+        # Matches recovered from the journal, waiting for their players:
+        # token digest -> ({"match": journal.Match, "room": Room, "seats": {"X": player|None, ...},
+        #                   "tokens": {"X": token, ...}, "expires": monotonic time}, mark)
+        # Like a dropped live seat, each waits at most resume_grace.
+        self.journal = journal
+        self.suspended = {}
+        self._match_ids = itertools.count(1)
+        if journal is not None:
+            self._recover()
+
+    def _recover(self) -> None:
+        from .journal import load
+        matches = load(self.journal.path)
+        for m in matches.values():
+            if m.end is not None or None in m.seats:
+                continue  # finished, or a bot seat nobody can claim
+            room = self.rooms.get(m.room)
+            if room is None:
+                room = self.rooms[m.room] = Room(m.room, m.pin)
+            room.parked += 1  # keeps the room, and its PIN, until the match resumes or expires
+            entry = {"match": m, "room": room, "seats": {"X": None, "O": None}, "tokens": {},
+                     "expires": time.monotonic() + self.session_opts["grace"]}
+            for mark, digest in zip("XO", m.seats):
+                self.suspended[digest] = (entry, mark)
+        self._match_ids = itertools.count(max(matches, default=0) + 1)  # never reuse a match id
+        if self.suspended:
+            logging.info(f"Recovered {len(self.suspended) // 2} unfinished match(es)")
+
+    @property
+    def lobby(self) -> Room:
+        return self.rooms[""]
+
+    def waiting_count(self) -> int:
+        return sum(len(r.waiting) for r in self.rooms.values())
+
+    def load(self) -> dict:
+        """Load figures for discovery replies."""
+        waiting = self.waiting_count()
+        return {"rooms": len(self.rooms) - 1, "sessions": len(self.sessions),
+                "waiting": waiting, "players": 2 * len(self.sessions) + waiting}
+
+    def _room_for(self, hello: dict):
+        """(room, error) for a hello; unknown room names are created with the
+        PIN the first player sends."""
+        name = str(hello.get("room") or "")
+        pin = hello.get("pin")
+        room = self.rooms.get(name)
+        if room is None:
+            if not pin:
+                return None, "auth_failed"
+            if len(self.rooms) >= self.max_rooms:
+                return None, "too_many_rooms"
+            room = self.rooms[name] = Room(name, pin)
+            logging.info(f"Room {name!r} created")
+        elif pin != room.pin:
+            return None, "auth_failed"
+        return room, None
+
+    def _pop_opponent(self, room: Room):
+        while room.waiting:
+            _, opp = room.waiting.popitem(last=False)
+            if not _gone(opp):
+                return opp
+        return None
+
+    def _new_token(self) -> str:
+        return secrets.token_urlsafe(12)
+
+    def _session_closed(self, ses: Session, room: Room) -> None:
+        for token in ses.tokens.values():
+            self.seats.pop(token, None)
+        self.sessions.discard(ses)
+        room.sessions.discard(ses)
+        self._drop_if_idle(room)
+
+    def _drop_if_idle(self, room: Room) -> None:
+        if room.name and room.idle() and self.rooms.get(room.name) is room:
+            del self.rooms[room.name]
+
+    def close(self) -> None:
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            self._sweeper = None
+        if self.bots is not None:
+            self.bots.close()
+        if self.metrics is not None:
+            self.metrics.stop()
+
+    def enable_metrics(self, interval: float = 1.0):
+        """Start collecting metrics; returns the metrics.ServerMetrics registry."""
+        from .metrics import ServerMetrics
+        def humans():
+            return sum(1 for s in self.sessions for p in s.players.values()
+                       if "bot" not in p and not p["writer"].is_closing())
+        def spectators():
+            return sum(len(s.spectators) for s in self.sessions)
+        self.metrics = ServerMetrics({
+            "connections": lambda: humans() + self.waiting_count() + spectators(),
+            "waiting_players": self.waiting_count,
+            "sessions": lambda: len(self.sessions),
+            "spectators": spectators,
+        }, interval)
+        self.session_opts["metrics"] = self.metrics
+        if self.bots is not None:
+            self.bots.metrics = self.metrics
+        self.metrics.start()
+        return self.metrics
+
+    def _arm_bot(self, room: Room, take) -> None:
+        """In bot_after seconds, seat a bot against the player `take()`
+        removes from the queue (it returns None if they were paired or left)."""
+        def fire():
+            me = take()
+            if me is not None:
+                from .bots import Bot
+                logging.info(f"No opponent for {me['name']}; seating a bot")
+                asyncio.create_task(self._start_session(room, me, Bot(self.bots).player()).start())
+        if self.bots is not None:
+            asyncio.get_running_loop().call_later(self.bot_after, fire)
+
+    def _log_bots(self) -> None:
+        if self.bots is not None and self.bots.moves != self._bot_moves:
+            self._bot_moves = self.bots.moves
+            st = self.bots.stats()
+            logging.info(f"Bot moves {st['moves']}: think {st['think_ms_mean']:.1f} ms mean, "
+                         f"{st['think_ms_max']:.1f} ms max, queue wait {st['wait_ms_mean']:.1f} ms mean")
+
+    async def _sweep(self):
+        """Forget queued players whose connection dropped, and empty rooms."""
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            self._log_bots()
+            self._expire_parked()
+            for room in list(self.rooms.values()):
+                for key in [k for k, p in room.waiting.items() if _gone(p)]:
+                    del room.waiting[key]
+                self._drop_if_idle(room)
+
+    def _expire_parked(self) -> None:
+        now = time.monotonic()
+        for entry, mark in list(self.suspended.values()):
+            if mark == "X" and entry["expires"] <= now:
+                self._give_up(entry)
+
+    def _give_up(self, entry: dict) -> None:
+        """End a recovered match whose players didn't both come back: free
+        its room and close it in the journal so no restart brings it back."""
+        m = entry["match"]
+        for digest in m.seats:
+            self.suspended.pop(digest, None)
+        entry["room"].parked -= 1
+        self.journal.end(m.id, "disconnect")
+        for p in entry["seats"].values():
+            if p is not None and not _gone(p):
+                p["writer"].write(encode_for(p, {"type": "end", "reason": "disconnect"}))
+                p["writer"].close()
+        self._drop_if_idle(entry["room"])
+        logging.info(f"Recovered match {m.id} expired before both players came back")
 
     async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        if self._sweeper is None:
+            self._sweeper = asyncio.create_task(self._sweep())
+        t0 = time.perf_counter()
+        if self.metrics is not None:
+            self.metrics.connections_total.inc()
         addr = writer.get_extra_info("peername")
         logging.info(f"Conn from {addr}")
         try:
             hello = await asyncio.wait_for(read_json_line(reader), timeout=10.0)
         except asyncio.TimeoutError:
             writer.close(); await writer.wait_closed(); return
-        if not hello or hello.get("pin") != self.pin:
-            writer.write(dumps({"error":"auth_failed"})); await writer.drain()
+        except ValueError:
+            hello = None  # a line over the reader's limit
+        hello = clean_hello(hello)
+        if hello and self.metrics is not None:
+            self.metrics.messages_in.inc_by("hello")
+        if hello and hello.get("role") == "spectator":
+            await self._spectate(hello, reader, writer)
+            return
+        if not hello:
+            writer.write(dumps({"error": "auth_failed"})); await writer.drain()
+            writer.close(); await writer.wait_closed(); return
+        await self.admit(hello, reader, writer)
+        if self.metrics is not None:
+            self.metrics.handshake.observe(time.perf_counter() - t0)
+
+    def _player(self, hello: dict, reader, writer) -> dict:
+        me = {"name": hello.get("name") or "Player", "reader": reader, "writer": writer}
+        if isinstance(writer, LocalPeer):
+            me["local"] = writer
+            return me
+        if hello.get("wire") == wire.NAME:
+            # Acknowledge in JSON; everything after this line is binary frames.
+            writer.write(dumps({"type": "wire", "wire": wire.NAME}))
+            me["codec"] = wire.Codec()
+        return me
+
+    def _start_session(self, room: Room, pX, pO, match=None, tokens=None) -> Session:
+        """New session in `room`; `match` is a recovered journal.Match to
+        continue, and `tokens` the resume tokens its players came back with."""
+        ses = Session(pX, pO, *(match.dims if match else self.dims),
+                      on_close=lambda s, room=room: self._session_closed(s, room),
+                      journal=self.journal, match_id=match.id if match else next(self._match_ids),
+                      **self.session_opts)
+        for mark, p in ses.players.items():
+            if "bot" in p:
+                continue
+            token = ses.tokens[mark] = (tokens or {}).get(mark) or self._new_token()
+            self.seats[token] = (ses, mark)
+        if match is not None:
+            for cell in match.moves:
+                ses.game.play(cell + 1)
+        elif self.journal is not None:
+            self.journal.start(ses.id, room.name, self.dims, pX["name"], pO["name"],
+                               pin=room.pin if room.name else "",
+                               x_token=ses.tokens.get("X"), o_token=ses.tokens.get("O"))
+        self.sessions.add(ses)
+        room.sessions.add(ses)
+        return ses
+
+    async def resume(self, token: str, hello: dict, reader, writer):
+        """Seat a player back in a match recovered from the journal; the
+        match starts again once both seats are back."""
+        from .journal import seat_digest
+        entry, mark = self.suspended[seat_digest(token)]
+        m, seats = entry["match"], entry["seats"]
+        if seats[mark] is not None:
+            seats[mark]["writer"].close()  # a newer connection with the token wins
+        me = seats[mark] = self._player(hello, reader, writer)
+        entry["tokens"][mark] = token
+        if any(p is None or _gone(p) for p in seats.values()):
+            await send(me, {"status": "waiting_for_opponent"})
+            return
+        for digest in m.seats:
+            del self.suspended[digest]
+        entry["room"].parked -= 1
+        logging.info(f"Match {m.id} resumed after {len(m.moves)} moves")
+        await self._start_session(entry["room"], seats["X"], seats["O"], match=m, tokens=entry["tokens"]).start()
+
+    async def rejoin(self, hello: dict, reader, writer):
+        """Seat a dropped player back in their match by resume token: a live
+        one, or one recovered from the journal after a restart."""
+        token = str(hello.get("token"))
+        seat = self.seats.get(token)
+        if seat is None and self.suspended:
+            from .journal import seat_digest
+            if seat_digest(token) in self.suspended:
+                await self.resume(token, hello, reader, writer)
+                return
+        if seat is None or seat[0].closed:
+            writer.write(dumps({"error": "bad_token"})); await writer.drain()
             writer.close(); await writer.wait_closed(); return
-        name = hello.get("name") or "Player"
+        ses, mark = seat
+        await ses.rejoin(mark, self._player(hello, reader, writer))
 
-        me = {"name": name, "reader": reader, "writer": writer}
-        if self.waiting is None:
-            self.waiting = me
-            writer.write(dumps({"status":"waiting_for_opponent"})); await writer.drain()
-            logging.info(f"{name} waiting for opponent")
+    async def admit(self, hello: dict, reader, writer):
+        """Seat a player who sent `hello`: pair them or queue them."""
+        if hello.get("token"):
+            await self.rejoin(hello, reader, writer)
+            return
+        room, err = self._room_for(hello)
+        if err:
+            writer.write(dumps({"error": err})); await writer.drain()
+            writer.close(); await writer.wait_closed(); return
+        me = self._player(hello, reader, writer)
+        opp = self._pop_opponent(room)
+        if opp is None:
+            room.waiting[id(me)] = me
+            self._arm_bot(room, lambda: _unqueue(room, me))
+            await send(me, {"status":"waiting_for_opponent"})
+            logging.info(f"{me['name']} waiting for opponent")
         else:
-            opp = self.waiting
-            self.waiting = None
-            ses = Session(pX=opp, pO=me)  # first is X, second O
-            self.sessions.add(ses)
-            await ses.start()
-
-async def self_join(host: str, port: int, pin: str, name: str):
-    """Dial the server we just started and take a seat as a normal client."""
-    try:
-        reader, writer = await asyncio.open_connection("127.0.0.1", port)
-        writer.write(dumps({"type":"hello","name": name, "pin": pin}))
-        await writer.drain()
-        # Keep the connection alive; just read and discard to avoid closing.
-        while True:
-            line = await reader.readline()
-            if not line:
-                break
-        writer.close(); await writer.wait_closed()
-    except Exception as e:
-        logging.error(f"Self-join failed: {e}")
+            # first is X, second O
+            await self._start_session(room, opp, me).start()
+
+    def _match_in(self, room: Room, match=None):
+        """The session to watch: `match` by id, else the newest in the room."""
+        if match is not None:
+            return next((s for s in room.sessions if s.id == match), None)
+        return max(room.sessions, key=lambda s: s.id, default=None)
+
+    async def _spectate(self, hello: dict, reader, writer):
+        room = self.rooms.get(str(hello.get("room") or ""))
+        ses, err = None, "auth_failed"
+        if room is not None and hello.get("pin") == room.pin:
+            ses = self._match_in(room, hello.get("match"))
+            err = None if ses is not None and not ses.spectators.closed else "no_match"
+        if err:
+            writer.write(dumps({"error": err})); await writer.drain()
+            writer.close(); await writer.wait_closed(); return
+        binary = hello.get("wire") == wire.NAME
+        if binary:
+            writer.write(dumps({"type": "wire", "wire": wire.NAME}))
+        w = ses.spectators.add(writer, binary, {"status": "watching", "match": ses.id,
+                                                "x": ses.players["X"]["name"], "o": ses.players["O"]["name"]})
+        # Spectators have nothing to say; just notice when they leave.
+        try:
+            while True:
+                if binary:
+                    if await wire.read_frame(reader) is None:
+                        break
+                elif not await reader.readline():
+                    break
+        except Exception:
+            pass
+        finally:
+            ses.spectators.remove(w)
+            writer.close()
+
+async def join_local(server: TicTacToeServer, pin: str, name: str) -> LocalPeer:
+    """Seat `name` in `server`'s lobby through a LocalPeer (on its loop)."""
+    peer = LocalPeer()
+    asyncio.create_task(server.admit({"type": "hello", "name": name, "pin": pin}, peer, peer))
+    return peer
+
+async def host_seat(server: TicTacToeServer, pin: str, name: str):
+    """--host-plays: the host takes a seat in its own server, with no
+    loopback socket, and only reads (discards) until the seat closes."""
+    peer = await join_local(server, pin, name)
+    while await peer.recv() is not None:
+        pass
 
 # ---- Entrypoint ----
-async def amain(host, port, pin, discovery_port, host_plays: bool, host_name: str):
-    server = TicTacToeServer(pin)
+async def serve_metrics(server: TicTacToeServer, host: str, port: int, interval: float = 1.0):
+    """Turn on the server's metrics and serve them over HTTP at /metrics."""
+    from . import metrics
+    srv = await metrics.serve(server.enable_metrics(interval), host, port)
+    logging.info(f"Metrics on http://{host}:{srv.sockets[0].getsockname()[1]}/metrics")
+    return srv
+
+class EmbeddedServer:
+    """A TicTacToeServer on a background event loop in this process, for
+    the GUI's Host button: no interpreter to start, and the host's own
+    player sits in through a LocalPeer (`join_local`) instead of a loopback
+    socket. Remote players connect over TCP and find it through the usual
+    discovery responder and announcements.
+
+        emb = EmbeddedServer("1234", name="Ann").start()
+        emb.port                      # bound port (0 picks a free one)
+        peer = asyncio.run_coroutine_threadsafe(emb.join_local("Ann"), emb.loop).result()
+        ...
+        emb.stop()
+    """
+    def __init__(self, pin: str, host: str = "0.0.0.0", port: int = 0, name: str = "Host",
+                 width: int = 3, height: int = 3, k: int = 3, discovery_port: int | None = 9998,
+                 announce_port: int | None = ANNOUNCE_PORT, **server_opts):
+        self.pin, self.host, self.port, self.name = pin, host, port, name
+        self.discovery_port = discovery_port
+        self.announce_port = announce_port
+        self.server = TicTacToeServer(pin, width, height, k, **server_opts)
+        self.loop = None
+        self._thread = None
+        self._done = None
+        self._error = None
+
+    def start(self) -> "EmbeddedServer":
+        """Start the loop thread; returns once the port accepts connections."""
+        ready = threading.Event()
+        self._thread = threading.Thread(target=asyncio.run, args=(self._main(ready),), daemon=True,
+                                        name="ttt-embedded")
+        self._thread.start()
+        ready.wait()
+        if self._error is not None:
+            raise self._error
+        return self
+
+    async def _main(self, ready: threading.Event) -> None:
+        responder = srv = None
+        try:
+            self.loop, self._done = asyncio.get_running_loop(), asyncio.Event()
+            srv = await asyncio.start_server(self.server.handle, self.host, self.port)
+            self.port = srv.sockets[0].getsockname()[1]
+            logging.info(f"Embedded server on {self.host}:{self.port}")
+            if self.discovery_port is not None:
+                responder = await start_discovery_responder(
+                    self.host, self.discovery_port, self.name, self.port, True,
+                    load=self.server.load, announce_port=self.announce_port)
+        except Exception as e:
+            self._error = e
+            return
+        finally:
+            ready.set()
+        try:
+            await self._done.wait()
+        finally:
+            if responder is not None:
+                responder.stop()
+            srv.close()
+            self.server.close()
+
+    async def join_local(self, name: str) -> LocalPeer:
+        """Seat `name` through a LocalPeer (call on `loop`)."""
+        return await join_local(self.server, self.pin, name)
+
+    def stop(self) -> None:
+        if self._thread is not None:
+            if self._error is None:
+                self.loop.call_soon_threadsafe(self._done.set)
+            self._thread.join(2)
+            self._thread = None
+
+def report_ready(port: int, discovery_port: int | None = None) -> None:
+    """Tell the process that started us (e.g. the GUI's Host button) that
+    we accept connections on `port`: one JSON line on stdout."""
+    print(json.dumps({"ready": True, "port": port, "discovery_port": discovery_port}), flush=True)
+
+def open_journal(path: str | None, fsync_ms: float = 50.0, segment_mb: float = 16.0):
+    """journal.Journal for `path`, or None when journaling is off."""
+    if not path:
+        return None
+    from .journal import Journal
+    return Journal(path, fsync_ms / 1000.0, int(segment_mb * (1 << 20)))
+
+async def amain(host, port, pin, discovery_port, host_plays: bool, host_name: str,
+                width: int = 3, height: int = 3, k: int = 3, journal_dir: str | None = None,
+                journal_opts: dict | None = None, metrics_addr: tuple | None = None,
+                announce_port: int | None = ANNOUNCE_PORT, announce_every: float = 10.0,
+                discovery_mode: str = "broadcast", ready: bool = False, **server_opts):
+    journal = open_journal(journal_dir, **(journal_opts or {}))
+    server = TicTacToeServer(pin, width, height, k, journal=journal, **server_opts)
+    if metrics_addr:
+        await serve_metrics(server, *metrics_addr)
     try:
         srv = await asyncio.start_server(server.handle, host, port)
     except Exception:
@@ -179,31 +1214,92 @@ async def amain(host, port, pin, discovery_port, host_plays: bool, host_name: st
         return
     addrs = ", ".join(str(s.getsockname()) for s in srv.sockets)
     logging.info(f"Listening on {addrs} (PIN required)")
+    port = srv.sockets[0].getsockname()[1]  # the one the OS picked for port 0
 
-    # UDP discovery
-    start_udp_discovery_responder(host, discovery_port, host_name, port, True)
+    # UDP discovery, announcing start and stop to host registries
+    responder = await start_discovery_responder(host, discovery_port, host_name, port, True, load=server.load,
+                                                announce_port=announce_port, announce_every=announce_every,
+                                                mode=discovery_mode)
+    if ready:
+        report_ready(port, discovery_port)
 
-    # If host should be a player, auto-dial loopback to take first seat
+    # If host should be a player, it takes the first seat in-process
     if host_plays:
-        logging.info("Host-plays enabled: taking a seat via loopback")
-        asyncio.create_task(self_join("127.0.0.1", port, pin, host_name))
+        logging.info("Host-plays enabled: taking a seat")
+        asyncio.create_task(host_seat(server, pin, host_name))
 
-    async with srv:
-        await srv.serve_forever()
+    try:
+        async with srv:
+            await srv.serve_forever()
+    finally:
+        responder.stop()
+        server.close()
+        if journal is not None:
+            journal.close()
 
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--host", required=True)
-    ap.add_argument("--port", type=int, required=True)
+    ap.add_argument("--port", type=int, default=0, help="0: let the OS pick a free port (see --ready)")
+    ap.add_argument("--ready", action="store_true",
+                    help='print {"ready": true, "port": N, ...} on stdout once accepting connections')
     ap.add_argument("--pin", required=True)
     ap.add_argument("--discovery-port", type=int, default=9998)
+    ap.add_argument("--discovery-mode", choices=DISCOVERY_MODES, default="broadcast",
+                    help="how announcements go out (probes are answered either way)")
+    ap.add_argument("--announce-port", type=int, default=ANNOUNCE_PORT,
+                    help="broadcast start/stop announcements to LAN host registries here (0: don't)")
+    ap.add_argument("--announce-every", type=float, default=10.0,
+                    help="seconds between repeat announcements (entries expire after 3 missed)")
     ap.add_argument("--host-plays", action="store_true",
-                    help="Server auto-joins itself as a player over loopback")
+                    help="Server seats itself as a player (in-process, no loopback socket)")
     ap.add_argument("--host-name", default="HostPlayer",
                     help="Display name for host's player when host-plays is on")
+    ap.add_argument("--width", type=int, default=3, help="board columns")
+    ap.add_argument("--height", type=int, default=3, help="board rows")
+    ap.add_argument("--k", type=int, default=3, help="marks in a row needed to win")
+    ap.add_argument("--max-rooms", type=int, default=20000,
+                    help="cap on named rooms (each has its own PIN)")
+    ap.add_argument("--slow-consumer", choices=SLOW_POLICIES, default="disconnect",
+                    help="what to do with a client that can't keep up")
+    ap.add_argument("--max-buffer", type=int, default=256 * 1024,
+                    help="unsent bytes allowed per client before it counts as slow")
+    ap.add_argument("--drain-timeout", type=float, default=5.0,
+                    help="seconds a client's send buffer may take to drain")
+    ap.add_argument("--workers", type=int, default=1,
+                    help="accepting processes sharing the port (SO_REUSEPORT) with one matchmaking broker")
+    ap.add_argument("--resume-grace", type=float, default=30.0,
+                    help="seconds a dropped player's seat is held for a reconnect (0: end the match at once)")
+    ap.add_argument("--bot-after", type=float, default=0.0, metavar="SECONDS",
+                    help="seat an AI opponent for a player left waiting this long (0: never)")
+    ap.add_argument("--bot-difficulty", choices=["Easy", "Medium", "Hard"], default="Medium")
+    ap.add_argument("--bot-workers", type=int, default=2,
+                    help="processes for bot searches (per worker with --workers)")
+    ap.add_argument("--metrics-port", type=int, default=None,
+                    help="serve Prometheus metrics over HTTP here (worker N of --workers uses port+N)")
+    ap.add_argument("--metrics-host", default="127.0.0.1")
+    ap.add_argument("--journal", default=None, metavar="DIR",
+                    help="append matches to a journal here and resume unfinished ones on restart")
+    ap.add_argument("--journal-fsync-ms", type=float, default=50.0, help="journal write/fsync interval")
+    ap.add_argument("--journal-segment-mb", type=float, default=16.0, help="journal segment size before rolling")
     args = ap.parse_args()
+    opts = dict(width=args.width, height=args.height, k=args.k, max_rooms=args.max_rooms,
+                slow_policy=args.slow_consumer, max_buffer=args.max_buffer, drain_timeout=args.drain_timeout,
+                resume_grace=args.resume_grace, bot_after=args.bot_after,
+                bot_difficulty=args.bot_difficulty, bot_workers=args.bot_workers,
+                announce_port=args.announce_port or None, announce_every=args.announce_every,
+                discovery_mode=args.discovery_mode, ready=args.ready,
+                metrics_addr=None if args.metrics_port is None else (args.metrics_host, args.metrics_port),
+                journal_dir=args.journal,
+                journal_opts={"fsync_ms": args.journal_fsync_ms, "segment_mb": args.journal_segment_mb})
     try:
-        asyncio.run(amain(args.host, args.port, args.pin, args.discovery_port, args.host_plays, args.host_name))
+        if args.workers > 1:
+            from .cluster import serve
+            serve(args.host, args.port, args.pin, args.workers, args.discovery_port,
+                  args.host_plays, args.host_name, **opts)
+        else:
+            asyncio.run(amain(args.host, args.port, args.pin, args.discovery_port,
+                              args.host_plays, args.host_name, **opts))
     except KeyboardInterrupt:
         logging.info("Server stopped")
 
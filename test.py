@@ -1,5 +1,5 @@
-from .game import Game
-from .ai import best_move
+from .game import Game, ListGame, MNKGame, new_game
+from .ai import best_move, canonical, TranspositionTable, SYM_MASK
 
 def _assert(cond, msg):
     if not cond:
@@ -8,12 +8,26 @@ def _assert(cond, msg):
 def run():
     # 1) Basic move legality
     g = Game.new()
-    _assert(g.play(0), "First move should be legal")
-    _assert(not g.play(0), "Cell already taken should be illegal")
+    _assert(g.play(1), "First move should be legal")
+    _assert(not g.play(1), "Cell already taken should be illegal")
 
     # 2) Winner detection
     g = Game(["X","X","X","O","O"," "," "," "," "], "O")
     _assert(g.winner() == "X", "Row win not detected")
+    _assert(not g.play(6), "No moves after a win")
+
+    # 2b) Bitboard Game agrees with the list reference on random games
+    import random
+    rng = random.Random(7)
+    for _ in range(200):
+        g, ref = Game.new(), ListGame.new()
+        while not ref.terminal():
+            idx = rng.randint(1, 9)
+            _assert(g.play(idx) == ref.play(idx), "play() mismatch")
+            _assert(g.board == ref.board and g.turn == ref.turn, "board mismatch")
+            _assert(g.winner() == ref.winner(), "winner() mismatch")
+            _assert(g.terminal() == ref.terminal(), "terminal() mismatch")
+        _assert(g.clone() == g, "clone() mismatch")
 
     # 3) AI never loses (optimal play → draw vs optimal human)
     g = Game.new()
@@ -30,7 +44,946 @@ def run():
         if g.terminal():
             break
     _assert(g.winner() in (None, "X", "O"), "Invalid winner")
+
+    # 4) Symmetric positions share a canonical key; a tiny table (constant
+    #    eviction) gives the same answers as the shared one, and the side to
+    #    move is part of the key
+    g = Game(["X"," "," "," ","O"," "," "," "," "], "X")
+    key, _ = canonical(g.bb.x, g.bb.o)
+    for t in SYM_MASK:
+        _assert(canonical(t[g.bb.x], t[g.bb.o])[0] == key, "Canonical key differs under symmetry")
+    small = TranspositionTable(max_entries=16)
+    for depth in (1, 3, 9):
+        _assert(best_move(g, "X", depth, tt=small) == best_move(g, "X", depth), "TT size changed result")
+    _assert(len(small) <= 16, "TT exceeded its size")
+    shared = TranspositionTable()
+    for turn in ("X", "O"):  # same stones, other side to move: not the same entry
+        g = Game(["X", "X", "O", " ", "O", " ", " ", " ", " "], turn)
+        _assert(best_move(g, turn, tt=shared) == best_move(g, turn, tt=TranspositionTable()),
+                "TT mixed up the side to move")
+
+    # 5) Solved-position book answers exactly like the live search, and
+    #    stays out of positions whose side to move it doesn't hold
+    import os, tempfile
+    from . import book
+    from .ai import _search
+    with tempfile.TemporaryDirectory() as d:
+        path = os.path.join(d, "book.bin")
+        book.build(path, depths=(1, 3, None))
+        book.load_book(path)
+        try:
+            for x, o, x_to_move in book._reachable()[::37]:
+                g = Game.new(); g.bb.x, g.bb.o, g.bb.x_to_move = x, o, x_to_move
+                for depth in (1, 3, 9, None):
+                    _assert(best_move(g, g.turn, depth) == _search(g, g.turn, depth, TranspositionTable()),
+                            "Book disagrees with search")
+            g = Game(["X", "X", "O", " ", "O", " ", " ", " ", " "], "O")  # O to move on equal counts
+            _assert(best_move(g, "O") == _search(g, "O", None, TranspositionTable()), "Book ignored the side to move")
+        finally:
+            book.get_book().close()
+            book.load_book(None)
+    # 6) m,n,k boards: incremental win check, undo, 3x3 agrees with Game
+    g = new_game(15, 15, 5)
+    for idx in (1, 16, 2, 17, 3, 18, 4, 19):
+        _assert(g.play(idx), "MNK move should be legal")
+    _assert(g.winner() is None, "No winner with four in a row")
+    _assert(g.play(5) and g.winner() == "X" and g.terminal(), "Five in a row not detected")
+    g.undo()
+    _assert(g.winner() is None and g.turn == "X" and g.board[4] == " ", "undo() mismatch")
+    diag = MNKGame(4, 4, 3, board=[" ", " ", "O", " ", " ", "O", " ", " ", "O", " ", " ", " ", " ", " ", " ", " "])
+    _assert(diag.winner() == "O", "Anti-diagonal win not detected")
+    rng = random.Random(11)
+    for _ in range(200):
+        g, ref = MNKGame(3, 3, 3), Game.new()
+        while not ref.terminal():
+            idx = rng.randint(1, 9)
+            _assert(g.play(idx) == ref.play(idx), "MNK play() mismatch")
+            _assert(g.winner() == ref.winner() and g.terminal() == ref.terminal(), "MNK winner mismatch")
+
+    # 7) Timed search on a big board: answers within budget (a default one
+    #    when none is given), sees wins/blocks
+    import time
+    g = new_game(15, 15, 5)
+    for idx in (1, 31, 2, 32, 3, 33, 4):
+        g.play(idx)
+    _assert(best_move(g, "O", time_ms=300)[0] == 5, "Open four not blocked")
+    g.play(34)
+    _assert(best_move(g, "X", time_ms=300) == (5, 1), "Winning move not found")
+    t0 = time.perf_counter()
+    idx, _ = best_move(new_game(15, 15, 5), "X", time_ms=50)
+    _assert(time.perf_counter() - t0 < 0.5 and 1 <= idx <= 225, "Time budget not honored")
+    from .ai import BIG_BOARD_TIME_MS
+    t0 = time.perf_counter()
+    best_move(new_game(7, 6, 4), "X")  # no depth, no time: the default budget
+    _assert(time.perf_counter() - t0 < 1.5 * BIG_BOARD_TIME_MS / 1000, "Unbounded big-board search")
+
+    # 8) Root-parallel search matches the serial search
+    g = new_game(7, 6, 4)
+    for idx in (18, 25, 19, 11):
+        g.play(idx)
+    for depth in (1, 2, 3):
+        _assert(best_move(g, g.turn, depth, workers=2) == best_move(g, g.turn, depth),
+                "Parallel search disagrees with serial")
+    # one deadline for all root moves, however long they queue for a worker
+    g = new_game(9, 9, 5)
+    g.play(41)
+    t0 = time.perf_counter()
+    best_move(g, g.turn, time_ms=100, workers=2)
+    _assert(time.perf_counter() - t0 < 0.4, "Parallel search overran its time budget")
+
+    # 9) MCTS: batched playouts add up, the search blocks an open four and
+    #    reuses its tree on the next move
+    from . import mcts
+    g = new_game(15, 15, 5)
+    for idx in (1, 31, 2, 32, 3, 33, 4):
+        g.play(idx)
+    rng = mcts.np.random.default_rng(0) if mcts.np is not None else random.Random(0)
+    _assert(sum(mcts.rollouts(g, 256, rng)) == 256, "Rollout counts don't add up")
+    player = mcts.MCTSPlayer(iterations=200, seed=0)
+    _assert(player.best_move(g)[0] == 5, "MCTS missed the block")
+    g.play(5)
+    reply = next(iter(player.root.children.values()))
+    g.play(reply.move + 1)
+    _, root = player.search(g)
+    _assert(root is reply, "MCTS tree not reused")
+
+    # 10) Batch API agrees with the per-game API (numpy and list paths)
+    from . import batch
+    rng = random.Random(5)
+    games = []
+    for _ in range(300):
+        g = Game.new()
+        for _ in range(rng.randint(0, 9)):
+            if g.terminal():
+                break
+            g.play(rng.choice(g.moves()) + 1)
+        games.append(g)
+    rows = [[" XO".index(c) for c in g.board] for g in games]
+    saved_np = batch.np
+    for np_mod in {saved_np, None}:
+        batch.np = np_mod
+        try:
+            win, term = batch.winners(rows), batch.terminal(rows)
+            moves, vals = batch.best_moves(rows, 3)
+            legal = batch.legal_masks(batch.pack(rows), packed=True)
+            for bad in (1 << 18, -1, 1 << 9 | 1):
+                try:
+                    batch.winners([0, bad], packed=True)
+                    _assert(False, "Batch accepted a bad packed board")
+                except ValueError:
+                    pass
+        finally:
+            batch.np = saved_np
+        for i, g in enumerate(games):
+            _assert(win[i] == " XO".index(g.winner() or " ") and term[i] == g.terminal(), "Batch winner/terminal mismatch")
+            _assert(legal[i] == (0 if g.winner() else sum(1 << m for m in g.moves())), "Batch legal mask mismatch")
+            if not g.terminal():
+                _assert((moves[i], vals[i]) == best_move(g, g.turn, 3), "Batch best move mismatch")
+
+    # 11) Self-play runner: perfect play always draws, never loses to random,
+    #     and a depthless minimax on a bigger board keeps to the default budget
+    import io, json
+    from . import selfplay
+    buf = io.StringIO()
+    summary = selfplay.run(10, "minimax", "minimax", out=buf)
+    _assert(summary["results"] == {"draw": 10} and len(buf.getvalue().splitlines()) == 10, "Self-play mismatch")
+    summary = selfplay.run(40, "minimax", "random", swap=True, workers=2)
+    _assert(all(k == "draw" or k.startswith("minimax") for k in summary["results"]), "Minimax lost to random")
+    buf = io.StringIO()
+    selfplay.run(1, "minimax", "random", dims=(5, 5, 4), out=buf)
+    _assert(max(json.loads(buf.getvalue())["think_ms"]) < 1.5 * BIG_BOARD_TIME_MS, "Big-board minimax unbounded")
+
+    # 12) Server rooms: per-room PINs, FIFO pairing, cleanup after the game;
+    #     close() stops the sweeper
+    import asyncio
+    asyncio.run(_server_rooms())
+
+    # 13) Binary wire codec: every message round-trips, states go as deltas,
+    #     and a binary client plays a JSON one through the server
+    from . import wire
+    from .bench import _state_msgs
+    for dims in ((3, 3, 3), (7, 6, 4), (17, 17, 5)):
+        enc, dec = wire.Codec(), wire.Codec()
+        for n, m in enumerate(_state_msgs(*dims)):
+            f = enc.encode(m)
+            _assert(f[2] == (wire.T_STATE if n == 0 else wire.T_DELTA), "State not sent as delta")
+            _assert(dec.decode(f[2:]) == m, "State round-trip mismatch")
+    for m in ({"type": "move", "idx": 7}, {"type": "move", "idx": 289}, {"type": "quit"},
+              {"type": "your_turn"}, {"type": "end", "reason": "draw"}, {"type": "error", "error": "invalid_move"},
+              {"status": "waiting_for_opponent"}, {"status": "matched", "you": "O", "opponent": "Zoë"},
+              {"type": "end", "reason": "something_new"}, {"type": "chat", "text": "hi"}):
+        _assert(wire.Codec().decode(wire.Codec().encode(m)[2:]) == m, f"Wire round-trip mismatch: {m}")
+    _assert(len(wire.Codec().encode({"type": "move", "idx": 7})) == 4, "Move not one byte")
+    asyncio.run(_server_wire())
+
+    # 14) Broadcast: one write per player, and a stuck peer is cut off (or
+    #     skipped, states only) without delaying the other player's update
+    from .server_net import Session, dumps
+    for policy in ("disconnect", "drop"):
+        fast, stuck = _FakeWriter(), _FakeWriter(stuck=True)
+        ses = Session({"name": "x", "writer": fast}, {"name": "o", "writer": stuck},
+                      drain_timeout=0.05, slow_policy=policy, max_buffer=1 << 16)
+        t0 = time.perf_counter()
+        asyncio.run(ses.broadcast_state())
+        ses.game.play(5)
+        asyncio.run(ses.broadcast_state())
+        _assert(time.perf_counter() - t0 < 0.5, "Stuck peer delayed the broadcast")
+        _assert(len(fast.chunks) == 2 and fast.chunks[0].count(b"\n") == 2, "Messages not coalesced")
+        asyncio.run(ses.broadcast_state("resign"))
+        _assert(stuck.aborted == (policy == "disconnect"), "Slow-consumer policy not applied")
+        if policy == "disconnect":
+            _assert(len(stuck.chunks) == 1, "Slow peer kept getting data")
+        else:  # states skipped, control messages kept
+            _assert(stuck.chunks[1:] == [dumps({"type": "your_turn"}), dumps({"type": "end", "reason": "resign"})],
+                    "Drop policy lost a control message")
+
+    # 15) Spectators: shared bytes, late joiners get a snapshot, slow
+    #     watchers skip states and catch up with a full one
+    asyncio.run(_spectators())
+
+    # 16) Worker processes share matchmaking through the broker: a player on
+    #     one worker is handed to the worker where the opponent waits, and so
+    #     is a spectator naming a match there; a dead worker gets a refusal
+    asyncio.run(_cluster())
+
+    # 17) Journal: records round-trip, a torn tail is cut off, segments roll,
+    #     and a restarted server lets both players resume an unfinished match
+    #     with their tokens, keeping the room's PIN; one nobody claims within
+    #     the grace frees its room and stays ended
+    import os, tempfile
+    from . import journal
+    with tempfile.TemporaryDirectory() as tmp:
+        j = journal.Journal(tmp, fsync_interval=0.01, segment_bytes=64)
+        j.start(7, "r", (3, 3, 3), "ann", "bob")
+        for cell in (4, 0, 8):
+            j.move(7, cell)
+        j.start(8, "", (300, 300, 5), "c", "d", x_token="tx")
+        j.end(7, "winner")
+        j.close()
+        _assert(len(journal._segments(tmp)) > 1, "Journal did not roll segments")
+        ms = journal.load(tmp)
+        _assert(ms[7].moves == [4, 0, 8] and ms[7].end == "winner" and ms[7].x == "ann", "Journal round-trip mismatch")
+        _assert([m.id for m in journal.recover(tmp)] == [8] and ms[8].dims == (300, 300, 5), "Unfinished match not recovered")
+        _assert(ms[8].seats == (journal.seat_digest("tx"), None), "Seat tokens not journaled")
+        last = list(journal.states(ms[7]))[-1]
+        _assert(last["board"][4] == "X" and last["board"][0] == "O" and last["turn"] == "O", "Replay state mismatch")
+        tail = journal._segments(tmp)[-1]
+        with open(tail, "ab") as f:
+            f.write(b"\x20\x00torn")
+        j = journal.Journal(tmp)
+        j.move(8, 5)
+        j.close()
+        _assert(journal.load(tmp)[8].moves == [5], "Torn tail not truncated")
+    with tempfile.TemporaryDirectory() as tmp:
+        asyncio.run(_journal_resume(tmp))
+    with tempfile.TemporaryDirectory() as tmp:
+        asyncio.run(_journal_expire(tmp))
+
+    # 18) Reconnects: a dropped player's seat is held for the grace window and
+    #     a resume token gets it back with the current board; late or bad
+    #     tokens are refused and the opponent is told the match ended; a
+    #     malformed move is refused without dropping the player
+    asyncio.run(_reconnect())
+
+    # 19) Load generator: histograms merge exactly and stay within a bucket
+    #     of the true percentile; a short swarm plays games without errors
+    from .loadgen import Histogram
+    h1, h2 = Histogram(), Histogram()
+    for us in range(1, 1001):
+        (h1 if us % 2 else h2).add(float(us))
+    h1.merge(h2)
+    _assert(h1.n == 1000 and h1.max == 1000.0, "Histogram merge mismatch")
+    _assert(500 <= h1.percentile(0.5) <= 500 * 2 ** (1 / Histogram.STEPS), "Histogram p50 off")
+    _assert(h1.percentile(1.0) == 1000.0, "Histogram p100 not the max")
+    asyncio.run(_loadgen())
+
+    # 20) Bot seats: a player left waiting is paired with a bot that plays
+    #     from the search pool; players who find a human never see one
+    asyncio.run(_bots())
+
+    # 21) Metrics: exposition text over HTTP counts the game that was played
+    asyncio.run(_metrics())
+
+    # 22) Discovery streams hosts as they answer and stops after a quiet
+    #     period instead of waiting out the timeout
+    from .discover import parse_reply
+    _assert(parse_reply(b'{"service":"tictactoe","port":5}', "1.2.3.4")["ip"] == "1.2.3.4", "Reply not parsed")
+    _assert(parse_reply(b'{"service":"other","port":5}', "x") is None and parse_reply(b"\xff", "x") is None
+            and parse_reply(b'{"service":"tictactoe","port":"x"}', "x") is None, "Junk reply accepted")
+    asyncio.run(_discovery())
+
+    # 23) Host registry: probed hosts, announced hosts, "down" and TTL expiry;
+    #     a probe that fails to open its socket doesn't stop it
+    asyncio.run(_registry())
+
+    # 24) Responder: multicast probes, per-source rate limit, load in replies
+    from .discover import least_loaded
+    _assert(least_loaded([{"name": "a"}, {"name": "b", "load": {"players": 4}}, {"name": "c", "load": {"players": 2}}])
+            ["name"] == "c" and least_loaded([]) is None, "least_loaded picked the wrong host")
+    asyncio.run(_responder())
+
+    # 25) Port 0 + --ready: the server reports the port it got, alone and
+    #     as a cluster, and accepts connections on it
+    asyncio.run(_ready())
+
+    # 26) Embedded server: the host sits in through an in-memory LocalPeer
+    #     (dicts, no socket) while the guest plays over TCP
+    asyncio.run(_embedded())
+
     print("All tests passed.")
 
+async def _client(port, **hello):
+    import asyncio
+    from .server_net import dumps
+    r, w = await asyncio.open_connection("127.0.0.1", port)
+    w.write(dumps({"type": "hello", **hello})); await w.drain()
+    return r, w
+
+async def _until(reader, pred):
+    from .server_net import read_json_line
+    while True:
+        msg = await read_json_line(reader)
+        if msg is None or pred(msg):
+            return msg
+
+async def _server_rooms():
+    import asyncio, logging
+    from .server_net import TicTacToeServer, _unqueue, dumps
+    logging.getLogger().setLevel(logging.WARNING)
+    server = TicTacToeServer("lobby", sweep_interval=0.05)
+    srv = await asyncio.start_server(server.handle, "127.0.0.1", 0)
+    port = srv.sockets[0].getsockname()[1]
+    async with srv:
+        bad = await _client(port, name="z", pin="nope")
+        _assert((await _until(bad[0], lambda m: True)) == {"error": "auth_failed"}, "Bad PIN accepted")
+        a = await _client(port, name="a", pin="1", room="r1")
+        await _until(a[0], lambda m: m.get("status") == "waiting_for_opponent")
+        wrong = await _client(port, name="w", pin="2", room="r1")
+        _assert((await _until(wrong[0], lambda m: True)) == {"error": "auth_failed"}, "Room PIN not enforced")
+        l1 = await _client(port, name="l1", pin="lobby")
+        await _until(l1[0], lambda m: m.get("status") == "waiting_for_opponent")
+        b = await _client(port, name="b", pin="1", room="r1")
+        m = await _until(b[0], lambda m: m.get("status") == "matched")
+        _assert(m["opponent"] == "a" and m["you"] == "O", "Room pairing mismatch")
+        _assert(len(server.lobby.waiting) == 1 and "r1" in server.rooms, "Rooms mixed up")
+        # play X down the left column; the session and room go away after
+        for n, idx in enumerate((1, 2, 4, 5, 7)):
+            w = (a, b)[n % 2][1]
+            w.write(dumps({"type": "move", "idx": idx})); await w.drain()
+            await _until((a, b)[n % 2][0], lambda m: m.get("type") == "state" and m["board"][idx - 1] != " ")
+        await _until(a[0], lambda m: m.get("type") == "end")
+        await asyncio.sleep(0.05)
+        _assert(not server.sessions and "r1" not in server.rooms, "Finished session not cleaned up")
+        # a waiting player who hangs up is dropped from the queue
+        l1[1].close()
+        await asyncio.sleep(0.2)
+        _assert(not server.lobby.waiting, "Dead waiting player kept")
+        # withdrawing a queued player (as a bot timer does) is a keyed pop
+        l2 = await _client(port, name="l2", pin="lobby")
+        await _until(l2[0], lambda m: m.get("status") == "waiting_for_opponent")
+        me = next(iter(server.lobby.waiting.values()))
+        _assert(_unqueue(server.lobby, me) is me and _unqueue(server.lobby, me) is None, "Unqueue mismatch")
+        for r, w in (a, b, bad, wrong, l2):
+            w.close()
+    sweeper = server._sweeper
+    server.close()
+    await asyncio.sleep(0)
+    _assert(sweeper.cancelled(), "close() left the sweeper running")
+
+class _FakeWriter:
+    """StreamWriter stand-in; a stuck one never drains and reports a full buffer
+    once written to."""
+    def __init__(self, stuck=False):
+        self.stuck, self.chunks, self.aborted = stuck, [], False
+        self.transport = self
+    def write(self, data):
+        self.chunks.append(data)
+    async def drain(self):
+        if self.stuck:
+            import asyncio
+            await asyncio.sleep(3600)
+    def get_write_buffer_size(self):
+        return (1 << 20) * (self.stuck and bool(self.chunks))
+    def is_closing(self):
+        return self.aborted
+    def abort(self):
+        self.aborted = True
+    def close(self):
+        pass
+
+async def _server_wire():
+    import asyncio
+    from .server_net import TicTacToeServer, dumps
+    from . import wire
+    server = TicTacToeServer("p")
+    srv = await asyncio.start_server(server.handle, "127.0.0.1", 0)
+    port = srv.sockets[0].getsockname()[1]
+    async with srv:
+        xr, xw = await _client(port, name="bin", pin="p", wire=wire.NAME)
+        _assert((await _until(xr, lambda m: True)) == {"type": "wire", "wire": wire.NAME}, "Wire not acked")
+        codec = wire.Codec()
+        async def next_msg():
+            return codec.decode(await wire.read_frame(xr))
+        _assert((await next_msg()) == {"status": "waiting_for_opponent"}, "Binary waiting mismatch")
+        o = await _client(port, name="json", pin="p")
+        _assert((await next_msg())["status"] == "matched", "Binary matched mismatch")
+        for idx in (1, 4, 2, 5, 3):
+            if idx in (4, 5):
+                o[1].write(dumps({"type": "move", "idx": idx})); await o[1].drain()
+            else:
+                xw.write(codec.encode({"type": "move", "idx": idx})); await xw.drain()
+            while (m := await next_msg()).get("type") != "state" or m["board"][idx - 1] == " ":
+                pass
+        _assert(m["winner"] == "X" and m["board"][:3] == ["X"] * 3, "Binary game mismatch")
+        j = await _until(o[0], lambda m: m.get("type") == "state" and m["terminal"])
+        _assert(j == m, "JSON and binary players saw different states")
+        for w in (xw, o[1]):
+            w.close()
+
+async def _journal_resume(path):
+    import asyncio
+    from .server_net import TicTacToeServer, dumps
+    from .journal import Journal
+    async def serve(j):
+        server = TicTacToeServer("p", journal=j)
+        srv = await asyncio.start_server(server.handle, "127.0.0.1", 0)
+        return server, srv, srv.sockets[0].getsockname()[1]
+    j = Journal(path, fsync_interval=0.01)
+    server, srv, port = await serve(j)
+    x = await _client(port, name="ann", pin="q", room="r")
+    o = await _client(port, name="bob", pin="q", room="r")
+    tokens = [(await _until(c[0], lambda m: m.get("status") == "matched"))["token"] for c in (x, o)]
+    for n, idx in enumerate((5, 1)):
+        w = (x, o)[n % 2][1]
+        w.write(dumps({"type": "move", "idx": idx})); await w.drain()
+        await _until(x[0], lambda m: m.get("type") == "state" and m["board"][idx - 1] != " ")
+    # "crash": the journal is flushed by its thread, then everything goes away
+    await asyncio.sleep(0.05)
+    srv.close()
+    for w in (x[1], o[1]):
+        w.transport.abort()
+    j.close()
+    j = Journal(path)
+    server, srv, port = await serve(j)
+    async with srv:
+        _assert(len(server.suspended) == 2, "Match not recovered after restart")
+        stranger = await _client(port, name="ann", pin="x", room="r")
+        _assert((await _until(stranger[0], lambda m: True)) == {"error": "auth_failed"}, "Room PIN lost in restart")
+        stranger[1].close()
+        stranger = await _client(port, name="ann", token="guess")
+        _assert((await _until(stranger[0], lambda m: True)) == {"error": "bad_token"}, "Resumed a match not ours")
+        x = await _client(port, token=tokens[0])
+        await _until(x[0], lambda m: m.get("status") == "waiting_for_opponent")
+        o = await _client(port, token=tokens[1])
+        st = await _until(o[0], lambda m: m.get("type") == "state")
+        _assert(st["board"][4] == "X" and st["board"][0] == "O" and st["turn"] == "X", "Resumed board mismatch")
+        x[1].write(dumps({"type": "move", "idx": 9})); await x[1].drain()
+        await _until(o[0], lambda m: m.get("type") == "state" and m["board"][8] == "X")
+        for w in (x[1], o[1], stranger[1]):
+            w.close()
+    j.close()
+    from .journal import load
+    _assert(load(path)[next(iter(load(path)))].moves == [4, 0, 8], "Resumed moves not journaled")
+
+async def _journal_expire(path):
+    import asyncio
+    from .server_net import TicTacToeServer
+    from .journal import Journal, load
+    j = Journal(path, fsync_interval=0.01)
+    server = TicTacToeServer("p", journal=j)
+    srv = await asyncio.start_server(server.handle, "127.0.0.1", 0)
+    port = srv.sockets[0].getsockname()[1]
+    x = await _client(port, name="ann", pin="q", room="r")
+    o = await _client(port, name="bob", pin="q", room="r")
+    token = (await _until(x[0], lambda m: m.get("status") == "matched"))["token"]
+    await asyncio.sleep(0.05)
+    srv.close()
+    for w in (x[1], o[1]):
+        w.transport.abort()
+    j.close()
+    j = Journal(path, fsync_interval=0.01)
+    server = TicTacToeServer("p", journal=j, resume_grace=0.2, sweep_interval=0.05)
+    srv = await asyncio.start_server(server.handle, "127.0.0.1", 0)
+    port = srv.sockets[0].getsockname()[1]
+    async with srv:
+        x = await _client(port, token=token)
+        await _until(x[0], lambda m: m.get("status") == "waiting_for_opponent")
+        _assert((await _until(x[0], lambda m: True)) == {"type": "end", "reason": "disconnect"},
+                "Unclaimed match not ended")
+        _assert(not server.suspended and "r" not in server.rooms, "Unclaimed match kept its room")
+        other = await _client(port, name="eve", pin="z", room="r")
+        await _until(other[0], lambda m: m.get("status") == "waiting_for_opponent")
+        for w in (x[1], other[1]):
+            w.close()
+        server.close()
+    j.close()
+    j = Journal(path)
+    _assert(not TicTacToeServer("p", journal=j).suspended and
+            next(iter(load(path).values())).end == "disconnect", "Expired match recovered again")
+    j.close()
+
+async def _reconnect():
+    import asyncio
+    from .server_net import TicTacToeServer, dumps
+    from .client_net import reconnect
+    from . import wire
+    server = TicTacToeServer("p", resume_grace=0.3)
+    srv = await asyncio.start_server(server.handle, "127.0.0.1", 0)
+    port = srv.sockets[0].getsockname()[1]
+    async with srv:
+        x = await _client(port, name="x", pin="p")
+        o = await _client(port, name="o", pin="p")
+        tok = (await _until(o[0], lambda m: m.get("status") == "matched"))["token"]
+        x[1].write(dumps({"type": "move", "idx": 5})); await x[1].drain()
+        await _until(o[0], lambda m: m.get("type") == "your_turn")
+        # malformed moves are refused; they don't count as a dropped connection
+        for junk in (dumps({"type": "move", "idx": "a"}), b"[1]\n" + dumps({"type": "move", "idx": None})):
+            o[1].write(junk); await o[1].drain()
+            _assert((await _until(o[0], lambda m: True)) == {"type": "error", "error": "invalid_move"},
+                    f"Malformed message not refused: {junk!r}")
+        _assert(not next(iter(server.sessions)).away, "Malformed move dropped the player")
+        o[1].transport.abort()
+        away = await _until(x[0], lambda m: m.get("type") == "opponent_away")
+        _assert(away["grace"] == 0.3 and len(server.sessions) == 1, "Dropped seat not held")
+        bad = await _client(port, token="nope")
+        _assert((await _until(bad[0], lambda m: True)) == {"error": "bad_token"}, "Bad token accepted")
+        r, w, codec, _ = await reconnect("127.0.0.1", port, tok, wire.NAME, within=2.0)
+        o = (r, w)
+        msgs = [codec.decode(await wire.read_frame(r)) for _ in range(3)]
+        _assert(msgs[0] == {"status": "resumed", "you": "O", "opponent": "x", "token": tok}, "Resume greeting mismatch")
+        _assert(msgs[1]["board"][4] == "X" and msgs[2] == {"type": "your_turn"}, "Resume snapshot mismatch")
+        await _until(x[0], lambda m: m.get("type") == "opponent_back")
+        # a half-open connection is replaced by the newer one
+        o2 = await _client(port, token=tok)
+        await _until(o2[0], lambda m: m.get("status") == "resumed")
+        _assert(await o[0].read() == b"", "Old connection kept after takeover")
+        o2[1].write(dumps({"type": "move", "idx": 1})); await o2[1].drain()
+        await _until(x[0], lambda m: m.get("type") == "state" and m["board"][0] == "O")
+        # past the grace window the match ends and the token is dead
+        o2[1].transport.abort()
+        _assert((await _until(x[0], lambda m: m.get("type") == "end"))["reason"] == "disconnect", "Grace never expired")
+        late = await _client(port, token=tok)
+        _assert((await _until(late[0], lambda m: True)) == {"error": "bad_token"}, "Expired token accepted")
+        _assert(not server.sessions and not server.seats, "Expired session not cleaned up")
+        for w in (x[1], bad[1], late[1]):
+            w.close()
+
+async def _loadgen():
+    import asyncio
+    from .server_net import TicTacToeServer
+    from .loadgen import swarm
+    server = TicTacToeServer("p")
+    srv = await asyncio.start_server(server.handle, "127.0.0.1", 0)
+    port = srv.sockets[0].getsockname()[1]
+    async with srv:
+        st = await swarm("127.0.0.1", port, "p", 20, 0.5, wire_name="bin1")
+    _assert(st.games > 0 and st.rtt.n == st.moves > 0, "Load generator played nothing")
+    _assert(st.connect.n >= 20 and not st.errors, f"Load generator errors: {st.errors}")
+
+async def _bots():
+    import asyncio
+    from .server_net import TicTacToeServer, dumps
+    server = TicTacToeServer("p", bot_after=0.2, bot_difficulty="Hard", bot_workers=1)
+    srv = await asyncio.start_server(server.handle, "127.0.0.1", 0)
+    port = srv.sockets[0].getsockname()[1]
+    try:
+        async with srv:
+            a = await _client(port, name="a", pin="p")
+            b = await _client(port, name="b", pin="p")
+            m = await _until(b[0], lambda m: m.get("status") == "matched")
+            _assert(m["opponent"] == "a", "Bot took a seat a human was waiting for")
+            h = await _client(port, name="h", pin="p")
+            m = await _until(h[0], lambda m: m.get("status") == "matched")
+            _assert(m["opponent"] == "Bot (Hard)" and m["you"] == "X", "No bot seated")
+            state = None
+            while True:
+                msg = await _until(h[0], lambda m: m.get("type") in ("state", "your_turn", "end"))
+                if msg["type"] == "state":
+                    state = msg
+                elif msg["type"] == "your_turn":
+                    h[1].write(dumps({"type": "move", "idx": state["board"].index(" ") + 1})); await h[1].drain()
+                else:
+                    break
+            _assert(state["terminal"] and state["winner"] != "X", "Perfect bot lost")
+            st = server.bots.stats()
+            _assert(st["moves"] >= 3 and st["think_ms_max"] > 0, "Bot think time not recorded")
+            await asyncio.sleep(0.05)
+            _assert(not any("bot" in p for s in server.sessions for p in s.players.values()), "Bot session left open")
+            for w in (a[1], b[1], h[1]):
+                w.close()
+    finally:
+        server.close()
+
+async def _metrics():
+    import asyncio
+    from .server_net import TicTacToeServer, dumps, serve_metrics
+    server = TicTacToeServer("p")
+    srv = await asyncio.start_server(server.handle, "127.0.0.1", 0)
+    port = srv.sockets[0].getsockname()[1]
+    msrv = await serve_metrics(server, "127.0.0.1", 0, interval=0.05)
+    async def scrape(path="/metrics"):
+        r, w = await asyncio.open_connection("127.0.0.1", msrv.sockets[0].getsockname()[1])
+        w.write(f"GET {path} HTTP/1.1\r\nHost: x\r\n\r\n".encode()); await w.drain()
+        head, _, body = (await r.read()).decode().partition("\r\n\r\n")
+        w.close()
+        return head.split()[1], dict(l.rsplit(" ", 1) for l in body.splitlines() if l and l[0] != "#")
+    try:
+        async with srv, msrv:
+            x = await _client(port, name="x", pin="p")
+            o = await _client(port, name="o", pin="p")
+            await _until(x[0], lambda m: m.get("type") == "your_turn")
+            _, m = await scrape()
+            _assert(m["tictactoe_sessions"] == "1" and m["tictactoe_connections"] == "2", "State gauges wrong")
+            for p, idx in ((x, 1), (o, 4), (x, 2), (o, 5), (x, 5), (x, 3)):  # one invalid move
+                p[1].write(dumps({"type": "move", "idx": idx})); await p[1].drain()
+                await _until(p[0], lambda m: m.get("type") in ("state", "error"))
+            await asyncio.sleep(0.1)
+            status, m = await scrape()
+            _assert(status == "200" and m["tictactoe_moves_total"] == "5", "Moves not counted")
+            _assert(m['tictactoe_messages_received_total{type="move"}'] == "6", "Received messages not counted")
+            _assert(m['tictactoe_messages_sent_total{type="error"}'] == "1"
+                    and m['tictactoe_messages_sent_total{type="end"}'] == "2", "Sent messages not counted")
+            _assert(m['tictactoe_move_seconds_bucket{le="+Inf"}'] == "5" and m["tictactoe_handshake_seconds_count"] == "2",
+                    "Latency histograms empty")
+            _assert(int(m['tictactoe_bytes_sent_total{peer="player"}']) > 0 and int(m["tictactoe_bytes_received_total"]) > 0,
+                    "Bytes not counted")
+            _assert(float(m["tictactoe_event_loop_lag_seconds_count"]) >= 1, "Loop lag not sampled")
+            _assert(m["tictactoe_sessions"] == "0", "Finished session still counted")
+            _assert((await scrape("/nope"))[0] == "404", "Unknown path served")
+            for w in (x[1], o[1]):
+                w.close()
+    finally:
+        server.close()
+
+async def _discovery():
+    import asyncio, socket, time
+    from .server_net import start_discovery_responder
+    from .discover import discover, discover_iter
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        s.bind(("127.0.0.1", 0))
+        dport = s.getsockname()[1]
+    alice = await start_discovery_responder("127.0.0.1", dport, "Alice", 4242, True)
+    t0 = time.perf_counter()
+    seen = []
+    hosts = await discover(timeout=3.0, port=dport, quiet=0.2, addresses=["127.0.0.1", "127.0.0.1"],
+                           on_host=seen.append)
+    _assert(hosts == seen and [(h["name"], h["port"]) for h in hosts] == [("Alice", 4242)], "Host not discovered once")
+    _assert(time.perf_counter() - t0 < 1.0, "Discovery did not stop early")
+    first = None
+    async for h in discover_iter(timeout=3.0, port=dport, addresses=["127.0.0.1"]):
+        first = h
+        break
+    _assert(first is not None and first["port"] == 4242, "Iterator yielded nothing")
+    alice.stop()
+
+async def _registry():
+    import asyncio, json, socket, time
+    from .server_net import start_discovery_responder
+    from .discover import HostRegistry
+    ports = []
+    for _ in range(4):
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        s.bind(("127.0.0.1", 0))
+        ports.append(s)
+    dport, bob_port, aport, aport2 = [s.getsockname()[1] for s in ports]
+    for s in ports:
+        s.close()
+    alice = await start_discovery_responder("127.0.0.1", dport, "Alice", 4242, True)  # probe replies only
+    changes = []
+    reg = HostRegistry(dport, aport, probe_timeout=0.3, addresses=["127.0.0.1"], listen_ip="127.0.0.1")
+    reg.subscribe(lambda hosts: changes.append([h["name"] for h in hosts]))
+    await reg.start()
+    async def until(cond, within=2.0):
+        t0 = time.perf_counter()
+        while not cond() and time.perf_counter() - t0 < within:
+            await asyncio.sleep(0.01)
+        return time.perf_counter() - t0
+    try:
+        await until(lambda: reg.hosts())
+        _assert([h["name"] for h in reg.hosts()] == ["Alice"], "Probe did not fill the registry")
+        await asyncio.sleep(0.4)  # the start-up probe is over; Bob must announce himself
+        bob = await start_discovery_responder("127.0.0.1", bob_port, "Bob", 4343, True, announce_port=aport,
+                                            announce_every=5.0, announce_to=["127.0.0.1"])
+        _assert(await until(lambda: len(reg.hosts()) == 2) < 0.5, "Announcement not picked up")
+        _assert([(h["name"], h["port"]) for h in reg.hosts()] == [("Alice", 4242), ("Bob", 4343)]
+                and "event" not in reg.hosts()[1], "Registry entries wrong")
+        bob.stop()
+        _assert(await until(lambda: len(reg.hosts()) == 1) < 0.5, "'down' announcement ignored")
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+            s.sendto(json.dumps({"service": "tictactoe", "name": "Carl", "port": 1, "event": "up",
+                                 "ttl": 0.2}).encode(), ("127.0.0.1", aport))
+        await until(lambda: len(reg.hosts()) == 2)
+        _assert(await until(lambda: len(reg.hosts()) == 1) < 0.6, "Entry outlived its TTL")
+        _assert(changes == [["Alice"], ["Alice", "Bob"], ["Alice"], ["Carl", "Alice"], ["Alice"]],
+                f"Unexpected change notifications {changes}")
+    finally:
+        await reg.aclose()
+    # on its own thread, as the GUI runs it
+    reg = HostRegistry(dport, aport2, probe_timeout=0.3, addresses=["127.0.0.1"], listen_ip="127.0.0.1").start_thread()
+    try:
+        await until(lambda: reg.hosts())
+        _assert([h["name"] for h in reg.hosts()] == ["Alice"], "Threaded registry saw nothing")
+    finally:
+        reg.close()
+    # a probe that can't even open its socket leaves the registry running
+    from . import discover
+    def no_route(*args, **kwargs):
+        raise OSError("Network is unreachable")
+    real, discover.discover_iter = discover.discover_iter, no_route
+    reg = HostRegistry(dport, aport2, probe_every=0.05, addresses=["127.0.0.1"], listen_ip="127.0.0.1")
+    await reg.start()
+    try:
+        await asyncio.sleep(0.15)
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+            s.sendto(json.dumps({"service": "tictactoe", "name": "Dee", "port": 2, "event": "up",
+                                 "ttl": 0.2}).encode(), ("127.0.0.1", aport2))
+        await until(lambda: reg.hosts())
+        _assert(not reg._task.done() and await until(lambda: not reg.hosts()) < 0.6, "Failed probe stopped the registry")
+    finally:
+        discover.discover_iter = real
+        await reg.aclose()
+    alice.stop()
+
+async def _responder():
+    import asyncio, socket
+    from .server_net import DISCOVERY_MAGIC, MAX_SOURCES, start_discovery_responder
+    from .discover import discover
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        s.bind(("", 0))
+        dport = s.getsockname()[1]
+    load = {"rooms": 0, "players": 3}
+    r = await start_discovery_responder("0.0.0.0", dport, "Dana", 4444, True, load=lambda: dict(load), load_every=0.0)
+    try:
+        hosts = await discover(timeout=2.0, port=dport, quiet=0.2, multicast=True)
+        _assert([(h["name"], h["load"]["players"]) for h in hosts if h["port"] == 4444] == [("Dana", 3)],
+                f"Multicast probe not answered with load: {hosts}")
+        loop = asyncio.get_running_loop()
+        replies = asyncio.Queue()
+        class Probe(asyncio.DatagramProtocol):
+            def datagram_received(self, data, addr):
+                replies.put_nowait(data)
+        t, _ = await loop.create_datagram_endpoint(Probe, local_addr=("127.0.0.1", 0))
+        before = r.replies
+        for _ in range(5):
+            t.sendto(DISCOVERY_MAGIC, ("127.0.0.1", dport))
+        await asyncio.sleep(0.2)
+        _assert(replies.qsize() == 1 and r.replies == before + 1 and r.dropped >= 4, "Duplicate probes answered")
+        load["players"] = 7
+        r.probe_gap = 0.0  # let the next probe through
+        t.sendto(DISCOVERY_MAGIC, ("127.0.0.1", dport))
+        await asyncio.sleep(0.2)
+        replies.get_nowait()
+        _assert(b'"players": 7' in replies.get_nowait(), "Reply did not pick up the new load")
+        t.close()
+        r.probe_gap = 60.0
+        for n in range(MAX_SOURCES + 100):  # a flood from many sources stays bounded
+            r.datagram_received(DISCOVERY_MAGIC, (f"127.1.{n >> 8}.{n & 255}", 9))
+        _assert(len(r._sources) == MAX_SOURCES and "127.1.0.0" not in r._sources, "Prober table not bounded")
+    finally:
+        r.stop()
+
+async def _ready():
+    import asyncio, json, socket, sys
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        s.bind(("127.0.0.1", 0))
+        dport = s.getsockname()[1]
+    for workers in ("1", "2"):
+        proc = await asyncio.create_subprocess_exec(
+            sys.executable, "-m", f"{__package__}.server_net", "--host", "127.0.0.1", "--port", "0", "--ready",
+            "--pin", "p", "--discovery-port", str(dport), "--announce-port", "0", "--workers", workers,
+            stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL)
+        try:
+            line = await asyncio.wait_for(proc.stdout.readline(), 20)
+            ready = json.loads(line)
+            _assert(ready["ready"] and ready["port"] > 0 and ready["discovery_port"] == dport, f"Bad ready line {line}")
+            r, w = await _client(ready["port"], name="a", pin="p")
+            msg = json.loads(await asyncio.wait_for(r.readline(), 5))
+            _assert(msg.get("status") == "waiting_for_opponent", f"Server on the reported port did not answer: {msg}")
+            w.close()
+        finally:
+            proc.terminate()
+            await proc.wait()
+
+async def _embedded():
+    import asyncio, json
+    from .server_net import EmbeddedServer, dumps
+    emb = EmbeddedServer("p", host="127.0.0.1", discovery_port=None).start()
+    try:
+        _assert(emb.port > 0 and emb.loop.is_running(), "Embedded server not up")
+        on_loop = lambda coro: asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, emb.loop))
+        peer = await on_loop(emb.join_local("Host"))
+        local = lambda: on_loop(asyncio.wait_for(peer.recv(), 5))
+        _assert((await local()) == {"status": "waiting_for_opponent"}, "Local seat not queued")
+        r, w = await _client(emb.port, name="Guest", pin="p")
+        remote = lambda: asyncio.wait_for(r.readline(), 5)
+        _assert(json.loads(await remote())["status"] == "matched", "Guest not matched")
+        await remote()  # state
+        seat = await local()
+        _assert(seat["status"] == "matched" and seat["you"] == "X" and seat["opponent"] == "Guest"
+                and "token" in seat, f"Local seat got {seat}")
+        state = await local()
+        _assert(state["type"] == "state" and isinstance(state["board"], list), "Local state is not a dict")
+        _assert((await local())["type"] == "your_turn", "Local player not told to move")
+        emb.loop.call_soon_threadsafe(peer.send, {"type": "move", "idx": 1})
+        _assert(json.loads(await remote())["board"][0] == "X", "Guest did not see the local move")
+        await local()  # state
+        emb.loop.call_soon_threadsafe(peer.send, {"type": "move", "idx": 2})
+        _assert((await local()) == {"type": "error", "error": "not_your_turn"}, "Out-of-turn local move accepted")
+        await remote()  # your_turn
+        w.write(dumps({"type": "move", "idx": 5})); await w.drain()
+        _assert((await local())["board"][4] == "O", "Local seat missed the guest's move")
+        def bye():
+            peer.send({"type": "quit"})
+            peer.hang_up()
+        emb.loop.call_soon_threadsafe(bye)
+        await local()  # your_turn
+        while True:
+            msg = json.loads(await remote())
+            if msg.get("type") == "end":
+                break
+        _assert(msg["reason"] == "opponent_quit", f"Guest told {msg}")
+        _assert((await local()) is None, "Local seat not closed")
+        w.close()
+    finally:
+        emb.stop()
+    _assert(emb._thread is None, "Embedded server did not stop")
+
+async def _spectators():
+    import asyncio
+    from .server_net import TicTacToeServer, FanOut, dumps, read_json_line
+    from . import wire
+    server = TicTacToeServer("p")
+    srv = await asyncio.start_server(server.handle, "127.0.0.1", 0)
+    port = srv.sockets[0].getsockname()[1]
+    async with srv:
+        nobody = await _client(port, pin="p", role="spectator")
+        _assert((await read_json_line(nobody[0])) == {"error": "no_match"}, "Watched a missing match")
+        x = await _client(port, name="x", pin="p")
+        o = await _client(port, name="o", pin="p")
+        await _until(o[0], lambda m: m.get("type") == "your_turn" or m.get("status") == "matched")
+        early = [await _client(port, pin="p", role="spectator") for _ in range(20)]
+        binw = await _client(port, pin="p", role="spectator", wire=wire.NAME)
+        await read_json_line(binw[0])  # wire ack
+        for n, idx in enumerate((1, 4, 2)):
+            w = (x, o)[n % 2][1]
+            w.write(dumps({"type": "move", "idx": idx})); await w.drain()
+            await _until((x, o)[n % 2][0], lambda m: m.get("type") == "state" and m["board"][idx - 1] != " ")
+        late = await _client(port, pin="p", role="spectator")
+        m = await _until(late[0], lambda m: m.get("type") == "state")
+        _assert(m["board"][:4] == ["X", "X", " ", "O"], "Late joiner got no snapshot")
+        for idx, w in ((5, o[1]), (3, x[1])):
+            w.write(dumps({"type": "move", "idx": idx})); await w.drain()
+        final = await _until(x[0], lambda m: m.get("type") == "state" and m["terminal"])
+        for r, _ in early + [late]:
+            _assert((await _until(r, lambda m: m.get("type") == "state" and m["terminal"])) == final,
+                    "Spectator saw a different final state")
+            _assert((await read_json_line(r)) == {"type": "end", "reason": "winner"}, "Spectator missed the end")
+        codec, seen = wire.Codec(), []
+        while (p := await wire.read_frame(binw[0])) is not None:
+            seen.append(codec.decode(p))
+        _assert(seen[0]["status"] == "watching" and seen[-2] == final, "Binary spectator mismatch")
+        for _, w in early + [late, binw, nobody, x, o]:
+            w.close()
+    # A watcher with a full buffer skips updates, then gets a full state
+    fan = FanOut(max_buffer=1000)
+    fast, slow = _FakeWriter(), _FakeWriter()
+    fan.publish({"type": "state", "board": [" "] * 9, "turn": "X", "terminal": False, "winner": None,
+                 "width": 3, "height": 3, "k": 3})
+    fan.add(fast, True, {"status": "watching"}); fan.add(slow, True, {"status": "watching"})
+    slow.get_write_buffer_size = lambda: 5000
+    board = [" "] * 9
+    for i, mark in enumerate("XOX"):
+        board[i] = mark
+        fan.publish({"type": "state", "board": list(board), "turn": "XO"[i % 2 == 0], "terminal": False,
+                     "winner": None, "width": 3, "height": 3, "k": 3})
+        await fan._task
+    _assert(len(slow.chunks) == 2 and all(c[2] == wire.T_DELTA for c in fast.chunks[3:]), "Skip/delta mismatch")
+    slow.get_write_buffer_size = lambda: 0
+    board[3] = "O"
+    fan.publish({"type": "state", "board": list(board), "turn": "X", "terminal": False,
+                 "winner": None, "width": 3, "height": 3, "k": 3})
+    await fan._task
+    _assert(slow.chunks[-1][2] == wire.T_STATE and fast.chunks[-1][2] == wire.T_DELTA, "Slow watcher not resynced")
+
+async def _cluster():
+    import asyncio, json, socket, threading
+    from .cluster import MAX_PACKET, Broker, ClusterServer
+    from .server_net import dumps, join_local
+    pairs = [socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET) for _ in range(2)]
+    broker = Broker("p", [a for a, _ in pairs])
+    t = threading.Thread(target=broker.serve_forever, daemon=True)
+    t.start()
+    workers, srvs, ports = [], [], []
+    for i, (_, b) in enumerate(pairs):
+        w = ClusterServer(i, b, "p", workers=2)
+        w.attach()
+        srv = await asyncio.start_server(w.handle, "127.0.0.1", 0)
+        workers.append(w); srvs.append(srv); ports.append(srv.sockets[0].getsockname()[1])
+    try:
+        # junk on a broker link, and a hello that would overflow a packet
+        pairs[0][1].send(b"x" * (MAX_PACKET + 10))
+        pairs[0][1].send(b"{")
+        big = await asyncio.open_connection("127.0.0.1", ports[0])
+        big[1].write(json.dumps({"type": "hello", "name": "z", "pin": "é" * 10000, "room": "é" * 10000},
+                                ensure_ascii=False).encode() + b"\n")
+        _assert((await _until(big[0], lambda m: True)) == {"status": "waiting_for_opponent"},
+                "Oversized hello not cut down")
+        big[1].close()
+        _assert(t.is_alive(), "Broker died on a bad message")
+        a = await _client(ports[0], name="a", pin="1", room="r")
+        await _until(a[0], lambda m: m.get("status") == "waiting_for_opponent")
+        wrong = await _client(ports[1], name="w", pin="2", room="r")
+        _assert((await _until(wrong[0], lambda m: True)) == {"error": "auth_failed"}, "Broker room PIN not enforced")
+        b = await _client(ports[1], name="b", pin="1", room="r")
+        m = await _until(b[0], lambda m: m.get("status") == "matched")
+        token = m.pop("token")
+        _assert(m == {"status": "matched", "you": "O", "opponent": "a"}, "Cross-worker pairing failed")
+        _assert(len(workers[0].sessions) == 1 and not workers[1].sessions, "Session not on the waiter's worker")
+        _assert(token.startswith("0."), "Resume token doesn't name the session's worker")
+        mid = next(iter(workers[0].sessions)).id
+        _assert(mid % 2 == 0, "Match id doesn't name the session's worker")
+        watch = await _client(ports[1], role="spectator", room="r", pin="1", match=mid)
+        _assert((await _until(watch[0], lambda m: True)) == {"status": "watching", "match": mid, "x": "a", "o": "b"},
+                "Spectator not sent to the match's worker")
+        blind = await _client(ports[1], role="spectator", room="r", pin="1")
+        _assert((await _until(blind[0], lambda m: True)) == {"error": "no_match"}, "Per-worker spectating changed")
+        dead = await _client(ports[0], token="5.gone")
+        _assert((await _until(dead[0], lambda m: True)) == {"error": "bad_token"}, "Handoff to a dead worker not refused")
+        for n, idx in enumerate((1, 4, 2, 5, 3)):
+            if n == 2:
+                # O drops and comes back through the other worker
+                b[1].transport.abort()
+                await _until(a[0], lambda m: m.get("type") == "opponent_away")
+                b = await _client(ports[1], token=token)
+                _assert((await _until(b[0], lambda m: True))["status"] == "resumed", "Cross-worker resume failed")
+            r, w = (a, b)[n % 2]
+            w.write(dumps({"type": "move", "idx": idx})); await w.drain()
+            await _until(r, lambda m: m.get("type") == "state" and m["board"][idx - 1] != " ")
+        _assert((await _until(b[0], lambda m: m.get("type") == "end")) == {"type": "end", "reason": "winner"},
+                "Handed-off player missed the end")
+        await asyncio.sleep(0.1)
+        _assert("r" not in broker.rooms, "Broker kept a finished room")
+        # an in-process host seat can't be handed off: it waits on its own
+        # worker even with a player queued on another
+        q = await _client(ports[0], name="q", pin="p")
+        await _until(q[0], lambda m: m.get("status") == "waiting_for_opponent")
+        host = await join_local(workers[1], "p", "Host")
+        _assert((await asyncio.wait_for(host.recv(), 5)) == {"status": "waiting_for_opponent"}, "Host seat moved")
+        c = await _client(ports[1], name="c", pin="p")
+        _assert((await _until(c[0], lambda m: m.get("status") == "matched"))["opponent"] == "q", "FIFO broken")
+        d = await _client(ports[0], name="d", pin="p")
+        _assert((await _until(d[0], lambda m: m.get("status") == "matched"))["opponent"] == "Host",
+                "Host seat not paired across workers")
+        host.hang_up()
+        for _, w in (a, b, wrong, watch, blind, dead, q, c, d):
+            w.close()
+    finally:
+        broker.stop()
+        t.join()
+        for srv in srvs:
+            srv.close()
+        for a_, b_ in pairs:
+            a_.close(); b_.close()
+
 if __name__ == "__main__":
     run()
@@ -0,0 +1,182 @@
+# tictactoe/wire.py
+"""
+Compact binary framing for server_net/client_net, negotiated in the hello.
+
+A client asks for it with `"wire": "bin1"` in its JSON hello. If the server
+accepts, it answers with one JSON line `{"type": "wire", "wire": "bin1"}` and
+both directions switch to frames. Old servers ignore the field and keep
+talking JSON; old clients never ask, so JSON stays the default.
+
+Frame: u16 big-endian payload length, then the payload; payload[0] is the
+message type. Boards travel as two little-endian bitmasks, moves and cells
+as one byte (two on boards over 256 cells). After the first full `state`, a
+state that adds a single mark is sent as a delta (flags + cell). Anything
+without a compact form goes as a JSON frame, so every message still fits.
+
+`Codec` turns message dicts into frames and back; decoded messages are the
+same dicts the JSON protocol carries, so callers don't care which is in use.
+"""
+from __future__ import annotations
+import asyncio
+import json
+import struct
+from typing import Dict, List, Optional
+
+NAME = "bin1"
+
+T_MOVE, T_QUIT = 0x01, 0x02
+T_STATE, T_DELTA = 0x10, 0x11
+T_YOUR_TURN, T_END, T_ERROR = 0x20, 0x21, 0x22
+T_WAITING, T_MATCHED = 0x30, 0x31
+T_JSON = 0x7F
+
+REASONS = ("winner", "draw", "opponent_quit", "disconnect")
+ERRORS = ("not_your_turn", "invalid_move", "bad_json", "bad_frame")
+_REASON_CODE = {r: i for i, r in enumerate(REASONS)}
+_ERROR_CODE = {e: i for i, e in enumerate(ERRORS)}
+_STATE_KEYS = frozenset(("type", "board", "turn", "terminal", "winner", "width", "height", "k"))
+_WINNER = (None, "X", "O")
+_HEAD = struct.Struct("!H")
+
+def frame(payload: bytes) -> bytes:
+    return _HEAD.pack(len(payload)) + payload
+
+async def read_frame(reader: asyncio.StreamReader) -> Optional[bytes]:
+    """Next payload, or None at EOF."""
+    try:
+        head = await reader.readexactly(2)
+        return await reader.readexactly(_HEAD.unpack(head)[0])
+    except asyncio.IncompleteReadError:
+        return None
+
+def _json_frame(msg: Dict) -> bytes:
+    return frame(bytes((T_JSON,)) + json.dumps(msg, separators=(",", ":")).encode("utf-8"))
+
+def _masks(board: List[str]):
+    x = o = 0
+    for i, c in enumerate(board):
+        if c == "X":
+            x |= 1 << i
+        elif c == "O":
+            o |= 1 << i
+    return x, o
+
+def _cell_bytes(i: int, cells: int) -> bytes:
+    return i.to_bytes(1 if cells <= 256 else 2, "big")
+
+class Codec:
+    """One per connection: remembers the last board each way for deltas."""
+    __slots__ = ("_sent", "_board", "_dims")
+
+    def __init__(self):
+        self._sent = None    # (dims, x, o) of the last state encoded
+        self._board = None   # last decoded board, to apply deltas to
+        self._dims = None
+
+    def resync(self) -> None:
+        """Send the next state in full (e.g. after frames were dropped)."""
+        self._sent = None
+
+    # ---- encode ----
+    def encode(self, msg: Dict) -> bytes:
+        t = msg.get("type")
+        if t == "move" and len(msg) == 2:
+            idx = int(msg.get("idx", 0))
+            if 0 <= idx < 1 << 16:
+                return frame(bytes((T_MOVE,)) + idx.to_bytes(1 if idx < 256 else 2, "big"))
+        elif t == "quit" and len(msg) == 1:
+            return frame(bytes((T_QUIT,)))
+        elif t == "state" and msg.keys() == _STATE_KEYS and msg["winner"] in _WINNER:
+            return self._encode_state(msg)
+        elif t == "your_turn" and len(msg) == 1:
+            return frame(bytes((T_YOUR_TURN,)))
+        elif t == "end" and len(msg) == 2 and msg.get("reason") in _REASON_CODE:
+            return frame(bytes((T_END, _REASON_CODE[msg["reason"]])))
+        elif t == "error" and len(msg) == 2 and msg.get("error") in _ERROR_CODE:
+            return frame(bytes((T_ERROR, _ERROR_CODE[msg["error"]])))
+        elif t is None and msg.get("status") == "waiting_for_opponent" and len(msg) == 1:
+            return frame(bytes((T_WAITING,)))
+        elif (t is None and msg.get("status") == "matched" and len(msg) == 3
+              and msg.get("you") in ("X", "O") and isinstance(msg.get("opponent"), str)):
+            return frame(bytes((T_MATCHED, msg["you"] == "O")) + msg["opponent"].encode("utf-8"))
+        return _json_frame(msg)
+
+    def _encode_state(self, msg: Dict) -> bytes:
+        dims = (msg["width"], msg["height"], msg["k"])
+        board = msg["board"]
+        cells = dims[0] * dims[1]
+        if len(board) != cells or max(dims) > 255:
+            return _json_frame(msg)
+        x, o = _masks(board)
+        flags = (msg["turn"] == "O") | msg["terminal"] << 1 | _WINNER.index(msg["winner"]) << 2
+        prev, self._sent = self._sent, (dims, x, o)
+        if prev is not None and prev[0] == dims and not (prev[1] & ~x or prev[2] & ~o):
+            dx, do = x ^ prev[1], o ^ prev[2]
+            added = dx | do
+            if added and not added & (added - 1):  # exactly one new mark
+                i = added.bit_length() - 1
+                return frame(bytes((T_DELTA, flags | bool(do) << 4)) + _cell_bytes(i, cells))
+        nb = (cells + 7) // 8
+        return frame(bytes((T_STATE, *dims, flags)) + x.to_bytes(nb, "little") + o.to_bytes(nb, "little"))
+
+    # ---- decode ----
+    def decode(self, payload: bytes) -> Dict:
+        """Message dict for one payload; ValueError if it is malformed."""
+        if not payload:
+            raise ValueError("empty frame")
+        t = payload[0]
+        if t == T_MOVE and len(payload) in (2, 3):
+            return {"type": "move", "idx": int.from_bytes(payload[1:], "big")}
+        if t == T_QUIT:
+            return {"type": "quit"}
+        if t == T_STATE and len(payload) >= 5:
+            return self._decode_state(payload)
+        if t == T_DELTA and len(payload) in (3, 4):
+            return self._decode_delta(payload)
+        if t == T_YOUR_TURN:
+            return {"type": "your_turn"}
+        if t == T_END and len(payload) == 2 and payload[1] < len(REASONS):
+            return {"type": "end", "reason": REASONS[payload[1]]}
+        if t == T_ERROR and len(payload) == 2 and payload[1] < len(ERRORS):
+            return {"type": "error", "error": ERRORS[payload[1]]}
+        if t == T_WAITING:
+            return {"status": "waiting_for_opponent"}
+        if t == T_MATCHED and len(payload) >= 2:
+            return {"status": "matched", "you": "XO"[payload[1] & 1],
+                    "opponent": payload[2:].decode("utf-8", "replace")}
+        if t == T_JSON:
+            try:
+                return json.loads(payload[1:].decode("utf-8"))
+            except (UnicodeDecodeError, json.JSONDecodeError):
+                raise ValueError("bad JSON frame")
+        raise ValueError(f"bad frame type {t:#x}")
+
+    def _state_msg(self, flags: int) -> Dict:
+        w, h, k = self._dims
+        if flags >> 2 & 3 > 2:
+            raise ValueError("bad winner")
+        return {"type": "state", "board": list(self._board), "turn": "XO"[flags & 1],
+                "terminal": bool(flags & 2), "winner": _WINNER[flags >> 2 & 3],
+                "width": w, "height": h, "k": k}
+
+    def _decode_state(self, payload: bytes) -> Dict:
+        w, h, k, flags = payload[1:5]
+        cells = w * h
+        nb = (cells + 7) // 8
+        if len(payload) != 5 + 2 * nb:
+            raise ValueError("bad state length")
+        x = int.from_bytes(payload[5:5 + nb], "little")
+        o = int.from_bytes(payload[5 + nb:], "little")
+        self._dims = (w, h, k)
+        self._board = ["X" if x >> i & 1 else "O" if o >> i & 1 else " " for i in range(cells)]
+        return self._state_msg(flags)
+
+    def _decode_delta(self, payload: bytes) -> Dict:
+        if self._board is None:
+            raise ValueError("delta before full state")
+        i = int.from_bytes(payload[2:], "big")
+        if i >= len(self._board):
+            raise ValueError("delta cell out of range")
+        flags = payload[1]
+        self._board[i] = "O" if flags & 0x10 else "X"
+        return self._state_msg(flags)